@@ -0,0 +1,144 @@
+"""
+Offline benchmarks of the braindump engine. The model is replaced by a fake completion client (optionally with
+a simulated latency) and the database by synthetic facts, so that no API credits are spent and results are
+comparable across commits.
+
+Usage (from the root of the project):
+
+    python benchmarks/gpt-3.5-turbo/bench_engine.py --sizes 1000 100000 1000000 --output bench.json
+    python benchmarks/gpt-3.5-turbo/bench_engine.py --compare before.json after.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../src/gpt-3.5-turbo'))
+import pandas as pd
+from engine import BraindumpEngine
+from fakes import FakeCompletionClient
+from storage import open_fact_store
+from synthetic import CATEGORIES, generate_facts, generate_utterances
+
+def measure(fn, repeat, setup=None):
+    """
+    Runs `fn` `repeat` times (after `setup`, which is not timed) and returns timing statistics in seconds.
+    """
+    timings = []
+    for i in range(repeat):
+        if setup is not None:
+            setup(i)
+        start = time.perf_counter()
+        fn(i)
+        timings.append(time.perf_counter() - start)
+
+    return {"min": min(timings), "median": statistics.median(timings), "mean": statistics.mean(timings), "repeat": repeat}
+
+def create_database(directory, size, seed=0, database_format="csv"):
+    database_file_path = os.path.join(directory, f"database.{database_format}")
+    open_fact_store(database_file_path).save(generate_facts(size, seed=seed))
+    return database_file_path
+
+def create_engine(directory, database_file_path, latency_seconds=0.0, seed=0):
+    return BraindumpEngine(database_file_path=database_file_path,
+                           categories_file_path=os.path.join(directory, "categories.csv"),
+                           default_categories=CATEGORIES,
+                           gpt_client=FakeCompletionClient(latency_seconds=latency_seconds, seed=seed))
+
+def run_benchmarks(size, repeat, latency_seconds=0.0, database_format="csv", excel_max_size=100000):
+    """
+    Runs all the benchmarks against a database with `size` synthetic facts.
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        database_file_path = create_database(directory, size, database_format=database_format)
+        start = time.perf_counter()
+        engine = create_engine(directory, database_file_path, latency_seconds)
+        results["load"] = {"min": time.perf_counter() - start, "repeat": 1}
+
+        utterances = generate_utterances(repeat)
+        results["extract_facts"] = measure(lambda i: engine.extract_facts(utterances[i]), repeat)
+        engine.rule_extraction = True
+        rule_utterances = [f"{person} email = {person}@example.com" for person in ["sales guy", "hr", "boss"]] + ["Buy: milk, coffee and eggs"]
+        results["extract_facts_rules"] = measure(lambda i: engine.extract_facts(rule_utterances[i % len(rule_utterances)]), repeat)
+        engine.rule_extraction = False
+        results["commit"] = measure(lambda i: engine.commit(), repeat,
+                                    setup=lambda i: engine.extract_facts(utterances[i]))
+        results["query_first_page"] = measure(lambda i: engine.query_cursor("buy coffee for jen").page(0), repeat)
+        results["query"] = measure(lambda i: engine.query("buy coffee for jen"), repeat)
+        results["database_filtered_by"] = measure(lambda i: engine._database_filtered_by(categories=["Work", "Health"],
+                                                                                          entry_types=["List"]), repeat)
+        results["search_dataframe"] = measure(lambda i: engine._search_dataframe(engine.database, ["coffee", "jen"],
+                                                                                 ["coffees", "java", "espresso", "jennifer"]), repeat)
+        results["fuzzy_search"] = measure(lambda i: engine._fuzzy_positions(["pedatrician", "coffe"]), repeat)
+
+        df_results = engine.query("buy coffee for jen")
+        results["export_csv"] = measure(lambda i: engine.export_data_to_binary(df_results, file_type="csv"), repeat)
+        if size <= excel_max_size:
+            results["export_excel"] = measure(lambda i: engine.export_data_to_binary(df_results, file_type="excel"), repeat)
+
+        cursor_results = engine.query_cursor("buy coffee for jen")
+        for file_type in ["csv", "parquet"]:
+            results[f"export_stream_{file_type}"] = measure(lambda i: sum(len(block) for block in engine.export_data_stream(cursor_results, file_type)), repeat)
+
+        # last, as queries then find the synonyms of their terms in the table
+        start = time.perf_counter()
+        engine.precompute_synonyms(calls_per_minute=0)
+        results["precompute_synonyms"] = {"min": time.perf_counter() - start, "repeat": 1}
+        results["query_precomputed"] = measure(lambda i: engine.query("buy coffee for jen"), repeat)
+        engine.index_expansion = True
+        results["commit_expanded"] = measure(lambda i: engine.commit(), repeat,
+                                             setup=lambda i: engine.extract_facts(utterances[i]))
+        results["query_expanded"] = measure(lambda i: engine.query("buy coffee for jen"), repeat)
+
+    return results
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {"commit": commit, "python": platform.python_version(), "pandas": pd.__version__, "machine": platform.machine()}
+
+def print_results(report):
+    print(f"Commit {report['environment']['commit']}, Python {report['environment']['python']}, pandas {report['environment']['pandas']}")
+    for size, results in report["results"].items():
+        print(f"\n{size} facts")
+        for name, timing in results.items():
+            print(f"  {name:<22}{timing['min'] * 1000:>12.2f} ms (min)")
+
+def compare(before, after):
+    print(f"Comparing {before['environment']['commit']} (before) with {after['environment']['commit']} (after)")
+    for size, results in after["results"].items():
+        print(f"\n{size} facts")
+        for name, timing in results.items():
+            if name in before["results"].get(size, {}):
+                previous = before["results"][size][name]["min"]
+                print(f"  {name:<22}{previous * 1000:>12.2f} ms -> {timing['min'] * 1000:>10.2f} ms ({previous / timing['min']:.2f}x)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Offline benchmarks of the braindump engine.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated latency of each model call, in seconds.")
+    parser.add_argument("--format", default="csv", choices=["csv", "arrow", "parquet", "parts"], help="Storage format of the database.")
+    parser.add_argument("--output", help="JSON file where to save the results, to compare them later.")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="Compares two saved results.")
+    args = parser.parse_args()
+
+    if args.compare is not None:
+        with open(args.compare[0]) as before, open(args.compare[1]) as after:
+            compare(json.load(before), json.load(after))
+    else:
+        report = {"environment": dict(environment(), format=args.format),
+                  "results": {str(size): run_benchmarks(size, args.repeat, args.latency, args.format) for size in args.sizes}}
+        print_results(report)
+        if args.output is not None:
+            with open(args.output, "w") as f:
+                json.dump(report, f, indent=2)
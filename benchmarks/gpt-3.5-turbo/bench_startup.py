@@ -0,0 +1,71 @@
+"""
+Startup benchmark: how long a fresh process takes to import the engine, create it and serve a first page of
+results, against a time budget. Each measure runs in a new Python process, so that nothing is already imported
+or cached. The exit code is 1 if the budget is exceeded, so that it can be used as a check.
+
+Usage (from the root of the project):
+
+    python benchmarks/gpt-3.5-turbo/bench_startup.py --size 100000 --format arrow --budget-ms 500
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+SOURCES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../src/gpt-3.5-turbo')
+BENCHMARKS_PATH = os.path.dirname(os.path.abspath(__file__))
+
+# Runs in the fresh process: prints the time of each startup stage, in seconds
+STARTUP_SCRIPT = """
+import json, os, sys, time
+start = time.perf_counter()
+sys.path.append({sources_path!r})
+from engine import BraindumpEngine
+imported = time.perf_counter()
+engine = BraindumpEngine(api_key="not-used", database_file_path={database_file_path!r},
+                         categories_file_path=os.path.join({directory!r}, "categories.csv"))
+created = time.perf_counter()
+results = engine.query_cursor("")
+first_page = results.page(0)
+served = time.perf_counter()
+print(json.dumps({{"import": imported - start, "create": created - imported, "first_page": served - created,
+                  "total": served - start, "openai_imported": "openai" in sys.modules}}))
+"""
+
+def measure_startup(database_file_path, directory, repeat):
+    script = STARTUP_SCRIPT.format(sources_path=SOURCES_PATH, database_file_path=database_file_path, directory=directory)
+    runs = [json.loads(subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True).stdout)
+            for _ in range(repeat)]
+    return {stage: statistics.median(run[stage] for run in runs) for stage in ["import", "create", "first_page", "total"]}, \
+           any(run["openai_imported"] for run in runs)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Startup benchmark of the braindump engine.")
+    parser.add_argument("--size", type=int, default=100000, help="Number of facts in the database.")
+    parser.add_argument("--format", default="arrow", choices=["csv", "arrow", "parquet"], help="Storage format of the database.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=750.0, help="Maximum median time to serve the first page, in milliseconds.")
+    args = parser.parse_args()
+
+    sys.path.append(SOURCES_PATH)
+    sys.path.append(BENCHMARKS_PATH)
+    from bench_engine import create_database
+
+    with tempfile.TemporaryDirectory() as directory:
+        database_file_path = create_database(directory, args.size, database_format=args.format)
+        timings, openai_imported = measure_startup(database_file_path, directory, args.repeat)
+
+    print(f"Startup with {args.size} facts ({args.format}), median of {args.repeat} fresh processes:")
+    for stage, seconds in timings.items():
+        print(f"  {stage:<12}{seconds * 1000:>10.1f} ms")
+    if openai_imported:
+        print("  (the OpenAI library was imported, although no model was called)")
+
+    if timings["total"] * 1000 > args.budget_ms:
+        print(f"Over budget: {timings['total'] * 1000:.1f} ms > {args.budget_ms:.1f} ms.")
+        sys.exit(1)
+    print(f"Within budget ({args.budget_ms:.1f} ms).")
@@ -0,0 +1,45 @@
+"""
+Generation of synthetic fact databases, so that the engine can be benchmarked at any scale.
+"""
+import numpy as np
+import pandas as pd
+
+CATEGORIES = ["Family", "Work", "Friends", "Shopping", "Health", "Finance", "Travel", "Home", "Pets", "Hobbies", "Other"]
+TYPES = ["List", "Email", "Phone", "Address", "Document", "Pendency", "Price", "Reminder", "Note", "Doubt", "Wish", "Other"]
+PEOPLE = ["", "", "", "mom", "dad", "jen", "sales guy", "pediatrician", "hr", "building administration", "Domingos",
+          "customer", "school visitors", "company", "maid"]
+KEY_WORDS = ["phone", "email", "address", "to do", "buy", "idea", "plane tickets", "baby cream", "diapers", "coffee",
+             "vin number", "employee number", "ultrasound", "lab work", "stock", "kids", "free time", "price", "rent", "gift"]
+VALUE_WORDS = ["buy", "schedule", "call", "555-555-5555", "jp@example.com", "at 250", "clean up", "travel", "milk",
+               "eggs", "bread", "aspirin", "electric cars", "AI", "new way", "when to start", "purchase", "Vitorio", "check", "pay"]
+
+def generate_facts(n, seed=0):
+    """
+    Generates a database with `n` facts. Keys and values combine common words with a numeric suffix, so that
+    the vocabulary grows with the database size, like in a real one.
+    """
+    rng = np.random.default_rng(seed)
+    suffixes = rng.integers(0, max(10, n // 10), size=n).astype(str)
+
+    return pd.DataFrame({
+        "Category": np.array(CATEGORIES, dtype=object)[rng.integers(0, len(CATEGORIES), size=n)],
+        "Type": np.array(TYPES, dtype=object)[rng.integers(0, len(TYPES), size=n)],
+        "People": np.array(PEOPLE, dtype=object)[rng.integers(0, len(PEOPLE), size=n)],
+        "Key": np.char.add(np.array(KEY_WORDS)[rng.integers(0, len(KEY_WORDS), size=n)], np.char.add(" ", suffixes)).astype(object),
+        "Value": np.array(VALUE_WORDS, dtype=object)[rng.integers(0, len(VALUE_WORDS), size=n)],
+    })
+
+def generate_utterances(n, seed=0):
+    """
+    Generates `n` facts utterances, in the shapes users usually type them.
+    """
+    rng = np.random.default_rng(seed)
+    utterances = []
+    for i in range(n):
+        key = KEY_WORDS[rng.integers(0, len(KEY_WORDS))]
+        values = [VALUE_WORDS[j] for j in rng.integers(0, len(VALUE_WORDS), size=rng.integers(1, 4))]
+        if i % 2 == 0:
+            utterances.append(f"{key}: {', '.join(values)}")
+        else:
+            utterances.append(f"{key} = {values[0]}")
+    return utterances
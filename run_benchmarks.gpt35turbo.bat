@@ -0,0 +1,2 @@
+python benchmarks\gpt-3.5-turbo\bench_engine.py %*
+python benchmarks\gpt-3.5-turbo\bench_startup.py
\ No newline at end of file
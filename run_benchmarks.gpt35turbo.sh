@@ -0,0 +1,4 @@
+#!/usr/bin/env bash
+
+python benchmarks/gpt-3.5-turbo/bench_engine.py "$@"
+python benchmarks/gpt-3.5-turbo/bench_startup.py
\ No newline at end of file
@@ -1,9 +1,11 @@
 import streamlit as st
-import openai
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 
 import sys
 sys.path.append('.')
-from engine import BraindumpEngine
+from engine import BraindumpEngine, BraindumpPreprocessor
+from export import EXPORT_FORMATS
+from dedupe import DEDUPE_POLICIES
 
 
 def app():
@@ -25,6 +27,10 @@ def app():
         return BraindumpEngine(default_categories=default_categories)
     engine = create_engine()   
 
+    # account the model usage of this browser session separately from the others
+    script_run_context = get_script_run_ctx()
+    engine.usage.set_session(script_run_context.session_id if script_run_context is not None else "default")
+
     
     st.title("Braindump")
     st.write("A simple app to dump your facts, reminders, purchases needs, prices, notes, etc., into a database and query them later.")
@@ -43,6 +49,22 @@ def app():
 
     engine.gpt_parameters["engine"] = st.sidebar.text_input("GPT Engine", "gpt-3.5-turbo")
     engine.gpt_parameters["temperature"] = st.sidebar.slider("GPT Temperature", value=0.1, min_value=0.0, max_value=1.0, step=0.1)
+    search_models = [model.strip() for model in st.sidebar.text_input("GPT Engines for searches", "",
+                                                                        help="Comma-separated. The one with the lowest observed latency is used for the prompts of searches; empty to use the GPT Engine.").split(",")
+                     if len(model.strip()) > 0]
+    engine.model_routes = {kind: {"candidates": search_models} for kind in ["terms_extraction_prompt", "terms_augmentation_prompt"]}
+    engine.extraction_mode = st.sidebar.selectbox("Extraction output format", engine.EXTRACTION_MODES,
+                                                  help='"json" requires a model that supports JSON mode.')
+    engine.extraction_prompt_variant = st.sidebar.selectbox("Extraction prompt", BraindumpPreprocessor.EXTRACTION_PROMPT_VARIANTS,
+                                                            help='Shorter prompts are cheaper and faster, but may be less accurate.')
+    engine.dedupe_policy = st.sidebar.selectbox("Duplicate facts", DEDUPE_POLICIES,
+                                                help='"skip" does not add facts already known, "merge" replaces them with more detailed ones, "keep" adds all facts.')
+    engine.rule_extraction = st.sidebar.checkbox("Extract simple facts locally", value=True,
+                                                 help='Emails, phone numbers, prices, URLs, "key = value" notes and "key: a, b" lists are extracted without calling the model, when the rules are confident enough.')
+    engine.synonym_precomputation = st.sidebar.checkbox("Precompute synonyms after adding facts", value=True,
+                                                        help='The synonyms of new words are asked to the model in the background, in batches, so that searches do not need to.')
+    engine.index_expansion = st.sidebar.checkbox("Expand facts with synonyms when adding them", value=False,
+                                                 help='Adding facts takes longer, but searches do not ask the model for synonyms at all.')
     
 
     selected_categories = st.sidebar.multiselect('Possible categories to consider when adding facts', 
@@ -51,6 +73,10 @@ def app():
     engine.update_categories(selected_categories)
     engine.set_openai_api_key(token)
 
+    with st.sidebar.expander("Model usage"):
+        st.write(engine.usage.snapshot()["sessions"].get(engine.usage.current_session(), {}))
+        st.write({"local_extractions": engine.rule_extraction_statistics(), "precomputed_synonyms": engine.synonym_statistics()})
+
 
     # We have different tabs for searching and for data insertion
     tab1, tab2 = st.tabs(["Search facts", "Add facts"])
@@ -80,45 +106,36 @@ def app():
 
         
         
-        df_results = engine.query(query, 
-                                  categories=categories_filter, entry_types=entry_types_filter, people=people_filter)
+        # the result is kept by the engine under an id, so that reruns (e.g., to download it) do not query the model again
+        st.session_state['result_id'] = engine.query_snapshot(query, 
+                                                              categories=categories_filter, entry_types=entry_types_filter, people=people_filter)
+        results = engine.result(st.session_state['result_id'])
         st.subheader("Results")
-        st.dataframe(df_results, use_container_width=True)
+        # only the facts in the current page are read from the database
+        page_size = 100
+        page_number = st.number_input(f"Page (of {results.page_count(page_size)}, {results.total_count()} facts in total)", 
+                                      min_value=1, max_value=results.page_count(page_size), value=1)
+        st.dataframe(results.page(page_number - 1, page_size), use_container_width=True)
 
         #
         # Results can be downloaded too. This could be useful for passing whatever data was acquired for other to process outside the tool.
         #
-        st.caption("You can download this view of the data as a CSV, TSV or Excel file.")
+        st.caption("You can download this view of the data as a CSV, TSV, Excel, compressed CSV, JSON Lines or Parquet file.")
 
-        download_col1, download_col2, download_col3 = st.columns(3)
+        download_col1, download_col2 = st.columns(2)
         with download_col1:
-            generate_excel_download = st.button("Generate downloadable Excel")
+            file_type = st.selectbox("File type", list(EXPORT_FORMATS.keys()), 
+                                     format_func=lambda file_type: EXPORT_FORMATS[file_type][0])
         with download_col2:
-            generate_csv_download = st.button("Generate downloadable CSV")
-        with download_col3:
-            generate_tsv_download = st.button("Generate downloadable TSV")
-        #st.text("Warning: files larger than 50MB will cause download problems in Streamlit.")
+            generate_download = st.button("Generate downloadable file")
         
-        def export_selected_data(file_type):
-            return engine.export_data_to_binary(df_results, file_type=file_type)
-
-        if generate_csv_download:
-            st.download_button("Download this beautiful data!", 
-                                        data=export_selected_data(file_type="csv"),
-                                        file_name="out.csv",
-                                        mime='text/csv')
-        if generate_tsv_download:
+        if generate_download:
+            extension, mime = EXPORT_FORMATS[file_type]
+            # each file type is exported only once per result, then served from the engine's cache
             st.download_button("Download this beautiful data!", 
-                                        data=export_selected_data(file_type="tsv"),
-                                        file_name="out.tsv",
-                                        mime='text/tsv')
-
-        if generate_excel_download:
-            st.download_button("Download this beautiful data!", 
-                                        data=export_selected_data(file_type="excel"),
-                                        file_name="out.xlsx",
-                                        mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-            # MIME type from: https://docs.microsoft.com/en-us/archive/blogs/vsofficedeveloper/office-2007-file-format-mime-types-for-http-content-streaming-2
+                                        data=engine.export_result(st.session_state['result_id'], file_type=file_type),
+                                        file_name=f"out.{extension}",
+                                        mime=mime)
 
     #########################
     # Insert facts tab
@@ -134,41 +151,52 @@ def app():
         # placeholder for where the manual check pane will be
         manual_check_pane = st.empty() 
         
-        # auxiliary function to commit extraction, will be used more than once below
-        def aux_commit_extraction():
-            st.session_state['latest_insertions'] = engine.extracted_facts()
-            engine.commit()
+        # auxiliary function to commit extractions, will be used more than once below
+        def aux_commit_extraction(job_id):
+            committed_facts = engine.facts_as_dicts(engine.commit_extraction(job_id))
+            st.session_state['latest_insertions'] = (st.session_state['latest_insertions'] or []) + committed_facts
 
         #
-        # EXTRACT: If we don't have extracted facts yet, let's try to do that.
+        # EXTRACT: Extractions run in the background, so that several notes can be dumped in a row without waiting.
         #
-        if not engine.has_extracted_facts():
-            if add_facts:
-                engine.extract_facts(new_facts_utterance)
+        user = engine.usage.current_session()
+        if add_facts and len(new_facts_utterance) > 0:
+            engine.submit_extraction(new_facts_utterance, user=user)
 
         #
-        # COMMIT: If now we have the extracted facts, prepare to commit or commit them directly.
+        # COMMIT: Finished extractions wait in the staging area of the user, to be checked and committed, or committed directly.
         #
-        if engine.has_extracted_facts():
-
-            # does the user wants to manually check the extracted facts?
-            if manual_check:
-                
-                with manual_check_pane.container():
-                    accept = st.button("Accept fact extraction")
-                    cancel = st.button("Cancel fact extraction")
-                    st.write("Extracted facts:")
-                    st.write(engine.extracted_facts())
-
-                    if accept:
-                        aux_commit_extraction()
-                        
-                    elif cancel:
-                        engine.cancel()
-                        st.session_state['insertion_cancelled'] = True
-
-            else: # no manual check needed, let's just commit
-                aux_commit_extraction()
+        staged_jobs = engine.staged_extractions(user=user)
+        if any(not job.is_finished() for job in staged_jobs):
+            st.info(f"{sum(not job.is_finished() for job in staged_jobs)} extractions in progress.")
+            st.button("Refresh")
+
+        with manual_check_pane.container():
+            for job in staged_jobs:
+                if job.status == "failed":
+                    st.error(f'Could not extract facts from "{job.utterance}": {job.error}')
+                    if st.button("Dismiss", key=f"dismiss_{job.job_id}"):
+                        engine.cancel_extraction(job.job_id)
+
+                elif job.status == "done":
+                    # does the user wants to manually check the extracted facts?
+                    if manual_check:
+                        st.write(f'Extracted facts from "{job.utterance}":')
+                        st.write(engine.facts_as_dicts(job.facts))
+                        accept_col, cancel_col = st.columns(2)
+                        with accept_col:
+                            accept = st.button("Accept fact extraction", key=f"accept_{job.job_id}")
+                        with cancel_col:
+                            cancel = st.button("Cancel fact extraction", key=f"cancel_{job.job_id}")
+
+                        if accept:
+                            aux_commit_extraction(job.job_id)
+                        elif cancel:
+                            engine.cancel_extraction(job.job_id)
+                            st.session_state['insertion_cancelled'] = True
+
+                    else: # no manual check needed, let's just commit
+                        aux_commit_extraction(job.job_id)
                 
 
     ############################
@@ -0,0 +1,90 @@
+"""
+Record/replay of model calls. A cassette is a JSON file mapping each request (model, parameters and prompt) to
+the completion the model returned, so that tests can run offline, in milliseconds and deterministically.
+"""
+import json
+import os
+import threading
+
+from singleflight import request_key
+from telemetry import UsageRecorder
+
+class CassetteMissError(Exception):
+    """
+    Raised when replaying a request that was never recorded in the cassette.
+    """
+    pass
+
+class CassetteCompletionClient:
+    """
+    Wraps a completion client (e.g., `ChatCompletionClient`) at the same interface, recording its completions
+    to a cassette or replaying them from it. Modes:
+      - "replay": only replays; requests not in the cassette raise `CassetteMissError`. The wrapped client is never used.
+      - "record": replays the requests already in the cassette and records the new ones.
+      - "rerecord": calls the wrapped client for every request, refreshing the cassette.
+      - "off": calls the wrapped client and leaves the cassette untouched.
+    The wrapped client can be given as a factory, so that it is only created (e.g., with an API key) if needed.
+    """
+
+    MODES = ["replay", "record", "rerecord", "off"]
+
+    def __init__(self, cassette_path, mode="replay", client=None, client_factory=None, usage_recorder=None):
+        if mode not in self.MODES:
+            raise ValueError(f"Invalid cassette mode: {mode}.")
+
+        self.cassette_path = cassette_path
+        self.mode = mode
+        self._client = client
+        self._client_factory = client_factory
+        self.usage_recorder = usage_recorder if usage_recorder is not None else UsageRecorder()
+        self._lock = threading.Lock()
+
+        if os.path.exists(cassette_path) and mode != "rerecord":
+            with open(cassette_path, encoding="utf-8") as f:
+                self._entries = json.load(f)
+        else:
+            self._entries = {}
+
+    def complete(self, user_prompt, model='gpt-3.5-turbo', **parameters):
+        key = self.request_key(user_prompt, model, **parameters)
+
+        if self.mode in ["replay", "record"]:
+            with self._lock:
+                entry = self._entries.get(key)
+            if entry is not None:
+                self.usage_recorder.record_call(model, cache_hit=True)
+                return entry["completion"]
+            elif self.mode == "replay":
+                raise CassetteMissError(f"Request not found in cassette {self.cassette_path} (re-record it): {user_prompt[-200:]}")
+
+        completion = self._wrapped_client().complete(user_prompt=user_prompt, model=model, **parameters)
+
+        if self.mode != "off":
+            with self._lock:
+                self._entries[key] = {"model": model, "prompt": user_prompt, "completion": completion}
+                self._save()
+
+        return completion
+
+    def _wrapped_client(self):
+        if self._client is None:
+            self._client = self._client_factory()
+        return self._client
+
+    def _save(self):
+        directory = os.path.dirname(self.cassette_path)
+        if len(directory) > 0:
+            os.makedirs(directory, exist_ok=True)
+
+        # write to a temporary file first, so that an interrupted run never leaves a corrupted cassette
+        temporary_path = f"{self.cassette_path}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f, indent=2, sort_keys=True)
+        os.replace(temporary_path, self.cassette_path)
+
+    @staticmethod
+    def request_key(user_prompt, model, **parameters):
+        """
+        Identifies a request by its model, parameters and prompt.
+        """
+        return request_key(user_prompt, model, **parameters)
@@ -0,0 +1,175 @@
+"""
+Deduplication of facts. An index of the facts in the database finds, for a new fact, an exact duplicate (the same
+values, by hash) or a near duplicate: a fact about the same thing (the same category, type, people and key, once
+normalized) whose value says the same or less, like "buy at 250" and "buy at 250 price". Facts without a key or a
+value are junk. How duplicates are handled depends on the policy:
+  - "skip": duplicates, near duplicates and junk are not added.
+  - "merge": like "skip", but a near duplicate that says more replaces the fact it duplicates.
+  - "keep": all facts are added, as they are.
+
+To deduplicate (compact) an existing database (from the root of the project):
+
+    python src/gpt-3.5-turbo/dedupe.py data/default_database.csv --policy merge
+"""
+import argparse
+import hashlib
+import logging
+import re
+
+
+DEDUPE_POLICIES = ["skip", "merge", "keep"]
+
+_WORD_PATTERN = re.compile(r"\w+")
+
+def _text(value):
+    # missing values may be None, NaN or pandas' NA, depending on how the facts were read
+    if isinstance(value, str):
+        return value
+    if value is None or type(value).__name__ == "NAType" or value != value:
+        return ""
+    return str(value)
+
+def normalize(text):
+    """
+    Lowercases the text and keeps only its words, so that case, punctuation and spacing do not matter.
+    """
+    return " ".join(_WORD_PATTERN.findall(_text(text).lower()))
+
+def exact_key(fact):
+    """
+    The hash of the fact values, as they are (but for surrounding spaces).
+    """
+    values = [_text(value).strip() for value in fact]
+    return hashlib.sha1("\x1f".join(values).encode("utf-8")).hexdigest()
+
+def fingerprint(fact):
+    """
+    The normalized category, type, people and key of the fact, i.e., what the fact is about.
+    """
+    return "|".join(normalize(value) for value in fact[:4])
+
+def is_junk(fact):
+    return normalize(fact[3]) == "" and normalize(fact[4]) == ""
+
+def _value_words(fact):
+    return frozenset(normalize(fact[4]).split())
+
+
+class DedupeIndex:
+    """
+    Index of the facts in a database, by exact hash and by fingerprint, pointing to their row positions.
+    """
+
+    def __init__(self):
+        self._exact = {}
+        self._fingerprints = {}
+
+    @classmethod
+    def from_batches(cls, batches):
+        """
+        Builds the index from DataFrames of facts indexed by their row positions (e.g., `FactStore.iter_batches`).
+        """
+        index = cls()
+        for batch in batches:
+            for position, fact in zip(batch.index, batch.itertuples(index=False, name=None)):
+                index.add(fact, int(position))
+        return index
+
+    def add(self, fact, position):
+        key = exact_key(fact)
+        self._exact.setdefault(key, position)
+        self._fingerprints.setdefault(fingerprint(fact), []).append((position, _value_words(fact), key))
+
+    def match(self, fact):
+        """
+        Looks the fact up. Returns ("exact", position) for an exact duplicate, ("near", position) for a near duplicate
+        whose value says the same or more, ("less", position) for a near duplicate whose value says less, or (None, None).
+        """
+        position = self._exact.get(exact_key(fact))
+        if position is not None:
+            return "exact", position
+
+        words = _value_words(fact)
+        entries = self._fingerprints.get(fingerprint(fact), [])
+        for position, other_words, _ in entries:
+            if words <= other_words:
+                return "near", position
+        for position, other_words, _ in entries:
+            if other_words < words:
+                return "less", position
+        return None, None
+
+    def plan(self, fact_tuples, next_position, policy="skip"):
+        """
+        Decides what to do with new facts according to the policy, and updates the index as if it was done. Returns
+        the facts to add, which will be given the positions from `next_position` on, and the facts to replace, as a 
+        dictionary from their positions to the facts replacing them.
+        """
+        if policy not in DEDUPE_POLICIES:
+            raise ValueError(f"Invalid dedupe policy: {policy}.")
+
+        facts_to_add = []
+        replacements = {}
+        for fact in fact_tuples:
+            if policy != "keep":
+                if is_junk(fact):
+                    logging.info("Skipping junk fact: %s", fact)
+                    continue
+
+                match, position = self.match(fact)
+                if match in ["exact", "near"]:
+                    logging.info("Skipping duplicate fact: %s", fact)
+                    continue
+                elif match == "less" and policy == "merge":
+                    logging.info("Merging fact into the one at position %d: %s", position, fact)
+                    self._remove(fact, position)
+                    self.add(fact, position)
+                    if position >= next_position:
+                        facts_to_add[position - next_position] = fact
+                    else:
+                        replacements[position] = fact
+                    continue
+
+            self.add(fact, next_position + len(facts_to_add))
+            facts_to_add.append(fact)
+
+        return facts_to_add, replacements
+
+    def _remove(self, fact, position):
+        # the fact at `position` has the same fingerprint as `fact`
+        entries = self._fingerprints[fingerprint(fact)]
+        for entry in entries:
+            if entry[0] == position and self._exact.get(entry[2]) == position:
+                del self._exact[entry[2]]
+        entries[:] = [entry for entry in entries if entry[0] != position]
+
+    def __len__(self):
+        return len(self._exact)
+
+
+def compact_database(path, policy="skip", dry_run=False):
+    """
+    Deduplicates an existing database, keeping the first of each group of duplicates (or, with the "merge" policy,
+    the value that says the most, at the position of the first). Returns the number of facts before and after.
+    """
+    import pandas as pd
+    from storage import open_fact_store
+
+    store = open_fact_store(path)
+    df = store.load()
+    facts, replacements = DedupeIndex().plan(df.itertuples(index=False, name=None), 0, policy)
+    if not dry_run:
+        store.save(pd.DataFrame(facts, columns=df.columns))
+    logging.info(f"Compacted {path} from {len(df)} to {len(facts)} facts.")
+    return len(df), len(facts)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Removes duplicate, near duplicate and junk facts from a database.")
+    parser.add_argument("database", help="Database file, e.g. data/default_database.csv")
+    parser.add_argument("--policy", default="skip", choices=["skip", "merge"])
+    parser.add_argument("--dry-run", action="store_true", help="Only reports how many facts would be removed.")
+    args = parser.parse_args()
+
+    before, after = compact_database(args.database, args.policy, args.dry_run)
+    print(f"{before - after} of {before} facts {'would be' if args.dry_run else 'were'} removed from {args.database}.")
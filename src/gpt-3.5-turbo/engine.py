@@ -1,9 +1,30 @@
-from openai import OpenAI
 import os
 import io
-import pandas as pd
+import json
+import time
 import logging
-from ast import literal_eval
+import re
+import hashlib
+import threading
+import csv
+from collections import OrderedDict
+
+from telemetry import UsageRecorder, Tracer
+from storage import open_fact_store, FactCursor, PartitionIndex
+from export import iter_export, ExportCache
+from jobs import ExtractionQueue
+from singleflight import SingleFlight, request_key
+from dedupe import DedupeIndex
+from fuzzy import TrigramIndex
+from matcher import TermMatcher
+from scan import ParallelScanner
+from rules import RuleExtractor
+from synonyms import SynonymTable, RateLimiter, synonyms_file_path_for, vocabulary_of
+from expansion import ExpansionIndex, EXPANSION_COLUMNS
+from routing import route_parameters
+
+def _has_values(values):
+    return values is not None and len(values) > 0
 
 class BraindumpEngine:
     """
@@ -12,60 +33,207 @@ class BraindumpEngine:
     it provides the capability both to insert facts into the database and to query the database.
     """
 
+    EXTRACTION_MODES = ["tuples", "json"]
+
+    # How many query results are kept (see `query_snapshot`), and how many bytes of exported files
+    MAX_RESULT_SNAPSHOTS = 64
+    EXPORT_CACHE_BYTES = 256 * 1024 * 1024
+
+    # Number of background extractions that can run at the same time (see `submit_extraction`)
+    EXTRACTION_WORKERS = 4
+
+    # Databases with at least this many facts are filtered and searched in shards, by a pool of processes
+    PARALLEL_SCAN_MIN_FACTS = 500000
+    SCAN_WORKERS = os.cpu_count() or 1
+
+    # Confidence from which the facts extracted by rules are used, without calling the model (see `rule_extraction`)
+    RULE_EXTRACTION_MIN_CONFIDENCE = 0.8
+
+    # Terms per model call, and model calls per minute, when precomputing the synonyms of the database vocabulary
+    SYNONYM_BATCH_SIZE = 25
+    SYNONYM_CALLS_PER_MINUTE = 60
+
     def __init__(self, api_key = os.getenv("OPENAI_API_KEY"),
                  database_file_path="./data/default_database.csv",
                  categories_file_path="./data/default_categories.csv",
                  gpt_engine = "gpt-3.5-turbo", gpt_temperature=0.1,
                  default_categories=["Family", "Work", "Friends", "Shopping", "Health", 
-                                     "Finance", "Travel", "Home", "Pets", "Hobbies", "Other"]):
-        
+                                     "Finance", "Travel", "Home", "Pets", "Hobbies", "Other"],
+                 extraction_mode="tuples", extraction_prompt_variant="full", dedupe_policy="skip", fuzzy_search=True,
+                 rule_extraction=False, synonyms_file_path=None, synonym_precomputation=False, index_expansion=False,
+                 model_routes=None, gpt_client=None):
+        # Accounting of the model calls (tokens, latency, retries), per operation and per session
+        self.usage = UsageRecorder()
+        # Timing spans around the stages of extraction and search, disabled until an exporter is added
+        self.tracer = Tracer()
 
+        # The database and the categories files are only read (or created) when first needed, so that creating
+        # an engine is fast. The database format (CSV, Arrow IPC or Parquet) depends on the file extension.
         self._database_file_path = database_file_path
         self._categories_file_path = categories_file_path
-        self._categories = default_categories
-
-        # Load the database or create it from scratch if needed
-        try:
-            self.database = pd.read_csv(self._database_file_path)
-            logging.info(f"Loaded database from {self._database_file_path}.")
-        except FileNotFoundError:
-            self.database = pd.DataFrame(columns=["Category", "Type", "People", "Key", "Value"])
-            self._save()
-            logging.info(f"Created database in {self._database_file_path}.")
-        
-
-        # Load the categories file or create it from scratch if needed
-        try:
-            df_categories = pd.read_csv(self._categories_file_path)
-            self._categories = df_categories["Category"].tolist()
-            logging.info(f"Loaded categories {self._categories} from {self._categories_file_path}.")
-        except FileNotFoundError:
-            self.database = pd.DataFrame(default_categories, columns=["Category"])
-            self._save()
-            logging.info(f"Created categories {self._categories} in {self._categories_file_path}.")
-
+        self._default_categories = default_categories
+        self._fact_store = None
+        self._database = None
+        self._partition_index = None
+        self._loaded_categories = None
+        self._lazy_loading_lock = threading.Lock()
 
         self.gpt_parameters = {"engine": gpt_engine, "temperature": gpt_temperature, 
                                 "max_tokens":200, "top_p":1.0, "frequency_penalty":0.0, 
                                 "presence_penalty":0.0, "stop":None}
+        # The model and parameters of each kind of prompt that does not use `gpt_parameters` (see `routing.py`)
+        self.model_routes = model_routes if model_routes is not None else {}
+
+        # How facts are requested from the model: "tuples" (Python-like tuples, one per line) or "json" (JSON mode)
+        self.extraction_mode = extraction_mode
+        # Which of the tuples extraction prompts to use (see `BraindumpPreprocessor.EXTRACTION_PROMPT_VARIANTS`)
+        self.extraction_prompt_variant = extraction_prompt_variant
+        self._extraction_statistics = {mode: {"extractions": 0, "parse_failures": 0, "rejected_lines": 0,
+                                              "total_seconds": 0.0, "parse_seconds": 0.0}
+                                       for mode in self.EXTRACTION_MODES}
+        self._statistics_lock = threading.Lock()
+
+        # Whether the simplest utterances (e.g., "sales guy email = jp@example.com") are extracted by rules, 
+        # falling back to the model when the rules are not confident enough
+        self.rule_extraction = rule_extraction
+        self._rule_extractor = RuleExtractor()
+        self._rule_statistics = {"attempts": 0, "hits": 0, "hits_by_rule": {}}
 
         self._current_extracted_facts = None
+        self._current_rejected_lines = []
+
+        # Query results snapshots by id, and their exported files. The version changes whenever facts are committed.
+        self._database_version = 0
+        self._result_snapshots = OrderedDict()
+        self._result_snapshots_lock = threading.Lock()
+        self._export_cache = ExportCache(self.EXPORT_CACHE_BYTES)
+
+        # How duplicate facts are handled on commit (see `dedupe.DEDUPE_POLICIES`). The index is built on the first commit.
+        self.dedupe_policy = dedupe_policy
+        self._dedupe_index = None
+        self._dedupe_next_position = 0
+
+        # Whether queries also find the facts with words similar to their terms (e.g., misspelled), through a trigram
+        # index built on the first query
+        self.fuzzy_search = fuzzy_search
+        self._fuzzy_index = None
+        self._fuzzy_next_position = 0
+
+        # Synonyms of the database vocabulary, precomputed by `precompute_synonyms` and looked up by queries before asking
+        # the model. The table is read the first time it is needed and, with `synonym_precomputation`, extended in the
+        # background after each commit.
+        self._synonyms_file_path = synonyms_file_path if synonyms_file_path is not None else synonyms_file_path_for(database_file_path)
+        self._synonym_table = None
+        self.synonym_precomputation = synonym_precomputation
+        self._synonym_executor = None
+        self._synonym_run_pending = False
+        self._synonyms_lock = threading.Lock()
+
+        # Whether facts are expanded with the synonyms of their terms when committed, so that queries find the facts of
+        # the synonyms of their terms through an index, without asking the model for them. The index is built on the first query.
+        self.index_expansion = index_expansion
+        self._expansion_index = None
+        self._expansion_next_position = 0
+
+        # Parallel scan of large databases (see `PARALLEL_SCAN_MIN_FACTS`), whose processes are only started when first needed
+        self._parallel_scanner = None
+
+        # Model requests in flight, shared by identical concurrent requests
+        self._in_flight_calls = SingleFlight()
+
+        # Background extractions (see `submit_extraction`), whose queue is only started when first needed
+        self._extraction_queue = None
+        self._commit_lock = threading.Lock()
 
         # Create preprocessor and postprocessor for GPT-3 inputs and outputs, respectivelly
         self._preprocessor = BraindumpPreprocessor()
         self._postprocessor = BraindumpPostprocessor()
 
-        # create the client to access the model API
-        self.set_openai_api_key(api_key)
+        # create the client to access the model API, unless one is given (e.g., a fake one for tests and benchmarks)
+        if gpt_client is None:
+            self.set_openai_api_key(api_key)
+        else:
+            self.gpt_client = gpt_client
+            self.openai_key = api_key
+            self.usage = getattr(gpt_client, "usage_recorder", self.usage)
+
+    @property
+    def _store(self):
+        """
+        The store of the database, which is opened (or created from scratch, if needed) the first time it is accessed.
+        """
+        if self._fact_store is None:
+            with self._lazy_loading_lock:
+                if self._fact_store is None:
+                    store = open_fact_store(self._database_file_path)
+                    if store.exists():
+                        logging.info(f"Opened database {self._database_file_path}.")
+                    else:
+                        import pandas as pd
+                        self._database = pd.DataFrame(columns=["Category", "Type", "People", "Key", "Value"])
+                        store.save(self._database)
+                        logging.info(f"Created database in {self._database_file_path}.")
+                    self._fact_store = store
+        return self._fact_store
+
+    @property
+    def database(self):
+        """
+        The whole database, as a DataFrame. It is loaded from the store the first time it is accessed.
+        """
+        store = self._store
+        if self._database is None:
+            with self.tracer.span("load"):
+                self._database = store.load()
+            logging.info(f"Loaded database from {self._database_file_path}.")
+        return self._database
+
+    @database.setter
+    def database(self, df):
+        self._database = df
+        self._partition_index = None
+        self._database_version += 1
+
+    @property
+    def _categories(self):
+        """
+        The allowed categories, which are loaded from their file (or saved to it, if needed) the first time they are accessed.
+        """
+        if self._loaded_categories is None:
+            with self._lazy_loading_lock:
+                if self._loaded_categories is None:
+                    try:
+                        with open(self._categories_file_path, newline="", encoding="utf-8") as f:
+                            self._loaded_categories = [row["Category"] for row in csv.DictReader(f)]
+                        logging.info(f"Loaded categories {self._loaded_categories} from {self._categories_file_path}.")
+                    except FileNotFoundError:
+                        self._loaded_categories = self._default_categories
+                        self._save_categories()
+                        logging.info(f"Created categories {self._loaded_categories} in {self._categories_file_path}.")
+        return self._loaded_categories
+
+    @_categories.setter
+    def _categories(self, categories):
+        self._loaded_categories = categories
 
     def _save(self):
-        logging.info(f"Database has {len(self.database)} facts.")
-        logging.info(f"Available categories are {self._categories}")
-        
-        self.database.to_csv(self._database_file_path, index=False)
-        pd.DataFrame(self._categories, columns=["Category"]).to_csv(self._categories_file_path, index=False)
+        """
+        Saves the whole database (if it is loaded) and the categories.
+        """
+        if self._database is not None:
+            logging.info(f"Database has {len(self._database)} facts.")
+            with self.tracer.span("save"):
+                self._store.save(self._database)
+            logging.info(f"Saved database in {self._database_file_path}.")
 
-        logging.info(f"Saved database in {self._database_file_path}.")
+        self._save_categories()
+
+    def _save_categories(self):
+        logging.info(f"Available categories are {self._loaded_categories}")
+        with open(self._categories_file_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f, lineterminator="\n")
+            writer.writerow(["Category"])
+            writer.writerows([category] for category in self._loaded_categories)
         logging.info(f"Saved allowed categories in {self._categories_file_path}.")
         
     #####################################
@@ -76,9 +244,112 @@ class BraindumpEngine:
         """
         Extracts facts from a natural language utterance. Returns a list of tuples (category, type, people, key, value).
         """
-        fact_tuples = self._postprocessor.string_to_tuples(self._gpt_complete(self._preprocessor.extraction_prompt(facts_utterance, self._categories)))
+        fact_tuples, rejected_lines = self._extract(facts_utterance)
+
         self._current_extracted_facts = fact_tuples
+        self._current_rejected_lines = rejected_lines
         return fact_tuples
+
+    def _extract(self, facts_utterance, extraction_mode=None, extraction_prompt_variant=None):
+        """
+        Extracts facts from a natural language utterance, without changing the current extraction. Returns 
+        the facts and the rejected lines.
+        """
+        if extraction_mode is None:
+            extraction_mode = self.extraction_mode
+        if extraction_prompt_variant is None:
+            extraction_prompt_variant = self.extraction_prompt_variant
+        if extraction_mode not in self.EXTRACTION_MODES:
+            raise ValueError(f"Invalid extraction mode: {extraction_mode}.")
+
+        if self.rule_extraction:
+            rule_extraction = self._extract_with_rules(facts_utterance)
+            if rule_extraction is not None:
+                return rule_extraction.facts, []
+
+        start = time.perf_counter()
+        with self.tracer.span("extract_facts", mode=extraction_mode), self.usage.labels(operation="extract_facts"):
+            with self.tracer.span("build_prompt"):
+                if extraction_mode == "json":
+                    prompt = self._preprocessor.json_extraction_prompt(facts_utterance, self._categories)
+                else:
+                    prompt = self._preprocessor.extraction_prompt(facts_utterance, self._categories, 
+                                                                  variant=extraction_prompt_variant)
+            
+            raw_facts = self._gpt_complete(prompt, response_format={"type": "json_object"} if extraction_mode == "json" else None,
+                                           prompt_kind="extraction_prompt")
+            
+            parse_start = time.perf_counter()
+            with self.tracer.span("parse"):
+                if extraction_mode == "json":
+                    fact_tuples, rejected_lines = self._postprocessor.parse_json_facts(raw_facts)
+                else:
+                    fact_tuples, rejected_lines = self._postprocessor.parse_tuples(raw_facts)
+        end = time.perf_counter()
+
+        with self._statistics_lock:
+            statistics = self._extraction_statistics[extraction_mode]
+            statistics["extractions"] += 1
+            statistics["total_seconds"] += end - start
+            statistics["parse_seconds"] += end - parse_start
+            if len(rejected_lines) > 0:
+                statistics["parse_failures"] += 1
+                statistics["rejected_lines"] += len(rejected_lines)
+        if len(rejected_lines) > 0:
+            logging.warning(f"Kept {len(fact_tuples)} facts, but rejected {len(rejected_lines)} malformed lines: {rejected_lines}")
+
+        return fact_tuples, rejected_lines
+    
+    def _extract_with_rules(self, facts_utterance):
+        """
+        Returns the `RuleExtraction` of the utterance if it is confident enough, or None if the model must be asked.
+        """
+        with self.tracer.span("rule_extraction") as span:
+            extraction = self._rule_extractor.extract(facts_utterance, self._categories)
+            hit = extraction is not None and extraction.confidence >= self.RULE_EXTRACTION_MIN_CONFIDENCE
+            if span is not None:
+                span.set_attribute("rule", extraction.rule if extraction is not None else None)
+                span.set_attribute("hit", hit)
+
+        with self._statistics_lock:
+            self._rule_statistics["attempts"] += 1
+            if hit:
+                self._rule_statistics["hits"] += 1
+                self._rule_statistics["hits_by_rule"][extraction.rule] = self._rule_statistics["hits_by_rule"].get(extraction.rule, 0) + 1
+        if hit:
+            logging.info(f"Extracted facts with the {extraction.rule} rule (confidence {extraction.confidence}).")
+            return extraction
+        return None
+
+    def rule_extraction_statistics(self):
+        """
+        Returns how many extractions were tried with rules, how many of them did not need the model (hits), by rule, 
+        and the hit rate.
+        """
+        with self._statistics_lock:
+            statistics = dict(self._rule_statistics, hits_by_rule=dict(self._rule_statistics["hits_by_rule"]))
+        statistics["hit_rate"] = statistics["hits"] / statistics["attempts"] if statistics["attempts"] > 0 else None
+        return statistics
+
+    def rejected_lines(self):
+        """
+        Returns the lines of the latest extraction that could not be parsed as facts.
+        """
+        return self._current_rejected_lines
+
+    def extraction_statistics(self):
+        """
+        Returns, for each extraction mode, the number of extractions performed, the parse failure rate 
+        (i.e., the fraction of extractions with at least one rejected line) and the mean time per extraction.
+        """
+        report = {}
+        for mode, statistics in self._extraction_statistics.items():
+            n = statistics["extractions"]
+            report[mode] = dict(statistics, 
+                                parse_failure_rate=statistics["parse_failures"] / n if n > 0 else None,
+                                mean_seconds=statistics["total_seconds"] / n if n > 0 else None,
+                                mean_parse_seconds=statistics["parse_seconds"] / n if n > 0 else None)
+        return report
     
     def has_extracted_facts(self):
         return self._current_extracted_facts is not None
@@ -87,8 +358,12 @@ class BraindumpEngine:
         """
         Returns the current extracted facts as a list of dictionaries, for readability.
         """
+        return self.facts_as_dicts(self._current_extracted_facts)
+
+    @staticmethod
+    def facts_as_dicts(fact_tuples):
         return [{"Category": fact[0], "Type": fact[1], "People": fact[2], "Key": fact[3], "Value": fact[4]} 
-                 for fact in self._current_extracted_facts]
+                 for fact in fact_tuples]
 
     def commit(self):
         """
@@ -96,9 +371,8 @@ class BraindumpEngine:
         just does nothing.
         """	
         if self._current_extracted_facts is not None:
-            self._insert_facts()
+            self._commit_facts(self._current_extracted_facts)
             self._current_extracted_facts = None
-            self._save()
         else:
             logging.info("Nothing to commit.")
     
@@ -111,26 +385,127 @@ class BraindumpEngine:
         else:
             logging.info("Nothing to revert.")
 
-    def _insert_facts(self, facts_utterance = None):
+    def _commit_facts(self, fact_tuples):
         """
-        Inserts a fact into the database.
+        Adds facts to the database, handling duplicates according to the dedupe policy. Returns the facts added.
         """
+        if self.index_expansion and len(fact_tuples) > 0:
+            self._expand_facts(fact_tuples)
+        with self.tracer.span("commit"), self._commit_lock:
+            if self._dedupe_index is None:
+                with self.tracer.span("dedupe_index"):
+                    self._dedupe_index = DedupeIndex.from_batches(self._store.iter_batches())
+                    self._dedupe_next_position = self._store.count()
 
-        # reuse the extracted facts, if any
-        if self._current_extracted_facts is None:
-            fact_tuples = self.extract_facts(facts_utterance)
-        else:
-            fact_tuples = self._current_extracted_facts
+            fact_tuples, replacements = self._dedupe_index.plan(fact_tuples, self._dedupe_next_position, self.dedupe_policy)
+            if len(replacements) > 0:
+                self._replace_facts(replacements)
+            if len(fact_tuples) > 0:
+                self._insert_facts(fact_tuples)
+                self._dedupe_next_position += len(fact_tuples)
+            self._database_version += 1
+        if self.synonym_precomputation and (len(fact_tuples) > 0 or len(replacements) > 0):
+            self._submit_synonym_precomputation()
+        return fact_tuples
 
+    def _insert_facts(self, fact_tuples):
+        """
+        Inserts facts into the database.
+        """
+        import pandas as pd
         for fact_tuple in fact_tuples:
-            logging.info(f"Database has {len(self.database)} facts before insertion.")
-            logging.info(f"Inserting fact: {fact_tuple}")
-            
-            df_to_add = pd.DataFrame([fact_tuple], columns=["Category", "Type", "People", "Key", "Value"])
-            self.database = pd.concat([self.database, df_to_add], ignore_index=True)
-            
-            logging.info(f"Database has {len(self.database)} facts after insertion.")
+            logging.info("Inserting fact: %s", fact_tuple)
+        df_to_add = pd.DataFrame(fact_tuples, columns=["Category", "Type", "People", "Key", "Value"])
+
+        # only the new facts are written, and the database is kept in memory only if it was already loaded
+        with self.tracer.span("save"):
+            self._store.append(df_to_add)
+        if self._database is not None:
+            # keep the columnar (Arrow-backed) types of the database, if any, which are much faster to search
+            df_to_add = df_to_add.astype({column: dtype for column, dtype in self._database.dtypes.items() 
+                                          if isinstance(dtype, pd.ArrowDtype)})
+            self._database = pd.concat([self._database, df_to_add], ignore_index=True)
+            logging.info("Database has %d facts after insertion.", len(self._database))
+            if self._partition_index is not None:
+                self._partition_index.add(self._database.iloc[-len(df_to_add):])
+        if self._fuzzy_index is not None:
+            self._fuzzy_index.add_dataframe(df_to_add.set_axis(range(self._fuzzy_next_position,
+                                                                     self._fuzzy_next_position + len(df_to_add))))
+            self._fuzzy_next_position += len(df_to_add)
+        if self._expansion_index is not None:
+            self._expansion_index.add_dataframe(df_to_add.set_axis(range(self._expansion_next_position,
+                                                                         self._expansion_next_position + len(df_to_add))))
+            self._expansion_next_position += len(df_to_add)
+
+    def _replace_facts(self, replacements):
+        """
+        Replaces the facts at the specified row positions (a dictionary from positions to facts). The whole database is rewritten.
+        """
+        for position, fact_tuple in replacements.items():
+            logging.info("Replacing fact at position %d with: %s", position, fact_tuple)
+            self.database.loc[position, ["Category", "Type", "People", "Key", "Value"]] = list(fact_tuple)
+        self._save()
+        self._fuzzy_index = None # rebuilt by the next query
+        self._expansion_index = None
+        self._partition_index = None
+        if self._synonym_table is not None:
+            self._synonym_table.covered_facts = 0 # the vocabulary is read again by the next precomputation
+
+    #####################################
+    # Background facts insertion workflow
+    #####################################
+
+    def submit_extraction(self, facts_utterance, user="default"):
+        """
+        Queues the extraction of facts from a natural language utterance, and returns a job id immediately. 
+        The extraction runs in the background, with the current extraction settings, and its job then waits 
+        in the staging area of the user until it is committed or cancelled.
+        """
+        if self._extraction_queue is None:
+            with self._commit_lock:
+                if self._extraction_queue is None:
+                    self._extraction_queue = ExtractionQueue(self._extract_in_background, max_workers=self.EXTRACTION_WORKERS)
+
+        return self._extraction_queue.submit(facts_utterance, user=user, extraction_mode=self.extraction_mode,
+                                             extraction_prompt_variant=self.extraction_prompt_variant)
+
+    def _extract_in_background(self, facts_utterance, user, extraction_mode, extraction_prompt_variant):
+        with self.usage.labels(session=user):
+            return self._extract(facts_utterance, extraction_mode, extraction_prompt_variant)
 
+    def extraction_job(self, job_id):
+        """
+        Returns the job (an `ExtractionJob`) with the specified id, to check its status and extracted facts.
+        Raises KeyError if it is unknown.
+        """
+        return self._extraction_queue_of(job_id).job(job_id)
+
+    def staged_extractions(self, user="default"):
+        """
+        Returns the extraction jobs of the user that were not committed or cancelled yet, in submission order.
+        """
+        return self._extraction_queue.staged(user) if self._extraction_queue is not None else []
+
+    def commit_extraction(self, job_id):
+        """
+        Commits the facts extracted by a finished job to the database, and removes the job from the staging area.
+        Returns the facts actually added (i.e., without the duplicates skipped or merged).
+        """
+        # the job is taken out of the staging area first (if finished, or ValueError is raised), so that it is only committed once
+        job = self._extraction_queue_of(job_id).take(job_id, status="done")
+        return self._commit_facts(job.facts)
+
+    def cancel_extraction(self, job_id):
+        """
+        Removes a job from the staging area without committing its facts. If it is still running, its result is discarded.
+        """
+        self._extraction_queue_of(job_id).take(job_id)
+
+    def _extraction_queue_of(self, job_id):
+        # before the first submission, there is no queue and so no job
+        if self._extraction_queue is None:
+            raise KeyError(job_id)
+        return self._extraction_queue
 
     #####################################
     # Search workflow methods
@@ -140,48 +515,364 @@ class BraindumpEngine:
         """
         Queries the database for a fact.
         """
-        if len(fact_query) > 0 or show_none_if_no_query:
-            raw_original_terms = self._gpt_complete(self._preprocessor.terms_extraction_prompt(fact_query))
+        with self.tracer.span("query"), self.usage.labels(operation="query"):
+            if len(fact_query) > 0 or show_none_if_no_query:
+                original_terms, augmented_terms = self._query_terms(fact_query, verbose)
+                fuzzy_positions = self._related_positions(original_terms)
+                if self._scans_in_parallel(categories, entry_types):
+                    with self.tracer.span("parallel_search", terms=len(original_terms) + len(augmented_terms)):
+                        return self._scan_in_parallel(categories, entry_types, people,
+                                                      TermMatcher(original_terms + augmented_terms), fuzzy_positions)
+                with self.tracer.span("filter"):
+                    df = self._database_filtered_by(categories, entry_types, people)
+                with self.tracer.span("search", terms=len(original_terms) + len(augmented_terms)):
+                    return self._search_dataframe(df, original_terms, augmented_terms, fuzzy_positions)
+            else:
+                with self.tracer.span("filter"):
+                    if self._scans_in_parallel(categories, entry_types) and any(values is not None and len(values) > 0
+                                                         for values in [categories, entry_types, people]):
+                        return self._scan_in_parallel(categories, entry_types, people)
+                    return self._database_filtered_by(categories, entry_types, people)
+
+    def query_cursor(self, fact_query, categories=None, entry_types=None, people=None, show_none_if_no_query=False):
+        """
+        Queries the database for a fact, like `query`, but without loading the database in memory. Returns a
+        `FactCursor`, whose results are read page by page.
+        """
+        with self.tracer.span("query"), self.usage.labels(operation="query"):
+            if len(fact_query) > 0 or show_none_if_no_query:
+                original_terms, augmented_terms = self._query_terms(fact_query)
+                fuzzy_positions = self._related_positions(original_terms)
+                matcher = TermMatcher(original_terms + augmented_terms)
+                predicate = lambda df: self._search_dataframe(self._filter_dataframe(df, categories, entry_types, people),
+                                                              original_terms, augmented_terms, fuzzy_positions, matcher)
+            elif any(values is not None and len(values) > 0 for values in [categories, entry_types, people]):
+                predicate = lambda df: self._filter_dataframe(df, categories, entry_types, people)
+            else:
+                predicate = None
+            return FactCursor(self._store, predicate, categories=categories, entry_types=entry_types)
+
+    def query_snapshot(self, fact_query, categories=None, entry_types=None, people=None, show_none_if_no_query=False):
+        """
+        Queries the database like `query_cursor`, and keeps the result under an id, which is returned. The id only depends 
+        on the query, on the database version and on the settings that change results (the model and search options), so
+        repeating a query (e.g., when the app reruns) reuses the result without calling the model again. Use `result` to
+        get the result and `export_result` to export it.
+        """
+        request = {"query": fact_query, "categories": categories, "entry_types": entry_types, "people": people,
+                   "show_none_if_no_query": show_none_if_no_query, "database_version": self._database_version,
+                   "engine": self.gpt_parameters["engine"], "temperature": self.gpt_parameters["temperature"],
+                   "model_routes": self.model_routes, "fuzzy_search": self.fuzzy_search, "index_expansion": self.index_expansion}
+        result_id = hashlib.sha256(json.dumps(request, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+        with self._result_snapshots_lock:
+            if result_id in self._result_snapshots:
+                self._result_snapshots.move_to_end(result_id)
+                return result_id
+
+        cursor = self.query_cursor(fact_query, categories, entry_types, people, show_none_if_no_query)
+        cursor.total_count() # the matching facts are found now, once
+
+        with self._result_snapshots_lock:
+            self._result_snapshots[result_id] = cursor
+            while len(self._result_snapshots) > self.MAX_RESULT_SNAPSHOTS:
+                self._result_snapshots.popitem(last=False)
+        return result_id
+
+    def result(self, result_id):
+        """
+        Returns the `FactCursor` of a query result kept by `query_snapshot`. Raises KeyError if it is unknown or was evicted.
+        """
+        with self._result_snapshots_lock:
+            return self._result_snapshots[result_id]
+
+    def export_result(self, result_id, file_type=None):
+        """
+        Exports a query result kept by `query_snapshot`, as bytes. Each file type is only exported once per result,
+        as exported files are cached.
+        """
+        if file_type is None:
+            file_type = "excel"
+
+        key = (result_id, file_type)
+        data = self._export_cache.get(key)
+        if data is None:
+            with self.tracer.span("export", file_type=file_type):
+                data = b"".join(self.export_data_stream(self.result(result_id), file_type=file_type))
+            self._export_cache.put(key, data)
+        return data
+
+    def _query_terms(self, fact_query, verbose=False):
+        """
+        Asks the model for the terms of the query and for their synonyms.
+        """
+        with self.tracer.span("build_prompt"):
+            prompt = self._preprocessor.terms_extraction_prompt(fact_query)
+        raw_original_terms = self._gpt_complete(prompt, prompt_kind="terms_extraction_prompt")
+        with self.tracer.span("parse"):
             original_terms = self._postprocessor.extract_lines_from_result(raw_original_terms)
-            if verbose:
-                print(original_terms)
+        if verbose:
+            print(original_terms)
+        if self.index_expansion:
+            # the facts of the synonyms of the terms are found through the expansion index instead
+            return original_terms, []
 
-            augmented_terms = []    
-            for original_term in original_terms:
-                raw_augmented_terms = self._gpt_complete(self._preprocessor.terms_augmentation_prompt(original_term))
+        augmented_terms = []    
+        for original_term in original_terms:
+            # precomputed synonyms are used first, and the model is only asked for those of unknown terms
+            synonyms = self._synonyms.get(original_term)
+            if synonyms is not None:
+                augmented_terms += synonyms
+                continue
+            with self.tracer.span("build_prompt"):
+                prompt = self._preprocessor.terms_augmentation_prompt(original_term)
+            raw_augmented_terms = self._gpt_complete(prompt, prompt_kind="terms_augmentation_prompt")
+            with self.tracer.span("parse"):
                 augmented_terms += self._postprocessor.extract_lines_from_result(raw_augmented_terms)
-            if verbose:
-                print(augmented_terms)
-            
-            return self._search_dataframe(self._database_filtered_by(categories, entry_types, people),
-                                        original_terms, augmented_terms)
-        else:
-            return self._database_filtered_by(categories, entry_types, people)
+        if verbose:
+            print(augmented_terms)
 
-    def _search_dataframe(self, df, original_terms, augmented_terms):
+        return original_terms, augmented_terms
+
+    @property
+    def _synonyms(self):
         """
-        Searches the specified database for the specified terms.
+        The `SynonymTable` of the database, read from its file (if any) the first time it is needed.
         """
-        df = df.fillna("") # for readability below
-        all_terms = original_terms + augmented_terms
+        if self._synonym_table is None:
+            with self._lazy_loading_lock:
+                if self._synonym_table is None:
+                    self._synonym_table = SynonymTable.load(self._synonyms_file_path)
+        return self._synonym_table
 
-        df_results = None
-        for column in df.columns:
-            df_result = df[df[column].str.contains("|".join(all_terms), case=False).fillna(False)]
-            if df_results is None:
-                df_results = df_result
-            else:
-                df_results = pd.concat([df_results, df_result])
-        
-        return df_results
+    def precompute_synonyms(self, batch_size=None, calls_per_minute=None):
+        """
+        Asks the model for the synonyms of the database vocabulary not in the synonym table yet, `batch_size` terms per
+        call and at most `calls_per_minute` calls per minute (0 for no limit), and saves the table. Only the vocabulary
+        of the facts added since the previous run is read. Returns the number of terms whose synonyms were added.
+        """
+        batch_size = batch_size if batch_size is not None else self.SYNONYM_BATCH_SIZE
+        calls_per_minute = calls_per_minute if calls_per_minute is not None else self.SYNONYM_CALLS_PER_MINUTE
+        table = self._synonyms
+        with self._synonyms_lock, self.usage.labels(operation="precompute_synonyms"):
+            with self.tracer.span("synonym_vocabulary") as span, self._commit_lock:
+                previously_covered_facts, covered_facts = table.covered_facts, self._store.count()
+                # the facts in memory are read directly, instead of from the store
+                batches = [self._database.iloc[previously_covered_facts:]] if self._database is not None else self._store.iter_batches()
+                vocabulary = set()
+                for batch in batches:
+                    # batches are not always in position order (e.g., partitioned stores), so each one is filtered
+                    new_facts = batch[batch.index >= previously_covered_facts]
+                    if len(new_facts) > 0:
+                        vocabulary |= vocabulary_of(new_facts)
+                terms = table.missing(vocabulary)
+                if span is not None:
+                    span.set_attribute("terms", len(terms))
+
+            added = self._ask_synonyms(terms, batch_size, calls_per_minute)
+            # if facts were replaced in the meantime, the next run reads the whole vocabulary again
+            if table.covered_facts == previously_covered_facts:
+                table.covered_facts = covered_facts
+            table.save()
+            logging.info("Precomputed the synonyms of %d terms (of %d new ones).", added, len(terms))
+            return added
 
+    def _ask_synonyms(self, terms, batch_size, calls_per_minute):
+        """
+        Asks the model for the synonyms of the terms, in batches and at a limited rate, and adds them to the synonym table
+        (and to the expansion index, if built). Returns the number of terms whose synonyms were added.
+        """
+        table = self._synonyms
+        rate_limiter = RateLimiter(calls_per_minute)
+        added = 0
+        for start in range(0, len(terms), batch_size):
+            batch_terms = terms[start:start + batch_size]
+            rate_limiter.wait()
+            with self.tracer.span("build_prompt"):
+                prompt = self._preprocessor.terms_batch_augmentation_prompt(batch_terms)
+            raw_synonyms = self._gpt_complete(prompt, prompt_kind="terms_batch_augmentation_prompt")
+            with self.tracer.span("parse"):
+                synonyms = self._postprocessor.extract_synonyms_from_result(raw_synonyms, batch_terms)
+            # the terms left unanswered are asked for again later, if needed
+            table.update(synonyms)
+            if self._expansion_index is not None:
+                self._expansion_index.add_synonyms(synonyms)
+            added += len(synonyms)
+        return added
+
+    def _expand_facts(self, fact_tuples):
+        """
+        Asks the model for the synonyms of the terms of new facts (including their categories) that are not in the
+        synonym table yet, all the facts together, so that the expansion index can expand them.
+        """
+        import pandas as pd
+        with self.tracer.span("expand") as span, self.usage.labels(operation="index_expansion"):
+            df = pd.DataFrame(fact_tuples, columns=["Category", "Type", "People", "Key", "Value"])
+            terms = self._synonyms.missing(vocabulary_of(df, EXPANSION_COLUMNS))
+            if span is not None:
+                span.set_attribute("terms", len(terms))
+            if len(terms) > 0 and self._ask_synonyms(terms, self.SYNONYM_BATCH_SIZE, calls_per_minute=0) > 0:
+                self._synonyms.save()
+
+    def _submit_synonym_precomputation(self):
+        """
+        Runs `precompute_synonyms` in the background, unless a run is already waiting (which will cover the new facts too).
+        """
+        with self._commit_lock:
+            if self._synonym_run_pending:
+                return
+            self._synonym_run_pending = True
+            if self._synonym_executor is None:
+                from concurrent.futures import ThreadPoolExecutor
+                self._synonym_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="synonyms")
+        self._synonym_executor.submit(self._precompute_synonyms_in_background)
+
+    def _precompute_synonyms_in_background(self):
+        with self._commit_lock:
+            self._synonym_run_pending = False
+        try:
+            self.precompute_synonyms()
+        except Exception:
+            logging.exception("Synonym precomputation failed.")
+
+    def synonym_statistics(self):
+        """
+        Returns the number of terms in the synonym table and how often queries found their terms in it.
+        """
+        return self._synonyms.statistics()
+
+    def _fuzzy_positions(self, terms):
+        """
+        Returns the row positions of the facts with words similar to all the words of any of the terms, or None if
+        fuzzy search is disabled. The trigram index is built the first time, then kept up to date on commit.
+        """
+        if not self.fuzzy_search:
+            return None
+        if self._fuzzy_index is None:
+            with self._commit_lock:
+                if self._fuzzy_index is None:
+                    with self.tracer.span("fuzzy_index"):
+                        self._fuzzy_index = TrigramIndex.from_batches(self._store.iter_batches())
+                        self._fuzzy_next_position = self._store.count()
+
+        import numpy as np
+        with self.tracer.span("fuzzy_search"):
+            fuzzy_index = self._fuzzy_index
+            positions = [fuzzy_index.search(term) for term in terms]
+            return np.unique(np.concatenate(positions)) if len(positions) > 0 else np.array([], dtype="int64")
+
+    def _expansion_positions(self, terms):
+        """
+        Returns the row positions of the facts containing any of the terms or their synonyms, once normalized, or None
+        if index expansion is disabled. The expansion index is built the first time, then kept up to date on commit.
+        """
+        if not self.index_expansion:
+            return None
+        if self._expansion_index is None:
+            synonyms = self._synonyms.items()
+            with self._commit_lock:
+                if self._expansion_index is None:
+                    with self.tracer.span("expansion_index"):
+                        self._expansion_index = ExpansionIndex.from_batches(self._store.iter_batches(), synonyms)
+                        self._expansion_next_position = self._store.count()
+
+        import numpy as np
+        with self.tracer.span("expansion_search"):
+            expansion_index = self._expansion_index
+            positions = [expansion_index.search(term) for term in terms]
+            return np.unique(np.concatenate(positions)) if len(positions) > 0 else np.array([], dtype="int64")
+
+    def _related_positions(self, terms):
+        """
+        Returns the row positions of the facts found by the fuzzy and expansion indexes (see `_fuzzy_positions` and
+        `_expansion_positions`), or None if both are disabled.
+        """
+        import numpy as np
+        fuzzy_positions, expansion_positions = self._fuzzy_positions(terms), self._expansion_positions(terms)
+        if fuzzy_positions is None or expansion_positions is None:
+            return fuzzy_positions if expansion_positions is None else expansion_positions
+        return np.union1d(fuzzy_positions, expansion_positions)
+
+    def _search_dataframe(self, df, original_terms, augmented_terms, fuzzy_positions=None, matcher=None):
+        """
+        Searches the specified database for the specified terms, as literals, in all its columns. The facts at
+        `fuzzy_positions` (row positions, as in the index of the database, e.g. found by the fuzzy or expansion indexes)
+        that the terms do not match exactly are found too. Each fact is returned once, in database order. A `TermMatcher` of the terms can be given, so that
+        it is only compiled once when searching several batches.
+        """
+        import numpy as np
+        if matcher is None:
+            matcher = TermMatcher(original_terms + augmented_terms)
+
+        with self.tracer.span("match", terms=len(matcher.terms)) as span:
+            if span is None:
+                return df[self._match_facts(df, matcher, fuzzy_positions)]
+            found = matcher.match_dataframe(df)
+            # which terms (e.g., which synonyms) actually found facts
+            span.set_attribute("matched_terms", matcher.terms_of(np.bitwise_or.reduce(found[found != 0], initial=0)))
+            return df[self._match_facts(df, matcher, fuzzy_positions, found)]
+
+    @staticmethod
+    def _match_facts(df, matcher, fuzzy_positions=None, found=None):
+        """
+        Returns the mask of the facts containing the terms of the matcher (whose `match_dataframe` result can be given),
+        or at the fuzzy positions.
+        """
+        if found is None:
+            found = matcher.match_dataframe(df)
+        mask = found != 0
+        if fuzzy_positions is not None and len(fuzzy_positions) > 0:
+            mask |= df.index.isin(fuzzy_positions)
+        return mask
+
+    def _scans_in_parallel(self, categories=None, entry_types=None):
+        # only the facts of the matching partitions would be scanned sequentially
+        if self.SCAN_WORKERS <= 1 or len(self.database) < self.PARALLEL_SCAN_MIN_FACTS:
+            return False
+        if _has_values(categories) or _has_values(entry_types):
+            return len(self._partitions.positions(categories, entry_types)) >= self.PARALLEL_SCAN_MIN_FACTS
+        return True
+
+    def _scan_in_parallel(self, categories=None, entry_types=None, people=None, matcher=None, fuzzy_positions=None):
+        """
+        Filters (and, with a matcher, searches) the database in shards, in parallel, like `_database_filtered_by` 
+        and `_search_dataframe`. The database must be loaded and indexed by row positions.
+        """
+        if self._parallel_scanner is None:
+            with self._lazy_loading_lock:
+                if self._parallel_scanner is None:
+                    self._parallel_scanner = ParallelScanner(self.SCAN_WORKERS)
+        database = self.database
+        positions = self._parallel_scanner.scan(database, self._database_version, categories, entry_types, people,
+                                                matcher, fuzzy_positions)
+        return database.take(positions)
 
     def _database_filtered_by(self, categories=None, entry_types=None, people=None):
-        df = self.database
+        database = self.database
+        if _has_values(categories) or _has_values(entry_types):
+            # only the rows of the matching partitions are taken, which are then only filtered by people
+            database = database.take(self._partitions.positions(categories, entry_types))
+            categories = entry_types = None
+        return self._filter_dataframe(database, categories, entry_types, people)
+
+    @property
+    def _partitions(self):
+        """
+        The `PartitionIndex` of the database in memory, built the first time it is needed, and kept up to date on commit.
+        """
+        if self._partition_index is None:
+            database = self.database
+            with self._lazy_loading_lock:
+                if self._partition_index is None:
+                    with self.tracer.span("partition_index"):
+                        self._partition_index = PartitionIndex.from_dataframe(database)
+        return self._partition_index
 
+    @staticmethod
+    def _filter_dataframe(df, categories=None, entry_types=None, people=None):
         def aux_filter(df, column, values):
             if values is not None and len(values) > 0:
-                return df[self.database[column].str.lower().isin([v.lower() for v in values])]
+                return df[df[column].str.lower().isin([v.lower() for v in values])]
             else:
                 return df
         
@@ -192,13 +883,19 @@ class BraindumpEngine:
         return df
     
     def unique_categories_in_database(self):
-        return self.database["Category"].unique().tolist()
+        return self._unique_in_database("Category")
     
     def unique_entry_types_in_database(self):
-        return self.database["Type"].unique().tolist()
+        return self._unique_in_database("Type")
         
     def unique_people_in_database(self):
-        return self.database["People"].unique().tolist()
+        return self._unique_in_database("People")
+
+    def _unique_in_database(self, column):
+        # read only the column from the store, unless the whole database is already in memory
+        if self._database is None:
+            return self._store.unique(column)
+        return self._database[column].unique().tolist()
 
     ##########################
     # Categories management
@@ -207,32 +904,62 @@ class BraindumpEngine:
         return self._categories
 
     def update_categories(self, new_categories):
-        self._categories = new_categories
-        self._save()
+        # the app updates the categories on every rerun, but the file only needs to be written when they change
+        if new_categories != self._categories:
+            self._categories = new_categories
+            self._save_categories()
     
     #############
     # GPT-3 API
     #############
-    def _gpt_complete(self, prompt):
-
-        return self.gpt_client.complete(user_prompt=prompt, add_to_chat=False,
-                                     model=self.gpt_parameters["engine"],
-                                     temperature=self.gpt_parameters["temperature"], 
-                                     max_tokens=self.gpt_parameters["max_tokens"],
-                                     top_p=self.gpt_parameters["top_p"], 
-                                     frequency_penalty=self.gpt_parameters["frequency_penalty"], 
-                                     presence_penalty=self.gpt_parameters["presence_penalty"], 
-                                     stop=self.gpt_parameters["stop"])
+    def _gpt_complete(self, prompt, response_format=None, prompt_kind=None):
+        route = self.model_routes.get(prompt_kind, {})
+        # with several candidate models, one that fails is skipped from then on (see `routing.select_model`), and
+        # another one is tried right away
+        attempts = max(1, len(route.get("candidates", [])))
+        for attempt in range(attempts):
+            # the route of the kind of prompt, if any, overrides the model and parameters
+            gpt_parameters = route_parameters(self.gpt_parameters, route, self.usage)
+            try:
+                return self._gpt_complete_with(prompt, gpt_parameters, response_format, prompt_kind)
+            except Exception as e:
+                if attempt == attempts - 1:
+                    raise
+                logging.warning(f"Model {gpt_parameters['engine']} failed ({e}), trying another candidate...")
+
+    def _gpt_complete_with(self, prompt, gpt_parameters, response_format, prompt_kind):
+        parameters = {"model": gpt_parameters["engine"],
+                      "temperature": gpt_parameters["temperature"], 
+                      "max_tokens": gpt_parameters["max_tokens"],
+                      "top_p": gpt_parameters["top_p"], 
+                      "frequency_penalty": gpt_parameters["frequency_penalty"], 
+                      "presence_penalty": gpt_parameters["presence_penalty"], 
+                      "stop": gpt_parameters["stop"],
+                      "response_format": response_format}
+
+        with self.tracer.span("llm_call", model=parameters["model"], prompt_kind=prompt_kind) as span:
+            # identical requests already in flight (e.g., the same query from several sessions) are made only once
+            completion, coalesced = self._in_flight_calls.do(request_key(prompt, **parameters),
+                                                             lambda: self.gpt_client.complete(user_prompt=prompt, add_to_chat=False, **parameters))
+            if coalesced:
+                self.usage.record_call(parameters["model"], cache_hit=True)
+            if span is not None:
+                span.set_attribute("coalesced", coalesced)
+            return completion
                                  
 
     def set_openai_api_key(self, key):
-        self.gpt_client = ChatCompletionClient(openai_key=key)
+        # the app sets the key on every rerun, but the backend (and its connection pool) only needs to change with it
+        if isinstance(getattr(self, "gpt_client", None), OpenAIBackend) and key == self.openai_key:
+            return
+        self.gpt_client = OpenAIBackend(openai_key=key, usage_recorder=self.usage)
         self.openai_key = key
     
     ####################
     # Data utilities
     ####################
     def export_data_to_binary(self, df, file_type=None):
+        import pandas as pd
         if file_type is None:
             file_type = "excel"
         
@@ -251,12 +978,46 @@ class BraindumpEngine:
         else:
             raise ValueError("Invalid file type.")
 
+    def export_data_stream(self, results, file_type=None, chunk_size=10000):
+        """
+        Exports query results (a `FactCursor` or a DataFrame) as a generator of byte blocks, reading and writing
+        `chunk_size` facts at a time. Besides the formats of `export_data_to_binary`, supports "csv.gz", "jsonl" and "parquet".
+        """
+        if file_type is None:
+            file_type = "excel"
+
+        if isinstance(results, FactCursor):
+            chunks = results.iter_chunks(chunk_size)
+        else:
+            chunks = (results.iloc[start:start + chunk_size] for start in range(0, len(results), chunk_size))
+        return iter_export(chunks, file_type)
+
 class BraindumpPreprocessor:
     """
     Preprocessor for the user input to GPT-3. Notably, includes the mechanisms to build prompts.
     """
 
-    def extraction_prompt(self, x, categories):
+    # Extraction prompt variants, from the most to the least expensive in tokens. All of them produce the same tuples format.
+    EXTRACTION_PROMPT_VARIANTS = ["full", "compact", "zero-shot"]
+
+    FACT_TYPES = ["List", "Email", "Phone", "Address", "Document", "Pendency", "Price", "Reminder", "Note", "Doubt", "Wish", "Other"]
+
+    def extraction_prompt(self, x, categories, variant="full"):
+        """
+        Builds the facts extraction prompt using the specified variant (see `EXTRACTION_PROMPT_VARIANTS`).
+        """
+        variants = {"full": self._full_extraction_prompt, 
+                    "compact": self._compact_extraction_prompt, 
+                    "zero-shot": self._zero_shot_extraction_prompt}
+        if variant not in variants:
+            raise ValueError(f"Invalid extraction prompt variant: {variant}.")
+        
+        prompt = variants[variant](x, categories)
+        # prompts are long, so they are only formatted and logged when debugging
+        logging.debug("GPT-3 Prompt: %s", prompt)
+        return prompt
+
+    def _full_extraction_prompt(self, x, categories):
         
         prompt =\
 f"""
@@ -293,7 +1054,64 @@ Example output:
 
 Input: {x}
 """
-        logging.info(f"GPT-3 Prompt: {prompt}")
+        return prompt 
+
+    def _compact_extraction_prompt(self, x, categories):
+        
+        prompt =\
+f"""
+Extract personal info as tuples (Category, Type, People, Key, Value), one per line, no redundancy.
+Category: {'|'.join(categories)}
+Type: {'|'.join(self.FACT_TYPES)}
+People: people or organizations concerned, or "".
+
+"Mom's phone number is 555-555-5555" ->
+("Family", "Phone", "mom", "mom's number", "555-555-5555")
+"Need to do: lab work, buy aspirin" ->
+("Health", "List", "", "to do", "lab work")
+("Shopping", "List", "", "aspirin", "buy")
+
+"{x}" ->
+"""
+        return prompt
+
+    def _zero_shot_extraction_prompt(self, x, categories):
+        
+        prompt =\
+f"""
+Extract personal info as Python tuples ("Category", "Type", "People", "Key", "Value"), one per line, no redundancy, nothing else.
+Category: {'|'.join(categories)}
+Type: {'|'.join(self.FACT_TYPES)}
+People: people or organizations concerned, or "".
+
+Input: {x}
+"""
+        return prompt
+
+    def json_extraction_prompt(self, x, categories):
+        
+        prompt =\
+f"""
+Extract pieces of personal information, like phone numbers, email addresses, names, trivia, reminders, etc., as a JSON object with the following format: {{"facts": [{{"category": ..., "type": ..., "people": ..., "key": ..., "value": ...}}]}}
+Assume everything mentioned refers to the same thing. All fields are strings. Constraints:
+  - Allowed categories: {', '.join(categories)}
+  - Allowed types: "List", "Email", "Phone", "Address", "Document", "Pendency", "Price", "Reminder", "Note", "Doubt", "Wish", "Other"
+  - People contain the name or description of the people or organizations concerned, or is empty if no person or organization is mentioned.
+  - Put as much information in each fact as possible, only breaking in multiple facts if really needed.
+  - Don't extract redundant facts.
+  
+Example input: "Mom's phone number is 555-555-5555"
+Example output: {{"facts": [{{"category": "Family", "type": "Phone", "people": "mom", "key": "mom's number", "value": "555-555-5555"}}]}}
+
+Example input: "Need to do: lab work, buy aspirin"
+Example output: {{"facts": [{{"category": "Health", "type": "List", "people": "", "key": "to do", "value": "lab work"}}, {{"category": "Shopping", "type": "List", "people": "", "key": "aspirin", "value": "buy"}}]}}
+
+Example input: "teacher's day with school visitors -> clean up"
+Example output: {{"facts": [{{"category": "Work", "type": "Reminder", "people": "school visitors", "key": "teacher's day", "value": "clean up"}}]}}
+
+Input: {x}
+"""
+        logging.debug("GPT-3 Prompt: %s", prompt)
         return prompt 
 
     def terms_extraction_prompt(self, query):
@@ -302,7 +1120,20 @@ Input: {x}
 f"""
 Extract the main entities (one per line, without bullets) in the following sentence: "{query}"
 """
-        logging.info(f"GPT-3 Prompt: {prompt}")
+        logging.debug("GPT-3 Prompt: %s", prompt)
+        return prompt
+
+    def terms_batch_augmentation_prompt(self, terms):
+        term_lines = "\n".join(f"- {term}" for term in terms)
+        prompt = \
+f"""
+List some synonyms for each of the following terms.
+Answer with one line per term: the term, a colon, and its synonyms separated by semicolons (e.g., "car: automobile; vehicle").
+Terms:
+{term_lines}
+Synonyms:
+"""
+        logging.debug("GPT-3 Prompt: %s", prompt)
         return prompt
 
     def terms_augmentation_prompt(self, term):
@@ -311,7 +1142,7 @@ f"""
 List some synonyms for the following term: "{term}"
 Synonyms (one synonym per line):
 """
-        logging.info(f"GPT-3 Prompt: {prompt}")
+        logging.debug("GPT-3 Prompt: %s", prompt)
         return prompt
     
 
@@ -327,14 +1158,138 @@ class BraindumpPostprocessor:
         lines = [line.strip(' -*') for line in result.split('\n') if len(line) > 0]
         return lines
 
+    def extract_synonyms_from_result(self, result, terms):
+        """
+        Extracts the synonyms of each of the terms from a "term: synonym; synonym" result. Lines about other terms are ignored.
+        """
+        terms_by_name = {" ".join(term.lower().split()): term for term in terms}
+        synonyms = {}
+        for line in self.extract_lines_from_result(result):
+            name, separator, line_synonyms = line.partition(":")
+            term = terms_by_name.get(" ".join(name.strip(' "\'').lower().split()))
+            if separator == "" or term is None:
+                continue
+            synonyms[term] = [synonym.strip(' "\'.') for synonym in re.split(r"[;,]", line_synonyms) if len(synonym.strip(' "\'.')) > 0]
+        return synonyms
+
+    # A single tuple field: a double-quoted string, a single-quoted string or a bare token, followed by its delimiter.
+    # Quotes followed by anything other than a delimiter are treated as apostrophes (e.g., 'mom's phone').
+    _TUPLE_FIELD_PATTERN = re.compile(r"""\s*(?:"((?:[^"\\]|\\.|"(?!\s*(?:[,)]|$)))*)"|'((?:[^'\\]|\\.|'(?!\s*(?:[,)]|$)))*)'|([^,()]*?))\s*(?:(,)|(\))|$)""")
+    _ESCAPE_PATTERN = re.compile(r"\\(.)")
+    # Fast path for the common, well-formed case: exactly five quoted fields without escapes or inner quotes
+    _CANONICAL_TUPLE_PATTERN = re.compile(r"\(\s*" + r"\s*,\s*".join([r"""(?:"([^"\\]*)"|'([^'\\]*)')"""] * 5) + r"\s*,?\s*\)")
+    _SMART_QUOTES = str.maketrans({"\u201c": '"', "\u201d": '"', "\u2018": "'", "\u2019": "'"})
+
     def string_to_tuples(self, s):
         """"
-        Converts a string that looks like a tuple to an actual Python tuple.
+        Converts a string that looks like a tuple to an actual Python tuple. Malformed lines are skipped.
+        """
+        return self.parse_tuples(s)[0]
+
+    def parse_tuples(self, s):
+        """
+        Parses each line of the result string independently, returning a pair (tuples, rejected_lines). 
+        Valid tuples are kept even if other lines are malformed. Common defects are repaired: smart quotes, 
+        trailing commas, a missing closing parenthesis, 4-field tuples (People omitted) and tuples with too 
+        many fields (the extra ones are merged into the Value).
+        """
+        tuples = []
+        rejected_lines = []
+        for line in self.extract_lines_from_result(s):
+            m = self._CANONICAL_TUPLE_PATTERN.fullmatch(line)
+            if m is not None:
+                groups = m.groups()
+                tuples.append(tuple(dq if dq is not None else sq for dq, sq in zip(groups[0::2], groups[1::2])))
+                continue
+
+            line_tuples = self._tokenize_tuples(line.translate(self._SMART_QUOTES))
+            if line_tuples is None:
+                rejected_lines.append(line)
+                continue
+
+            for fields_list in line_tuples:
+                if len(fields_list) == 4:
+                    fields_list.insert(2, "")
+                elif len(fields_list) > 5:
+                    fields_list[4:] = [", ".join(f for f in fields_list[4:] if len(f) > 0)]
+
+                if len(fields_list) == 5:
+                    tuples.append(tuple(fields_list))
+                else:
+                    rejected_lines.append(line)
+                    break
+        
+        return tuples, rejected_lines
+
+    def _tokenize_tuples(self, line):
+        """
+        Splits a line into the fields of the tuples it contains, or returns None if the line contains no tuple.
+        """
+        line_tuples = []
+        start = line.find("(")
+        while start >= 0:
+            pos = start + 1
+            fields_list = []
+            while True:
+                m = self._TUPLE_FIELD_PATTERN.match(line, pos)
+                if m is None: # e.g., nested parentheses
+                    return None
+                double_quoted, single_quoted, bare, comma, closing = m.groups()
+                if double_quoted is not None or single_quoted is not None:
+                    field = self._ESCAPE_PATTERN.sub(r"\1", double_quoted if double_quoted is not None else single_quoted)
+                else:
+                    field = bare
+                
+                # trailing commas produce an empty bare field at the end, which is not a real field
+                if not (bare == "" and comma is None and len(fields_list) > 0):
+                    fields_list.append("" if bare == "None" else field)
+                
+                pos = m.end()
+                if comma is None or pos >= len(line):
+                    break
+            
+            if len(fields_list) > 1:
+                line_tuples.append(fields_list)
+            start = line.find("(", pos) if closing is not None else -1
+
+        return line_tuples if len(line_tuples) > 0 else None
+    
+    JSON_FACT_FIELDS = ["category", "type", "people", "key", "value"]
+
+    def parse_json_facts(self, s):
+        """
+        Parses a JSON mode completion of the form {"facts": [{"category": ..., "type": ..., "people": ..., "key": ..., "value": ...}]},
+        returning a pair (tuples, rejected_items). Facts that do not match the schema are rejected individually.
+        A missing "people" field is taken to be empty, like in the tuples format.
         """
         try:
-            return [literal_eval(s.strip()) for s in self.extract_lines_from_result(s)]
-        except:
-            return []
+            document = json.loads(s)
+        except ValueError:
+            return [], [s]
+        
+        facts = document.get("facts") if isinstance(document, dict) else document
+        if not isinstance(facts, list):
+            return [], [s]
+
+        tuples = []
+        rejected_items = []
+        for fact in facts:
+            if isinstance(fact, dict) and self._is_valid_json_fact(fact):
+                tuples.append(tuple("" if fact.get(field) is None else str(fact[field]) for field in self.JSON_FACT_FIELDS))
+            else:
+                rejected_items.append(json.dumps(fact))
+        
+        return tuples, rejected_items
+
+    def _is_valid_json_fact(self, fact):
+        for field in self.JSON_FACT_FIELDS:
+            value = fact.get(field)
+            if value is None:
+                if field != "people":
+                    return False
+            elif not isinstance(value, (str, int, float)):
+                return False
+        return True
     
     def extract_terms_from_all_results(self, results):
         """
@@ -347,11 +1302,20 @@ class BraindumpPostprocessor:
 
 class ChatCompletionClient:
     """
-    A client to call the Chat Completion API from OpenAI.
+    A client to call the Chat Completion API from OpenAI. Transient failures (rate limits, connection and server errors)
+    are retried with exponential backoff, and every call is accounted in the usage recorder.
     """
-    def __init__(self, init_system_message="You are an intelligent agent.", openai_key=os.getenv("OPENAI_API_KEY")):
-        self.openai_client = OpenAI(api_key=openai_key)
+
+    def __init__(self, init_system_message="You are an intelligent agent.", openai_key=os.getenv("OPENAI_API_KEY"),
+                 usage_recorder=None, max_retries=2, retry_backoff_seconds=0.5, openai_client=None):
+        import openai # imported here, since it takes a long time to import
+        self.retriable_errors = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+        # retries are done here rather than in the OpenAI client, so that they can be counted
+        self.openai_client = openai_client if openai_client is not None else openai.OpenAI(api_key=openai_key, max_retries=0)
         self.init_system_message = init_system_message
+        self.usage_recorder = usage_recorder if usage_recorder is not None else UsageRecorder()
+        self.max_retries = max_retries
+        self.retry_backoff_seconds = retry_backoff_seconds
         self.reset()
         
     def add_user_message(self, content):
@@ -364,7 +1328,7 @@ class ChatCompletionClient:
                  add_to_chat=False,
                  model='gpt-3.5-turbo',
                  temperature=0.7, max_tokens=1000,
-                             top_p=1.0, frequency_penalty=0.0, presence_penalty=0.0, stop=None):
+                             top_p=1.0, frequency_penalty=0.0, presence_penalty=0.0, stop=None, response_format=None):
         """
         Produces the next message in the conversation.
 
@@ -378,6 +1342,7 @@ class ChatCompletionClient:
           frequency_penalty: Float value controlling how much to penalize new tokens based on their existing frequency in the text so far. Decreases the model's likelihood to repeat the same line verbatim.
           presence_penalty: Float value controlling how much to penalize new tokens based on whether they appear in the text so far. Increases the model's likelihood to talk about new topics.
           stop: Token at which text generation is stopped.
+          response_format: Optional output format constraint, e.g. {"type": "json_object"} for JSON mode.
         """
 
         messages = self.current_messages.copy()
@@ -386,16 +1351,21 @@ class ChatCompletionClient:
         if add_to_chat:
           self.current_messages = messages
 
-        response = self.openai_client.chat.completions.create(
-          model=model,
-          messages=messages,
-          temperature=temperature,
-          max_tokens=max_tokens,
-          top_p=top_p,
-          frequency_penalty=frequency_penalty,
-          presence_penalty=presence_penalty,
-          stop=stop
-        )
+        # only request a specific format if asked to, since not all models support it
+        extra_parameters = {}
+        if response_format is not None:
+          extra_parameters["response_format"] = response_format
+
+        response = self._create_with_retries(self.openai_client.chat.completions.create,
+                                             model=model,
+                                             messages=messages,
+                                             temperature=temperature,
+                                             max_tokens=max_tokens,
+                                             top_p=top_p,
+                                             frequency_penalty=frequency_penalty,
+                                             presence_penalty=presence_penalty,
+                                             stop=stop,
+                                             **extra_parameters)
 
         #print(f"DEBUG: {response}")
         
@@ -404,4 +1374,105 @@ class ChatCompletionClient:
         if add_to_chat:
           self.current_messages.append(next_message)
         
-        return next_message['content']
\ No newline at end of file
+        return next_message['content']
+
+    def _create_with_retries(self, create, **request):
+        """
+        Calls the API with `create(**request)`, retrying on transient failures and accounting the call.
+        """
+        with self.usage_recorder.timed_call(request["model"]) as call:
+          retries = 0
+          while True:
+            try:
+              response = create(**request)
+              break
+            except self.retriable_errors as e:
+              if retries >= self.max_retries:
+                raise e
+              retries += 1
+              call["retries"] = retries
+              logging.warning(f"Model call failed ({e}), retrying ({retries}/{self.max_retries})...")
+              time.sleep(self.retry_backoff_seconds * 2 ** (retries - 1))
+
+          if response.usage is not None:
+            call["prompt_tokens"] = response.usage.prompt_tokens
+            call["completion_tokens"] = response.usage.completion_tokens
+
+        return response
+
+
+class TextCompletionClient(ChatCompletionClient):
+    """
+    A client to call the (legacy) Completion API from OpenAI, for completion-style models like the GPT-3 ones,
+    at the same interface as `ChatCompletionClient`. There is no conversation: the prompt is sent as it is, except
+    that prompts ending with their input ("Input: ...") get an "Output:" cue, for the model to continue from.
+    """
+
+    # The input at the end of a prompt, not followed by an output cue yet
+    TRAILING_INPUT_PATTERN = re.compile(r"(^|\n)Input: (?:(?!\nOutput:).)*\Z", re.DOTALL)
+
+    def complete(self, user_prompt, 
+                 add_to_chat=False,
+                 model='gpt-3.5-turbo-instruct',
+                 temperature=0.7, max_tokens=1000,
+                             top_p=1.0, frequency_penalty=0.0, presence_penalty=0.0, stop=None, response_format=None):
+        if response_format is not None:
+          raise ValueError(f"Model {model} does not support response formats (e.g., JSON mode).")
+        if self.TRAILING_INPUT_PATTERN.search(user_prompt) is not None:
+          user_prompt = user_prompt.rstrip() + "\nOutput:"
+
+        response = self._create_with_retries(self.openai_client.completions.create,
+                                             model=model,
+                                             prompt=user_prompt,
+                                             temperature=temperature,
+                                             max_tokens=max_tokens,
+                                             top_p=top_p,
+                                             frequency_penalty=frequency_penalty,
+                                             presence_penalty=presence_penalty,
+                                             stop=stop)
+        return response.choices[0].text
+
+
+class OpenAIBackend:
+    """
+    The model backend of the engine: it sends each request to the completion-style or to the chat-style client,
+    according to the model, so that engines work the same with both model families. The clients share one 
+    OpenAI client (and so its API key and connection pool), which belongs to the backend rather than to the
+    process, unlike the module-level `openai.api_key`. They are only created for the first request.
+    """
+
+    # Prefixes of the models that only support the Completion API
+    COMPLETION_MODELS = ("text-davinci", "text-curie", "text-babbage", "text-ada", "davinci", "curie", "babbage", "ada", 
+                         "gpt-3.5-turbo-instruct")
+
+    def __init__(self, openai_key=os.getenv("OPENAI_API_KEY"), usage_recorder=None, max_retries=2, retry_backoff_seconds=0.5,
+                 openai_client=None):
+        self.usage_recorder = usage_recorder if usage_recorder is not None else UsageRecorder()
+        self._openai_key = openai_key
+        self._openai_client = openai_client
+        self._client_options = {"usage_recorder": self.usage_recorder, "max_retries": max_retries, 
+                                "retry_backoff_seconds": retry_backoff_seconds}
+        self._clients = None
+        self._lock = threading.Lock()
+
+    def _create_clients(self):
+        with self._lock:
+            if self._clients is None:
+                openai_client = self._openai_client
+                if openai_client is None:
+                    import openai
+                    openai_client = openai.OpenAI(api_key=self._openai_key, max_retries=0)
+                self._clients = {"chat": ChatCompletionClient(openai_client=openai_client, **self._client_options),
+                                 "text": TextCompletionClient(openai_client=openai_client, **self._client_options)}
+        return self._clients
+
+    @classmethod
+    def is_completion_model(cls, model):
+        return model.startswith(cls.COMPLETION_MODELS)
+
+    def client_for(self, model):
+        clients = self._clients if self._clients is not None else self._create_clients()
+        return clients["text"] if self.is_completion_model(model) else clients["chat"]
+
+    def complete(self, user_prompt, model='gpt-3.5-turbo', **parameters):
+        return self.client_for(model).complete(user_prompt=user_prompt, model=model, **parameters)
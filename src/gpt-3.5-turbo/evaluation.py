@@ -0,0 +1,141 @@
+"""
+Evaluation of the facts extraction accuracy against its latency and cost. The extractor is run concurrently over
+a labeled corpus for each configuration (model, temperature, prompt variant, extraction mode), so that the fastest
+configuration that meets a given accuracy bar can be chosen.
+
+Usage (from the root of the project):
+
+    python src/gpt-3.5-turbo/evaluation.py --models gpt-3.5-turbo gpt-4 --variants full compact --accuracy-bar 0.9
+"""
+import argparse
+import itertools
+import os
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from engine import BraindumpEngine, BraindumpPreprocessor, ChatCompletionClient
+from prompt_tokens import DEFAULT_CATEGORIES, load_corpus
+
+FIELDS = ["Category", "Type", "People", "Key", "Value"]
+
+def field_matches(extracted_field, ground_truth):
+    """
+    Checks an extracted field against its ground truth, with the same semantics as the tests: the ground truth
+    can be either a string or a list of valid strings, and it is enough for any of them to be found, in full or
+    in part, in the extracted field (case and surrounding spaces are ignored).
+    """
+    extracted_field = extracted_field.strip().lower()
+    if type(ground_truth) is not list:
+        ground_truth = [ground_truth]
+    return any(a_valid_option.strip().lower() in extracted_field for a_valid_option in ground_truth)
+
+def score_extraction(extracted_tuples, expected_tuples):
+    """
+    Scores one extraction, comparing the extracted tuples with the expected ones position by position. Returns
+    the number of correct values per field (missing tuples count as wrong) and whether the number of tuples is right.
+    """
+    correct = dict.fromkeys(FIELDS, 0)
+    for extracted_tuple, expected_tuple in zip(extracted_tuples, expected_tuples):
+        for field, extracted_field, ground_truth in zip(FIELDS, extracted_tuple, expected_tuple):
+            if field_matches(extracted_field, ground_truth):
+                correct[field] += 1
+    return correct, len(extracted_tuples) == len(expected_tuples)
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+def evaluate_configuration(corpus, client, model, temperature, variant="full", mode="tuples",
+                           categories=DEFAULT_CATEGORIES, max_workers=8):
+    """
+    Runs the extractor over the corpus, concurrently, with one configuration. Returns the per-field accuracy,
+    the latency percentiles and the tokens per utterance.
+    """
+    engines = threading.local()
+    with tempfile.TemporaryDirectory() as directory:
+
+        def extract(item):
+            # engines keep the current extraction, so each worker thread gets its own
+            if not hasattr(engines, "engine"):
+                engines.engine = BraindumpEngine(database_file_path=os.path.join(directory, f"database_{threading.get_ident()}.csv"),
+                                                 categories_file_path=os.path.join(directory, f"categories_{threading.get_ident()}.csv"),
+                                                 default_categories=categories, gpt_engine=model, gpt_temperature=temperature,
+                                                 extraction_mode=mode, extraction_prompt_variant=variant, gpt_client=client)
+            start = time.perf_counter()
+            extracted_tuples = engines.engine.extract_facts(item["utterance"])
+            return extracted_tuples, time.perf_counter() - start
+
+        usage_before = client.usage_recorder.snapshot()["sessions"].get("default", {})
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            outcomes = list(executor.map(extract, corpus))
+        usage_after = client.usage_recorder.snapshot()["sessions"].get("default", {})
+
+    correct = dict.fromkeys(FIELDS, 0)
+    right_counts = 0
+    expected_facts = sum(len(item["expected"]) for item in corpus)
+    for item, (extracted_tuples, _) in zip(corpus, outcomes):
+        item_correct, right_count = score_extraction(extracted_tuples, item["expected"])
+        right_counts += 1 if right_count else 0
+        for field in FIELDS:
+            correct[field] += item_correct[field]
+
+    latencies = [seconds for _, seconds in outcomes]
+    tokens = sum(usage_after.get(name, 0) - usage_before.get(name, 0) for name in ["prompt_tokens", "completion_tokens"])
+    accuracy = {field: correct[field] / expected_facts for field in FIELDS}
+    return {"model": model, "temperature": temperature, "variant": variant, "mode": mode,
+            "accuracy": accuracy, "mean_accuracy": statistics.mean(accuracy.values()),
+            "fact_count_accuracy": right_counts / len(corpus),
+            "p50_seconds": percentile(latencies, 50), "p95_seconds": percentile(latencies, 95),
+            "tokens_per_utterance": tokens / len(corpus)}
+
+def evaluate(corpus, client, models, temperatures, variants=["full"], modes=["tuples"], max_workers=8):
+    """
+    Evaluates all the combinations of the given models, temperatures, prompt variants and extraction modes.
+    """
+    return [evaluate_configuration(corpus, client, model, temperature, variant, mode, max_workers=max_workers)
+            for model, temperature, variant, mode in itertools.product(models, temperatures, variants, modes)]
+
+def fastest_meeting_bar(results, accuracy_bar):
+    """
+    Returns the configuration with the lowest p95 latency among those whose mean accuracy meets the bar, or None.
+    """
+    eligible = [result for result in results if result["mean_accuracy"] >= accuracy_bar]
+    return min(eligible, key=lambda result: result["p95_seconds"]) if len(eligible) > 0 else None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Evaluates the facts extraction accuracy, latency and tokens per configuration.")
+    parser.add_argument("--corpus", default="tests/gpt-3.5-turbo/data/labeled_utterances.jsonl")
+    parser.add_argument("--models", nargs="+", default=["gpt-3.5-turbo"])
+    parser.add_argument("--temperatures", type=float, nargs="+", default=[0.1])
+    parser.add_argument("--variants", nargs="+", default=["full"], choices=BraindumpPreprocessor.EXTRACTION_PROMPT_VARIANTS)
+    parser.add_argument("--modes", nargs="+", default=["tuples"], choices=BraindumpEngine.EXTRACTION_MODES)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--accuracy-bar", type=float, default=0.9)
+    parser.add_argument("--fake", action="store_true", help="Uses a fake model, to check the harness without spending credits.")
+    args = parser.parse_args()
+
+    if args.fake:
+        from fakes import FakeCompletionClient
+        client = FakeCompletionClient(latency_seconds=0.05, latency_jitter_seconds=0.05)
+    else:
+        client = ChatCompletionClient(openai_key=os.getenv("OPENAI_API_KEY"))
+
+    results = evaluate(load_corpus(args.corpus), client, args.models, args.temperatures, args.variants, args.modes, args.workers)
+
+    print(f"{'model':<16}{'temp':>6}{'variant':>11}{'mode':>8}" + "".join(f"{field:>10}" for field in FIELDS) +
+          f"{'mean':>8}{'p50 s':>8}{'p95 s':>8}{'tokens':>8}")
+    for result in results:
+        print(f"{result['model']:<16}{result['temperature']:>6.1f}{result['variant']:>11}{result['mode']:>8}" +
+              "".join(f"{result['accuracy'][field]:>10.0%}" for field in FIELDS) +
+              f"{result['mean_accuracy']:>8.0%}{result['p50_seconds']:>8.2f}{result['p95_seconds']:>8.2f}{result['tokens_per_utterance']:>8.0f}")
+
+    best = fastest_meeting_bar(results, args.accuracy_bar)
+    if best is not None:
+        print(f"\nFastest configuration with at least {args.accuracy_bar:.0%} accuracy: "
+              f"{best['model']}, temperature {best['temperature']}, {best['variant']} prompt, {best['mode']} mode.")
+    else:
+        print(f"\nNo configuration reaches {args.accuracy_bar:.0%} accuracy.")
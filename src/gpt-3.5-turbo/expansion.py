@@ -0,0 +1,118 @@
+"""
+Index-time semantic expansion. Instead of asking the model for the synonyms of the terms of every query, the facts
+are expanded when they are committed: the synonyms of their terms are asked once (see `synonyms.py`), and an index
+maps the normal forms of their terms (lowercased and singular, e.g. "diaper" for "Diapers"), of their categories
+and of the synonyms of both, to the row positions of the facts. A query then finds the facts of its terms' synonyms
+with a local lookup, without any model call.
+"""
+import re
+
+from synonyms import terms_of, normalize_term
+
+EXPANSION_COLUMNS = ["Category", "Key", "Value", "People"]
+
+_WORD_PATTERN = re.compile(r"[^\W\d_]+")
+
+def singular(word):
+    """
+    A rough singular form of an English word, good enough to match "diapers" with "diaper" or "boxes" with "box".
+    """
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 4 and word.endswith(("sses", "shes", "ches", "xes", "zes")):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+def normal_form(term):
+    return " ".join(singular(word) for word in normalize_term(term).split())
+
+
+class ExpansionIndex:
+    """
+    Maps the normal forms of the terms of the facts to the row positions of the facts containing them, and the normal
+    forms of terms to those of their synonyms, both ways. Synonyms can be added at any time: they expand the facts
+    already indexed too.
+    """
+
+    def __init__(self):
+        self._positions = {}
+        self._expansions = {}
+
+    @classmethod
+    def from_batches(cls, batches, synonyms=()):
+        """
+        Builds the index from DataFrames of facts indexed by their row positions (e.g., `FactStore.iter_batches`),
+        and (term, synonyms) pairs (e.g., `SynonymTable.items`).
+        """
+        index = cls()
+        index.add_synonyms(dict(synonyms))
+        for batch in batches:
+            index.add_dataframe(batch)
+        return index
+
+    def add_dataframe(self, df):
+        import numpy as np
+        import pandas as pd
+
+        # the terms of each distinct value are found once, and numbers do not make values distinct
+        new_positions = {}
+        for column in EXPANSION_COLUMNS:
+            if column not in df.columns:
+                continue
+            # missing values are replaced before the conversion, which would otherwise turn them into "nan"
+            values = df[column].astype("object").fillna("").astype(str).str.replace(r"[0-9]+", " ", regex=True)
+            codes, distinct_values = pd.factorize(values.to_numpy())
+            rows = df.index.to_numpy(dtype="int64")[np.argsort(codes, kind="stable")]
+            ends = np.cumsum(np.bincount(codes, minlength=len(distinct_values)))
+            start = 0
+            for value, end in zip(distinct_values, ends.tolist()):
+                for term in terms_of(value):
+                    new_positions.setdefault(normal_form(term), []).append(rows[start:end])
+                start = end
+
+        for term, positions in new_positions.items():
+            positions = np.unique(np.concatenate(positions))
+            self._positions[term] = np.union1d(self._positions[term], positions) if term in self._positions else positions
+
+    def add_synonyms(self, synonyms):
+        """
+        Adds synonyms, given as a dictionary from terms to lists of synonyms.
+        """
+        for term, term_synonyms in synonyms.items():
+            term = normal_form(term)
+            for synonym in term_synonyms:
+                synonym = normal_form(synonym)
+                if len(synonym) > 0 and synonym != term:
+                    # replaced rather than updated, as queries may be reading them
+                    self._expansions[synonym] = self._expansions.get(synonym, frozenset()) | {term}
+                    self._expansions[term] = self._expansions.get(term, frozenset()) | {synonym}
+
+    def search(self, term):
+        """
+        Returns the (sorted) row positions of the facts containing the term or one of its synonyms, once normalized,
+        or all the words of the term (or their synonyms).
+        """
+        import numpy as np
+        term = normal_form(term)
+        positions = self._lookup(term)
+        words = _WORD_PATTERN.findall(term)
+        if len(words) > 1:
+            words_positions = None
+            for word in words:
+                word_positions = self._lookup(word)
+                words_positions = word_positions if words_positions is None else np.intersect1d(words_positions, word_positions)
+                if len(words_positions) == 0:
+                    break
+            positions = np.union1d(positions, words_positions)
+        return positions
+
+    def _lookup(self, term):
+        import numpy as np
+        terms = {term} | self._expansions.get(term, frozenset())
+        positions = [self._positions[expanded_term] for expanded_term in terms if expanded_term in self._positions]
+        return np.unique(np.concatenate(positions)) if len(positions) > 0 else np.array([], dtype="int64")
+
+    def __len__(self):
+        return len(self._positions)
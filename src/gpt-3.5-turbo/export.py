@@ -0,0 +1,199 @@
+"""
+Streaming export of query results. Files are produced as a generator of byte blocks, from the results read in
+chunks (e.g., from a `FactCursor`), so that memory does not depend on the size of the exported data.
+"""
+import gzip
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+from storage import FACT_COLUMNS
+
+# file type -> (file extension, MIME type)
+EXPORT_FORMATS = {
+    "csv": ("csv", "text/csv"),
+    "tsv": ("tsv", "text/tsv"),
+    "csv.gz": ("csv.gz", "application/gzip"),
+    "jsonl": ("jsonl", "application/jsonl"),
+    "parquet": ("parquet", "application/vnd.apache.parquet"),
+    # MIME type from: https://docs.microsoft.com/en-us/archive/blogs/vsofficedeveloper/office-2007-file-format-mime-types-for-http-content-streaming-2
+    "excel": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+}
+
+def iter_export(chunks, file_type="csv"):
+    """
+    Exports the DataFrames in `chunks` as a single file of the specified type (see `EXPORT_FORMATS`), yielding its bytes
+    block by block. Like the former in-memory export, the index of the facts is kept in the CSV, TSV and Excel files.
+    """
+    exporters = {"csv": lambda chunks: _iter_delimited(chunks, ","),
+                 "tsv": lambda chunks: _iter_delimited(chunks, "\t"),
+                 "csv.gz": _iter_gzip_csv,
+                 "jsonl": _iter_jsonl,
+                 "parquet": _iter_parquet,
+                 "excel": _iter_excel}
+    if file_type not in exporters:
+        raise ValueError("Invalid file type.")
+    return exporters[file_type](iter(chunks))
+
+def export_to_file(chunks, path, file_type="csv"):
+    """
+    Exports the DataFrames in `chunks` to the specified file. Returns the number of bytes written.
+    """
+    size = 0
+    with open(path, "wb") as f:
+        for block in iter_export(chunks, file_type):
+            f.write(block)
+            size += len(block)
+    return size
+
+class ExportCache:
+    """
+    Keeps the most recently used exported files, up to `max_bytes` in total, evicting the least recently used ones
+    first. Files larger than `max_entry_bytes` are never kept. Safe to share between threads (i.e., app sessions).
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, max_entry_bytes=None):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes if max_entry_bytes is not None else max_bytes // 4
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+            return data
+
+    def put(self, key, data):
+        if len(data) > self.max_entry_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._size -= len(self._entries.pop(key))
+            self._entries[key] = data
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def size(self):
+        return self._size
+
+    def __len__(self):
+        return len(self._entries)
+
+def _iter_delimited(chunks, sep):
+    import pandas as pd
+    header = True
+    for chunk in chunks:
+        yield chunk.to_csv(sep=sep, header=header).encode("utf-8")
+        header = False
+    if header: # no chunks at all
+        yield pd.DataFrame(columns=FACT_COLUMNS).to_csv(sep=sep).encode("utf-8")
+
+def _iter_gzip_csv(chunks):
+    compressor = _GzipStream()
+    for block in _iter_delimited(chunks, ","):
+        yield compressor.compress(block)
+    yield compressor.flush()
+
+def _iter_jsonl(chunks):
+    for chunk in chunks:
+        if len(chunk) > 0:
+            yield chunk.to_json(orient="records", lines=True, force_ascii=False).rstrip("\n").encode("utf-8") + b"\n"
+
+def _iter_parquet(chunks):
+    import pyarrow as pa
+    from pyarrow import parquet
+
+    sink = _BlockSink()
+    schema = pa.schema([(column, pa.large_string()) for column in FACT_COLUMNS])
+    with parquet.ParquetWriter(sink, schema) as writer:
+        for chunk in chunks:
+            # each chunk becomes a row group, which is written (and handed out) as soon as it is complete
+            writer.write_table(pa.Table.from_pandas(chunk[FACT_COLUMNS].astype("string"), schema=schema, preserve_index=False))
+            yield sink.drain()
+    yield sink.drain()
+
+def _iter_excel(chunks, block_size=1024 * 1024):
+    import pandas as pd
+    import xlsxwriter
+
+    # in constant memory mode, rows are flushed to disk as they are written, and the workbook is only assembled on close
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "export.xlsx")
+        workbook = xlsxwriter.Workbook(path, {"constant_memory": True, "tmpdir": directory})
+        worksheet = workbook.add_worksheet()
+        bold = workbook.add_format({"bold": True})
+
+        worksheet.write_row(0, 1, FACT_COLUMNS, bold)
+        row = 1
+        for chunk in chunks:
+            for index, values in zip(chunk.index, chunk[FACT_COLUMNS].itertuples(index=False, name=None)):
+                worksheet.write(row, 0, int(index), bold)
+                worksheet.write_row(row, 1, ["" if pd.isna(value) else value for value in values])
+                row += 1
+        workbook.close()
+
+        with open(path, "rb") as f:
+            while True:
+                block = f.read(block_size)
+                if len(block) == 0:
+                    break
+                yield block
+
+class _BlockSink:
+    """
+    A write-only file that keeps what was written only until it is drained.
+    """
+
+    closed = False
+
+    def __init__(self):
+        self._blocks = []
+        self._position = 0
+
+    def write(self, data):
+        self._blocks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def drain(self):
+        data = b"".join(self._blocks)
+        self._blocks = []
+        return data
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+class _GzipStream:
+    """
+    Incremental gzip compression, producing a standard .gz file.
+    """
+
+    def __init__(self):
+        self._sink = _BlockSink()
+        self._file = gzip.GzipFile(fileobj=self._sink, mode="wb")
+
+    def compress(self, data):
+        self._file.write(data)
+        return self._sink.drain()
+
+    def flush(self):
+        self._file.close()
+        return self._sink.drain()
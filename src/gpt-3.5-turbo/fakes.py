@@ -0,0 +1,87 @@
+"""
+A fake completion client that can replace `ChatCompletionClient` in the engine, so that it can be exercised
+(e.g., in benchmarks) without calling the model API or spending credits.
+"""
+import json
+import random
+import re
+import time
+import zlib
+
+from telemetry import UsageRecorder
+
+class FakeCompletionClient:
+    """
+    Returns deterministic, canned completions for the engine's prompts, optionally after a simulated latency.
+    Responses can be given explicitly, mapping a substring of the prompt to the completion; otherwise,
+    plausible completions are synthesized from the prompt itself (e.g., one fact per comma-separated item).
+    """
+
+    CATEGORIES = ["Family", "Work", "Friends", "Shopping", "Health", "Finance", "Travel", "Home", "Pets", "Hobbies", "Other"]
+
+    def __init__(self, responses=None, latency_seconds=0.0, latency_jitter_seconds=0.0, seed=0, usage_recorder=None):
+        self.responses = responses if responses is not None else {}
+        self.latency_seconds = latency_seconds
+        self.latency_jitter_seconds = latency_jitter_seconds
+        self.usage_recorder = usage_recorder if usage_recorder is not None else UsageRecorder()
+        self._random = random.Random(seed)
+        self.calls = 0
+
+    def complete(self, user_prompt, model='gpt-3.5-turbo', response_format=None, **kwargs):
+        self.calls += 1
+        with self.usage_recorder.timed_call(model) as call:
+            if self.latency_seconds > 0 or self.latency_jitter_seconds > 0:
+                time.sleep(self.latency_seconds + self._random.uniform(0, self.latency_jitter_seconds))
+
+            completion = self._completion_for(user_prompt, response_format)
+
+            # rough token estimate, about 4 characters per token
+            call["prompt_tokens"] = len(user_prompt) // 4
+            call["completion_tokens"] = len(completion) // 4
+
+        return completion
+
+    def _completion_for(self, prompt, response_format):
+        for prompt_part, completion in self.responses.items():
+            if prompt_part in prompt:
+                return completion
+
+        if "Extract the main entities" in prompt:
+            query = re.search(r'sentence: "(.*)"', prompt).group(1)
+            return "\n".join(word for word in re.findall(r"\w+", query) if len(word) > 3) or query
+
+        elif "List some synonyms for each" in prompt:
+            terms = re.search(r"Terms:\n(.*)\nSynonyms:", prompt, re.DOTALL).group(1).split("\n")
+            return "\n".join(f"{term[2:]}: {term[2:]}s; {term[2:]} item" for term in terms)
+
+        elif "List some synonyms" in prompt:
+            term = re.search(r'term: "(.*)"', prompt).group(1)
+            return f"{term}s\n{term.lower()}\n- {term} item"
+
+        else:
+            utterance = self._utterance_in(prompt)
+            return self._facts_for(utterance, json_mode=response_format is not None)
+
+    def _utterance_in(self, prompt):
+        lines = [line for line in prompt.strip().split("\n") if len(line.strip()) > 0]
+        last_line = lines[-1]
+        if last_line.startswith("Input: "):
+            return last_line[len("Input: "):]
+        return last_line.strip('"-> ')
+
+    def _facts_for(self, utterance, json_mode):
+        # the category is chosen deterministically from the utterance, so repeated runs produce the same facts
+        category = self.CATEGORIES[zlib.crc32(utterance.encode("utf-8")) % len(self.CATEGORIES)]
+        if ":" in utterance:
+            key, values = utterance.split(":", 1)
+            facts = [(category, "List", "", key.strip(), value.strip()) for value in values.split(",") if len(value.strip()) > 0]
+        elif "=" in utterance:
+            key, value = utterance.split("=", 1)
+            facts = [(category, "Note", "", key.strip(), value.strip())]
+        else:
+            facts = [(category, "Note", "", utterance, "")]
+
+        if json_mode:
+            return json.dumps({"facts": [dict(zip(["category", "type", "people", "key", "value"], fact)) for fact in facts]})
+        else:
+            return "\n".join("(" + ", ".join(json.dumps(field) for field in fact) + ")" for fact in facts)
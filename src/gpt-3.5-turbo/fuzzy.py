@@ -0,0 +1,144 @@
+"""
+Typo-tolerant search. A trigram index over the words of the facts (in their Key, Value and People) finds the words
+that look like a misspelled term, e.g. "pediatrician" for "pedatrician": candidate words sharing enough trigrams
+with the term are found through the index, then verified by their edit similarity, and mapped to the row positions
+of the facts containing them.
+"""
+import difflib
+import re
+from collections import Counter
+
+FUZZY_COLUMNS = ["Key", "Value", "People"]
+
+_WORD_PATTERN = re.compile(r"\w+")
+
+def words_of(text):
+    return _WORD_PATTERN.findall(text.lower())
+
+def trigrams(word):
+    """
+    The trigrams of a word, padded so that its beginning and end count too.
+    """
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TrigramIndex:
+    """
+    Maps the words of the facts to the row positions of the facts containing them, and trigrams to words.
+    Words shorter than `min_word_length` are only matched exactly, as too few of their trigrams would remain with a typo.
+    """
+
+    def __init__(self, threshold=0.4, min_similarity=0.8, min_word_length=4):
+        self.threshold = threshold
+        self.min_similarity = min_similarity
+        self.min_word_length = min_word_length
+        self._positions = {}
+        self._trigrams = {}
+
+    @classmethod
+    def from_batches(cls, batches, **options):
+        """
+        Builds the index from DataFrames of facts indexed by their row positions (e.g., `FactStore.iter_batches`).
+        """
+        index = cls(**options)
+        for batch in batches:
+            index.add_dataframe(batch)
+        return index
+
+    def add_dataframe(self, df):
+        import numpy as np
+        import pandas as pd
+
+        # each distinct value is split in words only once, then (word, row) pairs are expanded from (word, value) pairs
+        pair_words, pair_rows = [], []
+        for column in FUZZY_COLUMNS:
+            if column not in df.columns:
+                continue
+            codes, values = pd.factorize(df[column].astype("object").fillna("").to_numpy())
+            rows = df.index.to_numpy(dtype="int64")[np.argsort(codes, kind="stable")]
+            counts = np.bincount(codes, minlength=len(values))
+            starts = np.cumsum(counts) - counts
+
+            value_words = pd.Series(values, dtype="object").str.lower().str.findall(_WORD_PATTERN).explode().dropna()
+            value_codes = value_words.index.to_numpy(dtype="int64")
+            lengths = counts[value_codes]
+            offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+            pair_words.append(np.repeat(value_words.to_numpy(), lengths))
+            pair_rows.append(rows[np.repeat(starts[value_codes], lengths) + offsets])
+
+        word_codes, words = pd.factorize(np.concatenate(pair_words)) if len(pair_words) > 0 else ([], [])
+        if len(words) == 0:
+            return
+        pair_words = word_codes
+        pair_rows = np.concatenate(pair_rows)
+
+        # sorted by word, then row, without duplicates (a word in several columns of a fact)
+        order = np.lexsort((pair_rows, pair_words))
+        pair_words, pair_rows = pair_words[order], pair_rows[order]
+        distinct = np.ones(len(pair_words), dtype=bool)
+        distinct[1:] = (pair_words[1:] != pair_words[:-1]) | (pair_rows[1:] != pair_rows[:-1])
+        pair_words, pair_rows = pair_words[distinct], pair_rows[distinct]
+
+        ends = np.cumsum(np.bincount(pair_words, minlength=len(words)))
+        start = 0
+        for word, end in zip(words, ends.tolist()):
+            self._add_word(word, pair_rows[start:end])
+            start = end
+
+    def add(self, position, fact):
+        """
+        Adds one fact, given as a dictionary (or Series) of column values, at the specified row position.
+        """
+        import numpy as np
+        for column in FUZZY_COLUMNS:
+            value = fact.get(column)
+            if isinstance(value, str):
+                for word in words_of(value):
+                    self._add_word(word, np.array([position], dtype="int64"))
+
+    def _add_word(self, word, positions):
+        # positions are sorted and unique
+        import numpy as np
+        if word not in self._positions:
+            self._positions[word] = positions
+            for trigram in trigrams(word):
+                self._trigrams.setdefault(trigram, []).append(word)
+        else:
+            self._positions[word] = np.union1d(self._positions[word], positions)
+
+    def similar_words(self, word):
+        """
+        Returns the indexed words similar to `word` (including itself, if indexed), from the most to the least similar.
+        """
+        word = word.lower()
+        if len(word) < self.min_word_length:
+            return [word] if word in self._positions else []
+
+        # candidates share enough trigrams with the word (Jaccard similarity of their trigrams)...
+        word_trigrams = trigrams(word)
+        shared = Counter(candidate for trigram in word_trigrams for candidate in self._trigrams.get(trigram, []))
+        candidates = [candidate for candidate, count in shared.items()
+                      if count / (len(word_trigrams) + len(candidate) + 1 - count) >= self.threshold]
+
+        # ... and are verified by their edit similarity
+        similarities = [(difflib.SequenceMatcher(None, word, candidate).ratio(), candidate) for candidate in candidates]
+        return [candidate for similarity, candidate in sorted(similarities, reverse=True) if similarity >= self.min_similarity]
+
+    def search(self, term):
+        """
+        Returns the (sorted) row positions of the facts that contain a word similar to each word of the term.
+        """
+        import numpy as np
+        positions = None
+        for word in words_of(term):
+            similar_words = self.similar_words(word)
+            word_positions = np.unique(np.concatenate([self._positions[similar_word] for similar_word in similar_words])) \
+                             if len(similar_words) > 0 else np.array([], dtype="int64")
+            positions = word_positions if positions is None else np.intersect1d(positions, word_positions)
+            if len(positions) == 0:
+                break
+        return positions if positions is not None else np.array([], dtype="int64")
+
+    def __len__(self):
+        return len(self._positions)
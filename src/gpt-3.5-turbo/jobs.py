@@ -0,0 +1,109 @@
+"""
+Background facts extraction. Utterances are submitted to a queue, which returns a job id immediately and runs the
+extractions in a pool of worker threads. Finished extractions wait in a per-user staging area until they are
+committed or cancelled, so that a user can dump several notes in a row without waiting for the model.
+"""
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+class ExtractionJob:
+    """
+    One facts extraction, from the moment it is submitted until it is committed or cancelled.
+    """
+
+    STATUSES = ["queued", "running", "done", "failed"]
+
+    def __init__(self, job_id, user, utterance):
+        self.job_id = job_id
+        self.user = user
+        self.utterance = utterance
+        self.status = "queued"
+        self.facts = None
+        self.rejected_lines = []
+        self.error = None
+        self.submitted_at = time.time()
+        self.finished_at = None
+        self._finished = threading.Event()
+
+    def is_finished(self):
+        return self.status in ["done", "failed"]
+
+    def wait(self, timeout=None):
+        """
+        Blocks until the job is finished (or the timeout, in seconds, expires). Returns whether it is finished.
+        """
+        return self._finished.wait(timeout)
+
+    def to_dict(self):
+        return {"job_id": self.job_id, "user": self.user, "utterance": self.utterance, "status": self.status,
+                "facts": self.facts, "rejected_lines": self.rejected_lines, "error": self.error,
+                "submitted_at": self.submitted_at, "finished_at": self.finished_at}
+
+
+class ExtractionQueue:
+    """
+    Runs `extract(utterance, user, **options)`, which must return the extracted facts and the rejected lines, for 
+    each submitted utterance in a pool of `max_workers` threads. Jobs stay in the staging area of their user,
+    whatever their status, until they are taken out of it.
+    """
+
+    def __init__(self, extract, max_workers=4):
+        self._extract = extract
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="extraction")
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def submit(self, utterance, user="default", **options):
+        """
+        Queues the extraction of the facts in `utterance`, and returns the id of its job.
+        """
+        with self._lock:
+            job = ExtractionJob(f"job-{next(self._ids)}", user, utterance)
+            self._jobs[job.job_id] = job
+        self._executor.submit(self._run, job, options)
+        return job.job_id
+
+    def _run(self, job, options):
+        job.status = "running"
+        try:
+            job.facts, job.rejected_lines = self._extract(job.utterance, job.user, **options)
+            job.status = "done"
+        except Exception as e:
+            logging.exception(f"Extraction job {job.job_id} failed.")
+            job.error = str(e)
+            job.status = "failed"
+        job.finished_at = time.time()
+        job._finished.set()
+
+    def job(self, job_id):
+        """
+        Returns the job with the specified id. Raises KeyError if it is unknown or was taken out of the staging area.
+        """
+        with self._lock:
+            return self._jobs[job_id]
+
+    def staged(self, user="default"):
+        """
+        Returns the jobs in the staging area of the specified user, in submission order.
+        """
+        with self._lock:
+            return [job for job in self._jobs.values() if job.user == user]
+
+    def take(self, job_id, status=None):
+        """
+        Takes a job out of the staging area (e.g., to commit or cancel it) and returns it. With a status, the job is
+        only taken if it has that status, and ValueError is raised otherwise. Raises KeyError if the job is unknown
+        or was already taken, so that each job is taken once.
+        """
+        with self._lock:
+            job = self._jobs[job_id]
+            if status is not None and job.status != status:
+                raise ValueError(f"Extraction job {job_id} is {job.status}, not {status}.")
+            return self._jobs.pop(job_id)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,99 @@
+"""
+Matching of the search terms in the facts. The terms of a query (original and augmented) are compiled once into a
+multi-pattern matcher, which scans each value in a single pass whatever the number of terms, and reports which terms
+it contains. Terms are literals: characters such as "(" or "+" in a synonym have no special meaning.
+"""
+import re
+from collections import deque
+
+class TermMatcher:
+    """
+    An Aho-Corasick automaton over the (lowercased) terms. Matches are reported as bit masks of term indexes,
+    see `terms_of`. To scan whole columns, `match_dataframe` first finds the rows containing any of the terms with
+    Arrow's regular expressions engine (RE2, whose automata also run in linear time), then runs the automaton
+    only once per distinct value of these rows.
+    """
+
+    def __init__(self, terms):
+        self.terms = list(dict.fromkeys(term.strip().lower() for term in terms if len(term.strip()) > 0))
+        self._pattern = "|".join(re.escape(term) for term in self.terms)
+
+        # trie of the terms, with the terms ending at each state
+        self._transitions = [{}]
+        self._outputs = [0]
+        for i, term in enumerate(self.terms):
+            state = 0
+            for character in term:
+                next_state = self._transitions[state].get(character)
+                if next_state is None:
+                    next_state = len(self._transitions)
+                    self._transitions.append({})
+                    self._outputs.append(0)
+                    self._transitions[state][character] = next_state
+                state = next_state
+            self._outputs[state] |= 1 << i
+
+        # failure links (the longest proper suffix that is also in the trie), in breadth-first order, so that
+        # the terms ending at a state include those ending at its suffixes
+        self._failures = [0] * len(self._transitions)
+        queue = deque(self._transitions[0].values())
+        while len(queue) > 0:
+            state = queue.popleft()
+            for character, next_state in self._transitions[state].items():
+                queue.append(next_state)
+                failure = self._failures[state]
+                while failure != 0 and character not in self._transitions[failure]:
+                    failure = self._failures[failure]
+                self._failures[next_state] = self._transitions[failure].get(character, 0)
+                self._outputs[next_state] |= self._outputs[self._failures[next_state]]
+
+    def find(self, text):
+        """
+        Returns the bit mask of the terms contained in the text (0 if none).
+        """
+        transitions, failures, outputs = self._transitions, self._failures, self._outputs
+        state = 0
+        found = 0
+        for character in text.lower():
+            while state != 0 and character not in transitions[state]:
+                state = failures[state]
+            state = transitions[state].get(character, 0)
+            found |= outputs[state]
+        return found
+
+    def terms_of(self, found):
+        return [term for i, term in enumerate(self.terms) if found >> i & 1]
+
+    def match_dataframe(self, df):
+        """
+        Returns, for each row of a DataFrame of strings, the bit mask of the terms found in any of its columns (as a
+        NumPy array of ints). Missing values contain no terms.
+        """
+        import numpy as np
+        # bit masks are Python ints when there are too many terms for 64 bits
+        found = np.zeros(len(df), dtype=np.int64 if len(self.terms) < 63 else object)
+        for column in df.columns:
+            rows, column_found = self._match_column(df[column])
+            found[rows] |= column_found.astype(found.dtype)
+        return found
+
+    def match_series(self, series):
+        return self.match_dataframe(series.to_frame())
+
+    def _match_column(self, series):
+        # the rows containing any of the terms, and the bit masks of the terms they contain
+        import numpy as np
+        import pandas as pd
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        if len(self.terms) == 0 or len(series) == 0:
+            return np.array([], dtype=np.int64), np.array([], dtype=object)
+
+        # Arrow-backed strings are scanned without copies
+        values = pa.array(series.array) if hasattr(series.array, "__arrow_array__") \
+                 else pa.array(series.to_numpy(dtype=object), type=pa.string(), from_pandas=True)
+        rows = np.flatnonzero(pc.fill_null(pc.match_substring_regex(values, self._pattern, ignore_case=True), False)
+                              .to_numpy(zero_copy_only=False))
+        codes, distinct_values = pd.factorize(values.take(pa.array(rows)).to_numpy(zero_copy_only=False))
+        return rows, np.array([self.find(value) for value in distinct_values] + [0], dtype=object)[codes]
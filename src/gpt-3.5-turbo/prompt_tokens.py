@@ -0,0 +1,104 @@
+"""
+Offline token accounting for the facts extraction prompt variants. For each variant, reports the prompt and
+completion tokens over a corpus of labeled utterances, so that the cheapest variant that keeps the desired
+accuracy can be chosen. No model is called: completion tokens are estimated from the expected facts.
+
+Usage (from the root of the project):
+
+    python src/gpt-3.5-turbo/prompt_tokens.py --corpus tests/gpt-3.5-turbo/data/labeled_utterances.jsonl
+"""
+import argparse
+import json
+import re
+
+from engine import BraindumpPreprocessor
+
+DEFAULT_CATEGORIES = ["Family", "Work", "Friends", "Shopping", "Health",
+                      "Finance", "Travel", "Home", "Pets", "Hobbies", "Other"]
+
+# Chat Completion requests carry a few tokens of overhead per message, plus the priming of the reply.
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_REPLY = 3
+
+class TokenCounter:
+    """
+    Counts tokens with the model's own tokenizer if `tiktoken` is installed and its encoding is available
+    locally. Otherwise, falls back to an approximation (words, numbers and punctuation, with long words
+    split every 4 characters), which is close enough to compare prompt variants with each other.
+    """
+
+    _APPROXIMATE_TOKEN_PATTERN = re.compile(r"\s?[A-Za-z]{1,4}|\s?\d{1,3}|\s?[^\sA-Za-z\d]|\s+")
+
+    def __init__(self, model="gpt-3.5-turbo"):
+        self.encoding = None
+        try:
+            import tiktoken
+            self.encoding = tiktoken.encoding_for_model(model)
+            self.name = f"tiktoken ({self.encoding.name})"
+        except Exception: # not installed, or the encoding cannot be loaded offline
+            self.name = "approximate"
+
+    def count(self, text):
+        if self.encoding is not None:
+            return len(self.encoding.encode(text))
+        else:
+            return len(self._APPROXIMATE_TOKEN_PATTERN.findall(text))
+
+    def count_chat(self, user_prompt, system_message="You are an intelligent agent."):
+        """
+        Counts the tokens of a Chat Completion request with the given system and user messages.
+        """
+        return self.count(system_message) + self.count(user_prompt) + 2 * TOKENS_PER_MESSAGE + TOKENS_PER_REPLY
+
+
+def load_corpus(path):
+    """
+    Loads a labeled corpus, one JSON object per line with the "utterance" and its "expected" facts.
+    Ambiguous fields list all the valid options.
+    """
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if len(line.strip()) > 0]
+
+def expected_completion(expected_facts):
+    """
+    Renders the expected facts as the model would, taking the first option of ambiguous fields.
+    """
+    lines = []
+    for fact in expected_facts:
+        fields = [field[0] if isinstance(field, list) else field for field in fact]
+        lines.append("(" + ", ".join(json.dumps(field) for field in fields) + ")")
+    return "\n".join(lines)
+
+def token_report(corpus, counter, categories=DEFAULT_CATEGORIES, variants=BraindumpPreprocessor.EXTRACTION_PROMPT_VARIANTS):
+    """
+    Computes, for each prompt variant, the mean prompt, completion and total tokens per utterance.
+    """
+    preprocessor = BraindumpPreprocessor()
+    completion_tokens = [counter.count(expected_completion(item["expected"])) for item in corpus]
+
+    report = {}
+    for variant in variants:
+        prompt_tokens = [counter.count_chat(preprocessor.extraction_prompt(item["utterance"], categories, variant=variant))
+                         for item in corpus]
+        report[variant] = {"prompt_tokens": sum(prompt_tokens) / len(corpus),
+                           "completion_tokens": sum(completion_tokens) / len(corpus),
+                           "max_completion_tokens": max(completion_tokens),
+                           "total_tokens": (sum(prompt_tokens) + sum(completion_tokens)) / len(corpus)}
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Reports the tokens used by each extraction prompt variant.")
+    parser.add_argument("--corpus", default="tests/gpt-3.5-turbo/data/labeled_utterances.jsonl")
+    parser.add_argument("--model", default="gpt-3.5-turbo")
+    args = parser.parse_args()
+
+    counter = TokenCounter(args.model)
+    report = token_report(load_corpus(args.corpus), counter)
+
+    print(f"Tokenizer: {counter.name}")
+    print(f"{'variant':<12}{'prompt':>10}{'completion':>12}{'total':>10}{'savings':>10}")
+    baseline = report["full"]["total_tokens"]
+    for variant, tokens in report.items():
+        print(f"{variant:<12}{tokens['prompt_tokens']:>10.1f}{tokens['completion_tokens']:>12.1f}{tokens['total_tokens']:>10.1f}"
+              f"{1 - tokens['total_tokens'] / baseline:>10.0%}")
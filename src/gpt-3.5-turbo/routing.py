@@ -0,0 +1,62 @@
+"""
+Model routing. Each kind of prompt of the engine can be sent to its own model, with its own parameters: e.g., facts
+extraction to an accurate model, and the trivial prompts of the query path (terms extraction and augmentation) to a
+faster, cheaper one. A route can also list candidate models, and the model is then picked by its observed latency:
+
+    engine.model_routes = {"terms_extraction_prompt": {"candidates": ["gpt-4o-mini", "gpt-3.5-turbo"], "max_p95_seconds": 1.0},
+                           "terms_augmentation_prompt": {"engine": "gpt-4o-mini", "temperature": 0.0}}
+
+Prompt kinds without a route use the engine's `gpt_parameters`, so that their requests are the same as without routing.
+"""
+import time
+
+PROMPT_KINDS = ["extraction_prompt", "terms_extraction_prompt", "terms_augmentation_prompt", "terms_batch_augmentation_prompt"]
+
+# How long a failing model can be skipped at most, however many times in a row it failed
+MAX_ERROR_BACKOFF_SECONDS = 3600.0
+
+# The route options that are not model parameters (see `select_model`)
+ROUTE_OPTIONS = ["candidates", "max_p95_seconds"]
+
+def route_parameters(gpt_parameters, route, usage=None):
+    """
+    Returns the parameters of a request routed by `route` (a dictionary of `gpt_parameters` to override, and maybe
+    candidate models), in the same form as `gpt_parameters`.
+    """
+    unknown = set(route) - set(gpt_parameters) - set(ROUTE_OPTIONS)
+    if len(unknown) > 0:
+        raise ValueError(f"Invalid route options: {sorted(unknown)}.")
+    parameters = dict(gpt_parameters, **{name: value for name, value in route.items() if name not in ROUTE_OPTIONS})
+    if len(route.get("candidates", [])) > 0:
+        parameters["engine"] = select_model(route["candidates"], usage, route.get("max_p95_seconds"))
+    return parameters
+
+def select_model(candidates, usage, max_p95_seconds=None, q=95, error_backoff_seconds=30.0):
+    """
+    Picks one of the candidate models, given in order of preference (e.g., the cheapest first), by their latency
+    percentile in the usage recorder. Models whose last calls failed (e.g., a mistyped or inaccessible model) are
+    skipped for `error_backoff_seconds`, doubled after each failure in a row; if all the candidates are failing, the
+    one that failed the longest ago is tried. Otherwise, models without any latency yet are picked first, so that they
+    get one. Then, with a budget, the first model whose latency is within it is picked and, otherwise, the fastest one.
+    """
+    if usage is None:
+        return candidates[0]
+    errors = {model: usage.recent_errors(model) for model in candidates}
+    now = time.monotonic()
+    available = [model for model in candidates
+                 if errors[model][0] == 0 or now - errors[model][1] >= _backoff_seconds(errors[model][0], error_backoff_seconds)]
+    if len(available) == 0:
+        return min(candidates, key=lambda model: errors[model][1])
+
+    latencies = {model: usage.latency_percentile(model, q) for model in available}
+    for model in available:
+        if latencies[model] is None:
+            return model
+    if max_p95_seconds is not None:
+        for model in available:
+            if latencies[model] <= max_p95_seconds:
+                return model
+    return min(available, key=lambda model: latencies[model])
+
+def _backoff_seconds(consecutive_errors, error_backoff_seconds):
+    return min(error_backoff_seconds * 2 ** (consecutive_errors - 1), MAX_ERROR_BACKOFF_SECONDS)
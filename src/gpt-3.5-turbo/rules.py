@@ -0,0 +1,169 @@
+"""
+Rule-based facts extraction, for the utterances simple enough not to need the model: an email, phone number, URL
+or price assigned to something ("sales guy email = jp@example.com", "mom's phone is 555-555-5555"), a "key = value"
+note or a "key: a, b, c" list. Each extraction comes with a confidence, which mostly depends on whether the category
+of the facts could be told from their words; below a threshold, the model should be asked instead.
+"""
+import re
+
+EMAIL_PATTERN = re.compile(r"^[\w.+-]+@[\w-]+(\.[\w-]+)+$")
+PHONE_PATTERN = re.compile(r"^\+?\(?\d{1,4}\)?([ .-]?\(?\d{2,5}\)?){1,4}$")
+URL_PATTERN = re.compile(r"^(https?://|www\.)\S+$", re.IGNORECASE)
+PRICE_PATTERN = re.compile(r"^([$€£]|R\$|US\$)?\s?\d+([.,]\d+)*\s?(usd|eur|dollars?|euros?|bucks|reais)?$", re.IGNORECASE)
+
+# the words that name the field of a value, e.g. "sales guy email" is the email of the sales guy
+FIELD_WORDS = {"Email": ["email", "e-mail", "mail"],
+               "Phone": ["phone", "phone number", "number", "cell", "mobile", "telephone", "tel"],
+               "Price": ["price", "cost", "costs", "charges", "fee", "value"]}
+
+# the words that tell the category of a fact, by category
+CATEGORY_WORDS = {"Family": ["mom", "mother", "dad", "father", "wife", "husband", "son", "daughter", "kids", "baby",
+                             "grandma", "grandpa", "sister", "brother", "aunt", "uncle", "cousin", "family"],
+                  "Work": ["work", "office", "boss", "hr", "sales", "customer", "client", "colleague", "meeting",
+                           "company", "employee", "manager", "team", "project", "building administration"],
+                  "Friends": ["friend", "friends"],
+                  "Shopping": ["buy", "groceries", "grocery", "shopping", "store", "supermarket"],
+                  "Health": ["doctor", "pediatrician", "dentist", "pharmacy", "hospital", "clinic", "medicine",
+                             "aspirin", "ultrasound", "lab work", "health"],
+                  "Finance": ["bank", "stock", "stocks", "invest", "investment", "tax", "taxes", "salary", "loan"],
+                  "Travel": ["flight", "plane", "hotel", "trip", "travel", "passport", "airport"],
+                  "Home": ["home", "house", "rent", "landlord", "maid", "plumber", "electrician", "wifi", "apartment"],
+                  "Pets": ["dog", "cat", "vet", "pet", "pets"],
+                  "Hobbies": ["guitar", "piano", "hobby", "hobbies"]}
+
+MAX_SUBJECT_WORDS = 6
+MAX_VALUE_WORDS = 10
+
+_ASSIGNMENT_PATTERN = re.compile(r"^(?P<subject>[^=:]+?)\s*(?P<separator>=|:|\bis\b|\bare\b)\s*(?P<value>\S.*)$", re.IGNORECASE)
+_ITEM_SEPARATOR_PATTERN = re.compile(r"\s*(?:,|;|\band\b)\s*", re.IGNORECASE)
+
+class RuleExtraction:
+    """
+    The facts extracted by a rule, with the confidence in them (from 0 to 1).
+    """
+
+    def __init__(self, rule, facts, confidence):
+        self.rule = rule
+        self.facts = facts
+        self.confidence = confidence
+
+    def __repr__(self):
+        return f"RuleExtraction({self.rule!r}, {self.facts!r}, {self.confidence!r})"
+
+
+class RuleExtractor:
+    """
+    Extracts facts from the simplest utterances. Confidences are `high_confidence` when the category of the facts is
+    found in their words, and `low_confidence` otherwise (the category is then "Other"). Generic "key = value" notes,
+    which the model often types better, get a lower confidence than typed values and lists.
+    """
+
+    RULES = ["email", "phone", "url", "price", "list", "note"]
+
+    def __init__(self, high_confidence=0.9, low_confidence=0.5, note_penalty=0.1):
+        self.high_confidence = high_confidence
+        self.low_confidence = low_confidence
+        self.note_penalty = note_penalty
+
+    def extract(self, utterance, categories):
+        """
+        Returns the `RuleExtraction` of the utterance, with facts of the allowed categories, or None if no rule applies.
+        """
+        utterance = utterance.strip()
+        match = _ASSIGNMENT_PATTERN.match(utterance)
+        if "\n" in utterance or match is None:
+            return None
+        subject, separator, value = match.group("subject").strip(), match.group("separator").lower(), match.group("value").strip()
+        if len(subject.split()) > MAX_SUBJECT_WORDS or value.endswith("?"):
+            return None
+
+        fact_type, rule = self._value_type(subject, value)
+        if fact_type is not None:
+            people, key = self._people_and_key(subject, fact_type)
+            category = self._category(subject, value, categories)
+            return self._extraction(rule, [(category, fact_type, people, key, value)], category)
+
+        # untyped values are only lists ("key: a, b") and notes ("key = value"), as "is" is mostly used in sentences
+        if len(value.split()) > MAX_VALUE_WORDS:
+            return None
+        if separator == ":":
+            items = [item for item in _ITEM_SEPARATOR_PATTERN.split(value.rstrip(".")) if len(item) > 0]
+            # a single item is rather a reminder or an appointment (e.g., "dentist appointment: 3 pm") than a list
+            if len(items) < 2:
+                return None
+            category = self._category(subject, value, categories)
+            return self._extraction("list", [(category, "List", "", subject, item) for item in items], category)
+        if separator == "=":
+            people, key = self._people_and_key(subject, "Note")
+            category = self._category(subject, value, categories)
+            return self._extraction("note", [(category, "Note", people, key, value)], category, penalty=self.note_penalty)
+        return None
+
+    def _extraction(self, rule, facts, category, penalty=0.0):
+        confidence = (self.high_confidence if category != "Other" else self.low_confidence) - penalty
+        return RuleExtraction(rule, facts, round(confidence, 6))
+
+    @staticmethod
+    def _value_type(subject, value):
+        # the fact type and rule of a value that has a recognizable shape
+        if EMAIL_PATTERN.match(value):
+            return "Email", "email"
+        if URL_PATTERN.match(value):
+            return "Document", "url"
+        subject_words = set(_words(subject))
+        if PHONE_PATTERN.match(value) and 7 <= sum(character.isdigit() for character in value) <= 15:
+            # e.g., "employee number is 12345678" is not a phone number, but "mom's number is 555-1234" is
+            separated = re.search(r"\d[ .-]\d", value) is not None
+            if len(subject_words & (set(FIELD_WORDS["Phone"]) - {"number"})) > 0 or ("number" in subject_words and separated):
+                return "Phone", "phone"
+        if PRICE_PATTERN.match(value) and (len(subject_words & set(FIELD_WORDS["Price"])) > 0 or not value[0].isdigit()):
+            return "Price", "price"
+        return None, None
+
+    @staticmethod
+    def _people_and_key(subject, fact_type):
+        """
+        Splits the subject of a value into the people it belongs to and the key, e.g. "mom's phone" into "mom" and
+        "mom's phone". Contact details are assumed to belong to people, e.g. "sales guy email" is split into "sales guy"
+        and "email", and "email of the building administration" into "building administration" and "email".
+        """
+        possessive = re.match(r"^(?P<people>.+?)'s\s+(?P<field>.+)$", subject)
+        if possessive is not None:
+            return possessive.group("people"), subject
+        if subject.lower().startswith("my "):
+            return "", subject[3:]
+        if fact_type not in ["Email", "Phone"]:
+            return "", subject
+
+        of = re.match(r"^(?P<field>.+?)\s+of\s+(the\s+)?(?P<people>.+)$", subject, re.IGNORECASE)
+        if of is not None:
+            return of.group("people"), of.group("field")
+        words = subject.split()
+        for n in [2, 1]:
+            if len(words) > n and " ".join(words[-n:]).lower() in FIELD_WORDS[fact_type]:
+                return " ".join(words[:-n]), " ".join(words[-n:])
+        return "", subject
+
+    @staticmethod
+    def _category(subject, value, categories):
+        """
+        Returns the allowed category with the most (multi-)words in the subject and value, or "Other" if none or a tie.
+        Words of the subject count twice, e.g. "buy: diapers, baby cream" is about shopping more than about family.
+        """
+        subject_text, value_text = f" {' '.join(_words(subject))} ", f" {' '.join(_words(value))} "
+        allowed = {category.lower(): category for category in categories}
+        scores = {}
+        for category, words in CATEGORY_WORDS.items():
+            if category.lower() in allowed:
+                score = sum(len(word.split()) * (2 * (f" {word} " in subject_text) + (f" {word} " in value_text)) for word in words)
+                if score > 0:
+                    scores[allowed[category.lower()]] = score
+        if len(scores) == 0:
+            return allowed.get("other", "Other")
+        best = max(scores.values())
+        winners = [category for category, score in scores.items() if score == best]
+        return winners[0] if len(winners) == 1 else allowed.get("other", "Other")
+
+
+def _words(text):
+    return re.findall(r"[\w-]+", re.sub(r"'s\b", "", text.lower()))
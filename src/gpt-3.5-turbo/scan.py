@@ -0,0 +1,130 @@
+"""
+Parallel scan of large databases. The database is published once (per version) in shared memory, as an Arrow IPC
+stream, and split in row-range shards, which a pool of worker processes filter and search. Workers map the shared
+columns without copying them, and only send back the row positions of the matching facts, which are then merged.
+"""
+import atexit
+import logging
+import multiprocessing
+import threading
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+
+class SharedTable:
+    """
+    A DataFrame of strings, written once in a shared memory block as an Arrow IPC stream.
+    """
+
+    def __init__(self, df):
+        import pyarrow as pa
+        table = pa.Table.from_pandas(df, preserve_index=False)
+
+        sink = pa.MockOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        self._memory = shared_memory.SharedMemory(create=True, size=max(1, sink.size()))
+        with pa.ipc.new_stream(pa.FixedSizeBufferWriter(pa.py_buffer(self._memory.buf)), table.schema) as writer:
+            writer.write_table(table)
+
+        self.name = self._memory.name
+        self.num_rows = table.num_rows
+        self.size = sink.size()
+
+    def release(self):
+        self._memory.close()
+        self._memory.unlink()
+
+
+# The shared table a worker process last attached to, which stays mapped while it is searched
+_attached = {}
+
+def _attach(name):
+    import pyarrow as pa
+    if name not in _attached:
+        if len(_attached) == 0:
+            atexit.register(_detach)
+        _detach()
+        memory = shared_memory.SharedMemory(name=name)
+        table = pa.ipc.open_stream(pa.py_buffer(memory.buf)).read_all()
+        _attached[name] = (memory, table)
+    return _attached[name][1]
+
+def _detach():
+    # the table must be collected before its memory is closed
+    stale = [memory for memory, _ in _attached.values()]
+    _attached.clear()
+    for memory in stale:
+        try:
+            memory.close()
+        except BufferError:
+            pass # still referenced by a shard being converted, unmapped when collected
+
+def _scan_shard(name, start, stop, categories, entry_types, people, matcher, fuzzy_positions):
+    # runs in the worker processes: filters and searches the rows from `start` to `stop` of the shared table
+    import pandas as pd
+    from engine import BraindumpEngine
+
+    df = _attach(name).slice(start, stop - start).to_pandas(types_mapper=pd.ArrowDtype)
+    df.index = pd.RangeIndex(start, stop)
+    df = BraindumpEngine._filter_dataframe(df, categories, entry_types, people)
+    if matcher is not None:
+        df = df[BraindumpEngine._match_facts(df, matcher, fuzzy_positions)]
+    return df.index.to_numpy(dtype="int64")
+
+
+class ParallelScanner:
+    """
+    Filters and searches a database in row-range shards of at least `min_shard_size` facts, with `workers` processes.
+    The processes are started, and the database published, when first needed. The database is published again
+    whenever its version changes.
+    """
+
+    def __init__(self, workers, min_shard_size=50000):
+        self.workers = workers
+        self.min_shard_size = min_shard_size
+        self._executor = None
+        self._shared = None
+        self._shared_version = None
+        self._previous_shared = None
+        self._lock = threading.Lock()
+        # the shared memory must be released even if the scanner is not closed explicitly
+        self._finalizer = weakref.finalize(self, ParallelScanner._release, self.__dict__)
+
+    def scan(self, df, version, categories=None, entry_types=None, people=None, matcher=None, fuzzy_positions=None):
+        """
+        Returns the row positions of the facts of `df` that pass the filters and, if a `TermMatcher` is given,
+        contain its terms (or are at `fuzzy_positions`), in database order.
+        """
+        import numpy as np
+        with self._lock:
+            if self._executor is None:
+                # worker processes are spawned, as forking a process with threads (e.g., Streamlit's) is unsafe
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+            if self._shared_version != version:
+                # the previous version stays published until the next one, as scans may still be reading it
+                if self._previous_shared is not None:
+                    self._previous_shared.release()
+                self._previous_shared = self._shared
+                self._shared = SharedTable(df)
+                self._shared_version = version
+                logging.info(f"Published {self._shared.num_rows} facts ({self._shared.size} bytes) to the scan workers.")
+            shared = self._shared
+
+        shard_size = max(self.min_shard_size, -(-shared.num_rows // self.workers))
+        shards = [(start, min(start + shard_size, shared.num_rows)) for start in range(0, shared.num_rows, shard_size)]
+        futures = [self._executor.submit(_scan_shard, shared.name, start, stop, categories, entry_types, people,
+                                         matcher, fuzzy_positions) for start, stop in shards]
+        return np.concatenate([future.result() for future in futures] + [np.array([], dtype="int64")])
+
+    def close(self):
+        self._finalizer()
+
+    @staticmethod
+    def _release(state):
+        if state["_executor"] is not None:
+            state["_executor"].shutdown(wait=False, cancel_futures=True)
+        for shared in [state["_shared"], state["_previous_shared"]]:
+            if shared is not None:
+                shared.release()
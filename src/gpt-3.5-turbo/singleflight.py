@@ -0,0 +1,68 @@
+"""
+Coalescing of identical in-flight requests ("single flight"): while a request is running, callers with the same
+key wait for it and share its result (or its error), instead of repeating it.
+"""
+import hashlib
+import json
+import threading
+
+def request_key(user_prompt, model, **parameters):
+    """
+    Identifies a model request by its model, parameters and prompt.
+    """
+    request = dict(parameters, model=model, user_prompt=user_prompt)
+    request.pop("add_to_chat", None)
+    return hashlib.sha256(json.dumps(request, sort_keys=True).encode("utf-8")).hexdigest()
+
+class _Call:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """
+    A group of in-flight calls by key. Only completed calls are shared: nothing is cached after a call returns.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        """
+        Runs `fn()`, unless a call with the same key is already running, in which case waits for it and returns
+        its result. Returns the result and whether it was shared from another call.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
@@ -0,0 +1,645 @@
+"""
+Storage formats for the facts database. Besides the original CSV files, columnar formats are supported: Arrow IPC
+(Feather) files are memory-mapped when loaded, so opening even a very large database takes milliseconds, and
+Parquet files are written in row groups. Facts appended to either are written to their own segment files, so that
+commits do not rewrite the database. Partitioned databases are directories of Arrow IPC files, one per category 
+(and, optionally, per type), so that queries filtered by category only read the matching partitions. The format is 
+chosen by the file extension. Query results over a store can be read lazily, page by page, through cursors.
+
+To migrate an existing CSV database (from the root of the project):
+
+    python src/gpt-3.5-turbo/storage.py data/default_database.csv data/default_database.arrow
+    python src/gpt-3.5-turbo/storage.py data/default_database.csv data/default_database.parts --partition-by Category Type
+"""
+import argparse
+import copy
+import json
+import logging
+import os
+import re
+
+
+FACT_COLUMNS = ["Category", "Type", "People", "Key", "Value"]
+
+class FactStore:
+    """
+    Interface of the facts database storage formats. Besides loading and saving the whole database, stores can be
+    scanned in batches and read by row positions, so that queries do not need to hold the whole database in memory.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def load(self):
+        """
+        Loads the whole database as a DataFrame. Raises FileNotFoundError if it does not exist.
+        """
+        raise NotImplementedError()
+
+    def save(self, df):
+        raise NotImplementedError()
+
+    def append(self, df):
+        """
+        Adds the facts in `df` to the end of the database.
+        """
+        import pandas as pd
+        self.save(pd.concat([self.load(), df], ignore_index=True))
+
+    def count(self):
+        raise NotImplementedError()
+
+    def unique(self, column):
+        """
+        Returns the distinct values of the specified column.
+        """
+        raise NotImplementedError()
+
+    def iter_batches(self, batch_size=100000):
+        """
+        Scans the database in DataFrames of up to `batch_size` facts, indexed by their row positions in the database.
+        """
+        raise NotImplementedError()
+
+    def scan_batches(self, categories=None, entry_types=None, batch_size=100000):
+        """
+        Like `iter_batches`, but partitioned stores skip the partitions that cannot contain facts of the specified
+        categories and types (case-insensitively). Batches are not filtered: they may contain other facts too.
+        """
+        return self.iter_batches(batch_size)
+
+    def take(self, positions):
+        """
+        Reads the facts at the specified (sorted) row positions, in a DataFrame indexed by these positions.
+        """
+        raise NotImplementedError()
+
+    def take_chunks(self, positions, chunk_size=100000):
+        """
+        Reads the facts at the specified (sorted) row positions, in DataFrames of up to `chunk_size` facts indexed by
+        these positions.
+        """
+        for start in range(0, len(positions), chunk_size):
+            yield self.take(positions[start:start + chunk_size])
+
+    def _replace(self, write, path=None):
+        """
+        Writes the file (by default, the database file) through a temporary one, so that readers (and memory maps)
+        of the current file are never exposed to a partially written database.
+        """
+        path = path if path is not None else self.path
+        temporary_path = f"{path}.tmp"
+        write(temporary_path)
+        os.replace(temporary_path, path)
+
+
+class CsvFactStore(FactStore):
+    """
+    CSV files. They cannot be read by position, so each scan or read parses the file again, in chunks.
+    All columns are read as strings (or NaN, if empty), whatever their contents look like.
+    """
+
+    def load(self):
+        import pandas as pd
+        return pd.read_csv(self.path, dtype=str)
+
+    def save(self, df):
+        df.to_csv(self.path, index=False)
+
+    def append(self, df):
+        df[FACT_COLUMNS].to_csv(self.path, mode="a", header=not self.exists(), index=False)
+
+    def count(self):
+        import pandas as pd
+        return sum(len(chunk) for chunk in pd.read_csv(self.path, usecols=[0], chunksize=100000))
+
+    def unique(self, column):
+        import pandas as pd
+        return pd.read_csv(self.path, usecols=[column], dtype=str)[column].unique().tolist()
+
+    def iter_batches(self, batch_size=100000):
+        import pandas as pd
+        # chunks are indexed by their row positions in the whole file
+        for chunk in pd.read_csv(self.path, chunksize=batch_size, dtype=str):
+            yield chunk
+
+    def take(self, positions):
+        import pandas as pd
+        wanted_rows = set(int(position) + 1 for position in positions) # the header is row 0
+        df = pd.read_csv(self.path, skiprows=lambda row: row > 0 and row not in wanted_rows, dtype=str)
+        df.index = positions
+        return df
+
+    def take_chunks(self, positions, chunk_size=100000):
+        import numpy as np
+        import pandas as pd
+        # the file is parsed once, in chunks, keeping the wanted rows of each (instead of parsing it again per `take`)
+        positions = np.asarray(positions, dtype="int64")
+        start = 0
+        for chunk in pd.read_csv(self.path, chunksize=chunk_size, dtype=str):
+            if start == len(positions):
+                break
+            end = int(np.searchsorted(positions, chunk.index[-1], side="right"))
+            if end > start:
+                yield chunk.loc[positions[start:end]]
+            start = end
+
+
+class ArrowFactStore(FactStore):
+    """
+    Arrow IPC (Feather V2) files, uncompressed so that they can be memory-mapped. Columns are exposed to pandas
+    as Arrow-backed strings, so that loading does not copy or convert the data. Appended facts are written to their
+    own segment files, next to the database file ("database.arrow.append-000001", ...), so that a commit does not
+    rewrite the database; every `max_segments` appends, the segments are merged into the database file, whose
+    schema metadata keeps the number of the last segment merged.
+    """
+
+    SEGMENT_METADATA_KEY = b"merged_segments"
+
+    def __init__(self, path, max_segments=64):
+        super().__init__(path)
+        self.max_segments = max_segments
+
+    def load(self):
+        import pandas as pd
+        return self._table().to_pandas(types_mapper=pd.ArrowDtype)
+
+    def save(self, df):
+        self._write_merged(_to_arrow_table(df))
+
+    def append(self, df):
+        if not self.exists():
+            return self.save(df)
+        table = _to_arrow_table(df)
+        merged_segment, segment_paths = self._merged_segment(), self._segment_paths()
+        if sum(number > merged_segment for number in segment_paths) >= self.max_segments:
+            import pyarrow as pa
+            self._write_merged(pa.concat_tables([self._table(), table]))
+        else:
+            self._write(table, self._segment_path(max([merged_segment] + list(segment_paths)) + 1))
+
+    def count(self):
+        return self._table().num_rows
+
+    def unique(self, column):
+        import pyarrow.compute as pc
+        return pc.unique(self._table()[column]).to_pylist()
+
+    def iter_batches(self, batch_size=100000):
+        import pandas as pd
+        offset = 0
+        for batch in self._table().to_batches(max_chunksize=batch_size):
+            df = batch.to_pandas(types_mapper=pd.ArrowDtype)
+            df.index = pd.RangeIndex(offset, offset + len(df))
+            offset += len(df)
+            yield df
+
+    def take(self, positions):
+        import pandas as pd
+        df = self._table().take(positions).to_pandas(types_mapper=pd.ArrowDtype)
+        df.index = positions
+        return df
+
+    def _table(self):
+        import pyarrow as pa
+        from pyarrow import feather
+        # the database file is mapped once, so that the segments merged into it are told from the very file that is read
+        table = feather.read_table(pa.memory_map(self.path))
+        merged_segment = _merged_segment(table.schema, self.SEGMENT_METADATA_KEY)
+        segments = [feather.read_table(path, memory_map=True) for number, path in sorted(self._segment_paths().items())
+                    if number > merged_segment]
+        return pa.concat_tables([table] + segments) if len(segments) > 0 else table
+
+    def _schema(self):
+        import pyarrow as pa
+        with pa.memory_map(self.path) as source:
+            return pa.ipc.open_file(source).schema
+
+    def _write(self, table, path=None):
+        from pyarrow import feather
+        self._replace(lambda path: feather.write_feather(table, path, compression="uncompressed"), path)
+
+    def _write_merged(self, table):
+        # writes the database file with all the facts, which the current segments are then merged into
+        merged_segment = self._merged_segment() if self.exists() else 0
+        segment_paths = self._segment_paths()
+        last_segment = max([merged_segment] + list(segment_paths))
+        metadata = {**(table.schema.metadata or {}), self.SEGMENT_METADATA_KEY: str(last_segment).encode()}
+        self._write(table.replace_schema_metadata(metadata))
+        # the segments merged before are only deleted now, as readers of the previous database file may still read them
+        for number, path in segment_paths.items():
+            if number <= merged_segment:
+                os.remove(path)
+
+    def _merged_segment(self):
+        return _merged_segment(self._schema(), self.SEGMENT_METADATA_KEY)
+
+    def _segment_path(self, number):
+        return f"{self.path}.append-{number:06d}"
+
+    def _segment_paths(self):
+        # the segment files by number, including those already merged into the database file
+        directory, name = os.path.split(os.path.abspath(self.path))
+        pattern = re.compile(re.escape(name) + r"\.append-(\d+)$")
+        matches = [pattern.match(file) for file in os.listdir(directory)] if os.path.isdir(directory) else []
+        return {int(match.group(1)): os.path.join(directory, match.group(0)) for match in matches if match is not None}
+
+
+class ParquetFactStore(ArrowFactStore):
+    """
+    Parquet files, written in row groups of `row_group_size` facts, and with segment files for the appended facts
+    (see `ArrowFactStore`), each with its own row groups. The database file and its segments are read together as
+    a dataset. More compact than Arrow IPC files, but they must be decoded when loaded.
+    """
+
+    def __init__(self, path, row_group_size=100000, max_segments=64):
+        super().__init__(path, max_segments)
+        self.row_group_size = row_group_size
+
+    def count(self):
+        # from the files' metadata, without reading any row group
+        return self._dataset().count_rows()
+
+    def iter_batches(self, batch_size=100000):
+        import pandas as pd
+        offset = 0
+        for batch in self._dataset().to_batches(batch_size=batch_size):
+            if batch.num_rows == 0:
+                continue
+            df = batch.to_pandas(types_mapper=pd.ArrowDtype)
+            df.index = pd.RangeIndex(offset, offset + len(df))
+            offset += len(df)
+            yield df
+
+    def take(self, positions):
+        import pandas as pd
+        df = self._dataset().take(positions).to_pandas(types_mapper=pd.ArrowDtype)
+        df.index = positions
+        return df
+
+    def _table(self):
+        return self._dataset().to_table()
+
+    def _dataset(self):
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+        from pyarrow import fs
+        # the database file is mapped once, so that the segments merged into it are told from the very file that is read
+        file_format = ds.ParquetFileFormat()
+        filesystem = fs.LocalFileSystem(use_mmap=True)
+        database = file_format.make_fragment(pa.memory_map(self.path))
+        merged_segment = _merged_segment(database.physical_schema, self.SEGMENT_METADATA_KEY)
+        segments = [file_format.make_fragment(path, filesystem=filesystem)
+                    for number, path in sorted(self._segment_paths().items()) if number > merged_segment]
+        return ds.FileSystemDataset([database] + segments, database.physical_schema.remove_metadata(), file_format, filesystem)
+
+    def _schema(self):
+        from pyarrow import parquet
+        return parquet.read_schema(self.path)
+
+    def _write(self, table, path=None):
+        from pyarrow import parquet
+        self._replace(lambda path: parquet.write_table(table, path, row_group_size=self.row_group_size), path)
+
+
+class PartitionedFactStore(FactStore):
+    """
+    A directory of Arrow IPC files, one per partition: the facts of one category or, if partitioned by
+    `["Category", "Type"]`, of one category and type. Each file keeps the row positions of its facts in the whole
+    database, and a manifest lists the partitions. Facts appended to an existing partition are written to their own
+    segment file, listed with the partition in the manifest; every `max_segments` appends to a partition, its segments
+    are merged into a new partition file. Scans can skip partitions (see `scan_batches`). Batches come partition by
+    partition, not in database order.
+    """
+
+    PARTITION_COLUMNS = ["Category", "Type"]
+    POSITION_COLUMN = "Position"
+
+    def __init__(self, path, partition_by=["Category"], max_segments=64):
+        super().__init__(path)
+        self.max_segments = max_segments
+        if any(column not in self.PARTITION_COLUMNS for column in partition_by):
+            raise ValueError(f"Invalid partition columns: {partition_by}. Partitions can be by {' and '.join(self.PARTITION_COLUMNS)}.")
+        self._manifest = None
+        self._partition_by = list(partition_by)
+
+    @property
+    def partition_by(self):
+        # an existing database keeps its own partitioning
+        return self._read_manifest()["partition_by"] if self.exists() else self._partition_by
+
+    def exists(self):
+        return os.path.exists(self._manifest_path())
+
+    def load(self):
+        import pandas as pd
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        manifest = self._read_manifest()
+        tables = [self._partition_table(partition) for partition in manifest["partitions"]]
+        table = pa.concat_tables(tables) if len(tables) > 0 else _to_arrow_table(pd.DataFrame(columns=FACT_COLUMNS))
+        if self.POSITION_COLUMN in table.column_names:
+            table = table.take(pc.sort_indices(table[self.POSITION_COLUMN])).drop_columns([self.POSITION_COLUMN])
+        return table.to_pandas(types_mapper=pd.ArrowDtype)
+
+    def save(self, df):
+        import numpy as np
+        partition_by = self.partition_by
+        os.makedirs(self.path, exist_ok=True)
+        previous_files = set(_manifest_files(self._read_manifest())) if self.exists() else set()
+
+        manifest = {"partition_by": partition_by, "count": len(df), "partitions": []}
+        self._write_partitions(manifest, df[FACT_COLUMNS], np.arange(len(df), dtype="int64"))
+        self._write_manifest(manifest)
+        for file in previous_files - set(_manifest_files(manifest)):
+            os.remove(os.path.join(self.path, file))
+
+    def append(self, df):
+        import numpy as np
+        if not self.exists():
+            return self.save(df)
+        # the manifest in use is not modified, as it may be being read
+        manifest = copy.deepcopy(self._read_manifest())
+        previously_merged_files = manifest.pop("merged_files", [])
+        positions = np.arange(manifest["count"], manifest["count"] + len(df), dtype="int64")
+        manifest["count"] += len(df)
+        self._write_partitions(manifest, df[FACT_COLUMNS], positions)
+        if "merged_files" in manifest:
+            # the files merged before are only deleted on the next merge, as readers of the previous manifest may still read them
+            self._write_manifest(manifest)
+            for file in previously_merged_files:
+                os.remove(os.path.join(self.path, file))
+        else:
+            manifest["merged_files"] = previously_merged_files
+            self._write_manifest(manifest)
+
+    def count(self):
+        return self._read_manifest()["count"]
+
+    def unique(self, column):
+        import pyarrow.compute as pc
+        manifest = self._read_manifest()
+        if column in manifest["partition_by"]:
+            # the partitions' values are in the manifest, so no file is read
+            i = manifest["partition_by"].index(column)
+            return list(dict.fromkeys(partition["values"][i] for partition in manifest["partitions"]))
+        return list(dict.fromkeys(value for partition in manifest["partitions"]
+                                  for value in pc.unique(self._partition_table(partition)[column]).to_pylist()))
+
+    def iter_batches(self, batch_size=100000):
+        return self.scan_batches(batch_size=batch_size)
+
+    def scan_batches(self, categories=None, entry_types=None, batch_size=100000):
+        import pandas as pd
+        import pyarrow as pa
+
+        def batches_of(tables):
+            # small partitions are read together, as each batch has a fixed cost
+            table = tables[0] if len(tables) == 1 else pa.concat_tables(tables).combine_chunks()
+            for batch in table.to_batches(max_chunksize=batch_size):
+                df = batch.to_pandas(types_mapper=pd.ArrowDtype)
+                df.index = df.pop(self.POSITION_COLUMN).to_numpy(dtype="int64")
+                yield df
+
+        tables = []
+        for partition in self._pruned_partitions(categories, entry_types):
+            tables.append(self._partition_table(partition))
+            if sum(table.num_rows for table in tables) >= batch_size:
+                yield from batches_of(tables)
+                tables = []
+        if len(tables) > 0:
+            yield from batches_of(tables)
+
+    def take(self, positions):
+        import numpy as np
+        import pandas as pd
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        positions = np.asarray(positions, dtype="int64")
+        tables = []
+        for partition in self._read_manifest()["partitions"]:
+            table = self._partition_table(partition)
+            tables.append(table.filter(pc.is_in(table[self.POSITION_COLUMN], value_set=pa.array(positions))))
+        if len(tables) == 0:
+            return pd.DataFrame(columns=FACT_COLUMNS, index=positions)
+        table = pa.concat_tables(tables)
+        table = table.take(pc.sort_indices(table[self.POSITION_COLUMN]))
+        df = table.drop_columns([self.POSITION_COLUMN]).to_pandas(types_mapper=pd.ArrowDtype)
+        df.index = table[self.POSITION_COLUMN].to_numpy()
+        return df
+
+    def _pruned_partitions(self, categories=None, entry_types=None):
+        manifest = self._read_manifest()
+        wanted = {"Category": categories, "Type": entry_types}
+        for partition in manifest["partitions"]:
+            if all(wanted[column] is None or len(wanted[column]) == 0 or
+                   (value is not None and value.lower() in [v.lower() for v in wanted[column]])
+                   for column, value in zip(manifest["partition_by"], partition["values"])):
+                yield partition
+
+    def _write_partitions(self, manifest, df, positions):
+        # adds the facts to the partitions they belong to (in the manifest, which is saved afterwards)
+        import pyarrow as pa
+        partitions = {tuple(partition["values"]): partition for partition in manifest["partitions"]}
+        keys = df[manifest["partition_by"]].astype(object).where(df[manifest["partition_by"]].notna(), None)
+        for values, rows in keys.groupby(manifest["partition_by"], dropna=False, sort=False).indices.items():
+            values = tuple(value if isinstance(value, str) else None for value in (values if isinstance(values, tuple) else (values,)))
+            table = _to_arrow_table(df.iloc[rows]).append_column(self.POSITION_COLUMN, pa.array(positions[rows], type=pa.int64()))
+            partition = partitions.get(values)
+            if partition is None:
+                partition = partitions[values] = {"values": list(values), "file": f"part-{len(manifest['partitions']):05d}.arrow",
+                                                  "segments": [], "rows": 0}
+                manifest["partitions"].append(partition)
+                self._write_partition_file(partition["file"], table)
+            elif len(partition.get("segments", [])) >= self.max_segments:
+                # merged into a new file, as the current ones may be being read
+                merged_table = pa.concat_tables([self._partition_table(partition), table])
+                manifest.setdefault("merged_files", []).extend([partition["file"]] + partition["segments"])
+                partition["file"], partition["segments"] = self._new_segment_file(manifest), []
+                self._write_partition_file(partition["file"], merged_table)
+            else:
+                file = self._new_segment_file(manifest)
+                self._write_partition_file(file, table)
+                partition["segments"] = partition.get("segments", []) + [file]
+            partition["rows"] += table.num_rows
+
+    def _partition_table(self, partition):
+        import pyarrow as pa
+        from pyarrow import feather
+        tables = [feather.read_table(os.path.join(self.path, file), memory_map=True)
+                  for file in [partition["file"]] + partition.get("segments", [])]
+        return tables[0] if len(tables) == 1 else pa.concat_tables(tables)
+
+    @staticmethod
+    def _new_segment_file(manifest):
+        number = manifest.get("next_segment", 1)
+        manifest["next_segment"] = number + 1
+        return f"segment-{number:06d}.arrow"
+
+    def _write_partition_file(self, file, table):
+        from pyarrow import feather
+        self._replace(lambda path: feather.write_feather(table, path, compression="uncompressed"), os.path.join(self.path, file))
+
+    def _manifest_path(self):
+        return os.path.join(self.path, "manifest.json")
+
+    def _read_manifest(self):
+        # kept in memory, as only this store writes it
+        if self._manifest is None:
+            with open(self._manifest_path(), encoding="utf-8") as f:
+                self._manifest = json.load(f)
+        return self._manifest
+
+    def _write_manifest(self, manifest):
+        def write(path):
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(manifest, f, indent=1)
+        self._replace(write, self._manifest_path())
+        self._manifest = manifest
+
+
+class PartitionIndex:
+    """
+    The row positions of the facts of each partition (lowercased category and type) of a database in memory, so 
+    that filtering by category and type only takes the rows of the matching partitions.
+    """
+
+    def __init__(self):
+        self._positions = {}
+
+    @classmethod
+    def from_dataframe(cls, df):
+        index = cls()
+        index.add(df)
+        return index
+
+    def add(self, df):
+        """
+        Adds the facts in `df`, indexed by their row positions.
+        """
+        import numpy as np
+        import pandas as pd
+        keys = pd.DataFrame({"Category": df["Category"].str.lower(), "Type": df["Type"].str.lower()}, index=df.index)
+        positions = df.index.to_numpy(dtype="int64")
+        for key, rows in keys.groupby(["Category", "Type"], dropna=False, sort=False).indices.items():
+            key = tuple(value if isinstance(value, str) else None for value in key)
+            self._positions[key] = np.concatenate([self._positions[key], positions[rows]]) if key in self._positions else positions[rows]
+
+    def positions(self, categories=None, entry_types=None):
+        """
+        Returns the sorted row positions of the facts of the specified categories and types (case-insensitively).
+        """
+        import numpy as np
+        categories = None if categories is None or len(categories) == 0 else set(value.lower() for value in categories)
+        entry_types = None if entry_types is None or len(entry_types) == 0 else set(value.lower() for value in entry_types)
+        return np.sort(np.concatenate([positions for (category, entry_type), positions in self._positions.items()
+                                       if (categories is None or category in categories) and
+                                          (entry_types is None or entry_type in entry_types)] + [np.array([], dtype="int64")]))
+
+
+class FactCursor:
+    """
+    The lazily evaluated result of a query over a store. The first time it is needed, the store is scanned in batches,
+    keeping only the row positions of the matching facts (those returned by `predicate`, which filters a batch). 
+    Facts are only read when a page (or chunk) of the result is requested, so memory does not depend on the size 
+    of the database. Without a predicate, all the facts match and no scan is needed.
+    """
+
+    def __init__(self, store, predicate=None, batch_size=100000, categories=None, entry_types=None):
+        self.store = store
+        self.predicate = predicate
+        self.batch_size = batch_size
+        # partitions that cannot match the predicate's filters are not even scanned
+        self.categories = categories
+        self.entry_types = entry_types
+        self._positions = None
+
+    def _matching_positions(self):
+        if self._positions is None:
+            import numpy as np
+            if self.predicate is None:
+                self._positions = np.arange(self.store.count())
+            else:
+                # partitioned stores are scanned partition by partition, so positions are sorted in the end
+                batches = self.store.scan_batches(self.categories, self.entry_types, self.batch_size)
+                self._positions = np.unique(np.concatenate([self.predicate(batch).index.to_numpy(dtype="int64")
+                                                            for batch in batches] + [np.array([], dtype="int64")]))
+        return self._positions
+
+    def total_count(self):
+        return len(self._matching_positions())
+
+    def page_count(self, page_size=100):
+        return max(1, -(-self.total_count() // page_size))
+
+    def page(self, page_number, page_size=100):
+        """
+        Returns the facts in the specified page (starting at 0).
+        """
+        positions = self._matching_positions()[page_number * page_size:(page_number + 1) * page_size]
+        return self.store.take(positions)
+
+    def iter_chunks(self, chunk_size=100000):
+        """
+        Iterates over all the facts of the result, in DataFrames of up to `chunk_size` facts.
+        """
+        yield from self.store.take_chunks(self._matching_positions(), chunk_size)
+
+    def to_dataframe(self):
+        import pandas as pd
+        chunks = list(self.iter_chunks())
+        return pd.concat(chunks) if len(chunks) > 0 else pd.DataFrame(columns=FACT_COLUMNS)
+
+
+FACT_STORES = {".csv": CsvFactStore, ".arrow": ArrowFactStore, ".feather": ArrowFactStore, ".parquet": ParquetFactStore,
+               ".parts": PartitionedFactStore}
+
+def open_fact_store(path, **options):
+    """
+    Returns the store for the specified database file (or directory), according to its extension. Options are
+    passed to the store, e.g. `partition_by` for partitioned databases.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in FACT_STORES:
+        raise ValueError(f"Unsupported database format: {extension}. Supported formats are {', '.join(FACT_STORES)}.")
+    return FACT_STORES[extension](path, **options)
+
+def migrate_database(source_path, target_path, **options):
+    """
+    Copies a database to another format (e.g., from CSV to Arrow IPC). Returns the number of facts migrated.
+    """
+    df = open_fact_store(source_path).load()
+    open_fact_store(target_path, **options).save(df)
+    logging.info(f"Migrated {len(df)} facts from {source_path} to {target_path}.")
+    return len(df)
+
+def _manifest_files(manifest):
+    # the files of a partitioned database, including those merged but not deleted yet
+    return [file for partition in manifest["partitions"] for file in [partition["file"]] + partition.get("segments", [])] + \
+           manifest.get("merged_files", [])
+
+def _merged_segment(schema, key):
+    # the number of the last segment merged into a database file, from its schema metadata
+    return int((schema.metadata or {}).get(key, b"0"))
+
+def _to_arrow_table(df):
+    import pyarrow as pa
+    # all columns are stored as (nullable) strings, whatever types pandas inferred when reading a CSV
+    df = df[FACT_COLUMNS].astype("string")
+    return pa.Table.from_pandas(df, schema=pa.schema([(column, pa.large_string()) for column in FACT_COLUMNS]), preserve_index=False)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Migrates a facts database to another storage format.")
+    parser.add_argument("source", help="Current database file, e.g. data/default_database.csv")
+    parser.add_argument("target", help="New database file, whose extension defines the format, e.g. data/default_database.arrow")
+    parser.add_argument("--partition-by", nargs="+", choices=PartitionedFactStore.PARTITION_COLUMNS,
+                        help="Partition columns of a partitioned (.parts) database, by default Category.")
+    args = parser.parse_args()
+
+    options = {"partition_by": args.partition_by} if args.partition_by is not None else {}
+    print(f"Migrated {migrate_database(args.source, args.target, **options)} facts to {args.target}.")
+    print(f"Start the engine with database_file_path=\"{args.target}\" to use it.")
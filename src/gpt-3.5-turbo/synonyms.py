@@ -0,0 +1,192 @@
+"""
+Precomputed synonyms. Queries augment each of their terms with synonyms from the model, one call per term on the
+critical path of the query. Instead, the synonyms of the database vocabulary (the short Key, Value and People values,
+and their words) can be asked to the model ahead of time, many terms per call and at a limited rate, and kept in a
+local table that queries look up first. The table is saved next to the database and remembers how many facts it
+covers, so that later runs (e.g., after each commit) only ask for the synonyms of new vocabulary.
+
+To precompute the synonyms of a database (from the root of the project):
+
+    python src/gpt-3.5-turbo/synonyms.py data/default_database.csv --batch-size 25 --calls-per-minute 60
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+VOCABULARY_COLUMNS = ["Key", "Value", "People"]
+
+# Values with more words are sentences rather than terms, and only their words are part of the vocabulary
+MAX_TERM_WORDS = 3
+MIN_WORD_LENGTH = 3
+
+STOP_WORDS = {"the", "and", "for", "with", "from", "that", "this", "are", "was", "were", "has", "have", "had", "not",
+              "but", "you", "your", "our", "his", "her", "its", "their", "them", "they", "she", "him", "who", "what",
+              "when", "where", "which", "how", "all", "any", "can", "will", "about", "into", "than", "then", "there"}
+
+_WORD_PATTERN = re.compile(r"[^\W\d_]+")
+_NOT_TERM_PATTERN = re.compile(r"[\d@/:]")
+
+def normalize_term(term):
+    return " ".join(term.lower().split())
+
+def synonyms_file_path_for(database_file_path):
+    """
+    The default path of the synonym table of a database, e.g. "data/default_database.synonyms.json".
+    """
+    return os.path.splitext(database_file_path.rstrip("/\\"))[0] + ".synonyms.json"
+
+def terms_of(value):
+    """
+    Returns the set of (normalized) terms of a value: the value itself, if short and without digits, and its words but
+    for stop words and words shorter than `MIN_WORD_LENGTH`. See `vocabulary_of`.
+    """
+    value = normalize_term(value)
+    is_term = len(value) > 0 and value.count(" ") < MAX_TERM_WORDS and _NOT_TERM_PATTERN.search(value) is None
+    terms = {value} if is_term else set()
+    terms.update(word for word in _WORD_PATTERN.findall(value) if len(word) >= MIN_WORD_LENGTH and word not in STOP_WORDS)
+    return terms
+
+def vocabulary_of(df, columns=VOCABULARY_COLUMNS):
+    """
+    Returns the set of (normalized) terms of a DataFrame of facts: its short Key, Value and People values without digits,
+    and the words of all of them, but for stop words and words shorter than `MIN_WORD_LENGTH`.
+    """
+    import pandas as pd
+    vocabulary = set()
+    for column in columns:
+        if column not in df.columns:
+            continue
+        values = pd.Series(df[column].dropna().astype(str).unique(), dtype="str").str.lower()
+        values = values.str.replace(r"\s+", " ", regex=True).str.strip()
+        values = values[values.str.len() > 0].drop_duplicates()
+        # but for numbers, dates, emails, URLs and the like, which have no synonyms
+        terms = values[(values.str.count(" ") < MAX_TERM_WORDS) & ~values.str.contains(_NOT_TERM_PATTERN.pattern)]
+        vocabulary.update(terms.tolist())
+
+        # values that only differ by their numbers (e.g., "price 250" and "price 300") have the same words
+        letters = values.str.replace(r"[0-9]+", " ", regex=True).drop_duplicates()
+        words = letters.astype("object").str.findall(_WORD_PATTERN).explode().dropna().unique()
+        vocabulary.update(word for word in words if len(word) >= MIN_WORD_LENGTH and word not in STOP_WORDS)
+    return vocabulary
+
+
+class RateLimiter:
+    """
+    Spaces calls so that there are at most `calls_per_minute` of them per minute (any number if None). Thread-safe.
+    """
+
+    def __init__(self, calls_per_minute=None):
+        self.interval_seconds = 60.0 / calls_per_minute if calls_per_minute else 0.0
+        self._next_call = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """
+        Blocks until the next call can be made.
+        """
+        with self._lock:
+            now = time.monotonic()
+            delay = max(0.0, self._next_call - now)
+            self._next_call = max(now, self._next_call) + self.interval_seconds
+        if delay > 0:
+            time.sleep(delay)
+
+
+class SynonymTable:
+    """
+    The synonyms of terms (normalized), and the number of facts of the database whose vocabulary was covered.
+    Terms the model gave no synonyms for are kept too (with none), so that they are not asked for again.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.covered_facts = 0
+        self.hits = 0
+        self.misses = 0
+        self._synonyms = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path):
+        """
+        Reads the table saved at `path`, or returns an empty one if there is none.
+        """
+        table = cls(path)
+        if path is not None and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                content = json.load(f)
+            table.covered_facts = content["covered_facts"]
+            table._synonyms = content["synonyms"]
+        return table
+
+    def save(self):
+        with self._lock:
+            content = {"covered_facts": self.covered_facts, "synonyms": dict(self._synonyms)}
+        temporary_path = self.path + ".tmp"
+        with open(temporary_path, "w", encoding="utf-8") as f:
+            json.dump(content, f, ensure_ascii=False)
+        os.replace(temporary_path, self.path)
+
+    def get(self, term):
+        """
+        Returns the synonyms of the term, or None if they were not precomputed.
+        """
+        synonyms = self._synonyms.get(normalize_term(term))
+        with self._lock:
+            if synonyms is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return synonyms
+
+    def update(self, synonyms):
+        """
+        Adds the synonyms of terms, given as a dictionary from terms to lists of synonyms.
+        """
+        with self._lock:
+            for term, term_synonyms in synonyms.items():
+                self._synonyms[normalize_term(term)] = list(term_synonyms)
+
+    def items(self):
+        """
+        Returns the (term, synonyms) pairs of the table, without counting them as lookups.
+        """
+        with self._lock:
+            return list(self._synonyms.items())
+
+    def missing(self, terms):
+        """
+        Returns the terms whose synonyms were not precomputed yet, sorted.
+        """
+        return sorted(term for term in terms if normalize_term(term) not in self._synonyms)
+
+    def statistics(self):
+        lookups = self.hits + self.misses
+        return {"terms": len(self), "covered_facts": self.covered_facts, "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups > 0 else 0.0}
+
+    def __contains__(self, term):
+        return normalize_term(term) in self._synonyms
+
+    def __len__(self):
+        return len(self._synonyms)
+
+
+if __name__ == '__main__':
+    from engine import BraindumpEngine
+
+    parser = argparse.ArgumentParser(description="Precomputes the synonyms of the vocabulary of a braindump database.")
+    parser.add_argument("database", help="Database file (.csv, .arrow, .parquet or .parts).")
+    parser.add_argument("--synonyms", help="Synonym table file, next to the database by default.")
+    parser.add_argument("--batch-size", type=int, default=BraindumpEngine.SYNONYM_BATCH_SIZE, help="Terms per model call.")
+    parser.add_argument("--calls-per-minute", type=int, default=BraindumpEngine.SYNONYM_CALLS_PER_MINUTE)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    engine = BraindumpEngine(database_file_path=args.database, synonyms_file_path=args.synonyms)
+    count = engine.precompute_synonyms(batch_size=args.batch_size, calls_per_minute=args.calls_per_minute)
+    print(f"Precomputed the synonyms of {count} new terms, {engine.synonym_statistics()['terms']} in total.")
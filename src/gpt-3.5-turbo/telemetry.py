@@ -0,0 +1,308 @@
+"""
+Instrumentation for the braindump engine: accounting of the tokens, latency, cache usage and retries of
+each model call, rolled up per engine operation and per session, and timing spans around the stages of the
+engine's hot paths.
+"""
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+class UsageRecorder:
+    """
+    Records every call to the model, labeled with the engine operation (e.g., "extract_facts", "query") and
+    the session that triggered it. Counters and histograms can be exported as a plain snapshot or in the
+    Prometheus text format. Thread-safe, so a single recorder can be shared by all the sessions of an application.
+    """
+
+    LATENCY_BUCKETS = [0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0]
+    TOKEN_BUCKETS = [50, 100, 250, 500, 1000, 2000, 4000]
+
+    COUNTERS = ["calls", "prompt_tokens", "completion_tokens", "cache_hits", "cache_misses", "retries", "errors"]
+
+    def __init__(self, recent_samples=1000):
+        self._lock = threading.Lock()
+        self._labels = threading.local()
+        self._recent_samples = recent_samples
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._counters = defaultdict(lambda: dict.fromkeys(self.COUNTERS, 0))
+            self._session_counters = defaultdict(lambda: dict.fromkeys(self.COUNTERS, 0))
+            self._latency_histograms = defaultdict(lambda: Histogram(self.LATENCY_BUCKETS))
+            self._token_histograms = defaultdict(lambda: Histogram(self.TOKEN_BUCKETS))
+            self._recent_latencies = defaultdict(lambda: deque(maxlen=self._recent_samples))
+            # failures in a row of each model, and when the last one happened
+            self._consecutive_errors = defaultdict(int)
+            self._last_errors = {}
+
+    ################
+    # Labeling
+    ################
+    @contextmanager
+    def labels(self, operation=None, session=None):
+        """
+        Labels all the calls recorded by the current thread within the context. Labels not given are inherited
+        from the enclosing context, so an operation can be nested in a session.
+        """
+        previous = (self.current_operation(), self.current_session())
+        self._labels.operation = operation if operation is not None else previous[0]
+        self._labels.session = session if session is not None else previous[1]
+        try:
+            yield
+        finally:
+            self._labels.operation, self._labels.session = previous
+
+    def set_session(self, session):
+        """
+        Labels all the calls subsequently recorded by the current thread with the specified session.
+        """
+        self._labels.session = session
+
+    def current_operation(self):
+        return getattr(self._labels, "operation", "other")
+
+    def current_session(self):
+        return getattr(self._labels, "session", "default")
+
+    ################
+    # Recording
+    ################
+    def record_call(self, model, prompt_tokens=0, completion_tokens=0, seconds=0.0, cache_hit=False, retries=0, error=False):
+        """
+        Records one model call under the current labels.
+        """
+        operation = self.current_operation()
+        session = self.current_session()
+        increments = {"calls": 1, "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "cache_hits": 1 if cache_hit else 0, "cache_misses": 0 if cache_hit else 1,
+                      "retries": retries, "errors": 1 if error else 0}
+
+        with self._lock:
+            for counters in [self._counters[(operation, model)], self._session_counters[session]]:
+                for name, value in increments.items():
+                    counters[name] += value
+
+            self._latency_histograms[(operation, model)].observe(seconds)
+            self._token_histograms[(operation, model)].observe(prompt_tokens + completion_tokens)
+            if not cache_hit and not error:
+                self._recent_latencies[model].append(seconds)
+                self._consecutive_errors.pop(model, None)
+            if error:
+                self._consecutive_errors[model] += 1
+                self._last_errors[model] = time.monotonic()
+
+    @contextmanager
+    def timed_call(self, model):
+        """
+        Times a model call performed within the context. The yielded dictionary can be filled with
+        "prompt_tokens", "completion_tokens", "cache_hit" and "retries" by the caller. The call is recorded
+        as an error if an exception is raised.
+        """
+        call = {}
+        start = time.perf_counter()
+        try:
+            yield call
+        except Exception:
+            self.record_call(model, seconds=time.perf_counter() - start, retries=call.get("retries", 0), error=True)
+            raise
+        self.record_call(model, seconds=time.perf_counter() - start, **call)
+
+    ################
+    # Reporting
+    ################
+    def latency_percentile(self, model, q):
+        """
+        Returns the q-th percentile (0 to 100) of the latency of the most recent actual calls to the
+        specified model, or None if there are no such calls.
+        """
+        with self._lock:
+            samples = sorted(self._recent_latencies.get(model, []))
+        if len(samples) == 0:
+            return None
+        return samples[min(len(samples) - 1, int(round(q / 100 * (len(samples) - 1))))]
+
+    def recent_errors(self, model):
+        """
+        Returns the number of calls to the specified model that failed in a row (since its last successful call), and
+        when the last one failed (a `time.monotonic` timestamp, or None).
+        """
+        with self._lock:
+            return self._consecutive_errors.get(model, 0), self._last_errors.get(model)
+
+    def snapshot(self):
+        """
+        Returns all the counters and histograms, per (operation, model) and per session, as plain dictionaries.
+        """
+        with self._lock:
+            return {"operations": [{"operation": operation, "model": model,
+                                    "counters": dict(counters),
+                                    "latency_seconds": self._latency_histograms[(operation, model)].to_dict(),
+                                    "tokens": self._token_histograms[(operation, model)].to_dict()}
+                                   for (operation, model), counters in self._counters.items()],
+                    "sessions": {session: dict(counters) for session, counters in self._session_counters.items()}}
+
+    def to_prometheus(self, prefix="braindump_llm"):
+        """
+        Exports the counters and histograms in the Prometheus text exposition format.
+        """
+        lines = []
+        with self._lock:
+            for name in self.COUNTERS:
+                lines.append(f"# TYPE {prefix}_{name}_total counter")
+                for (operation, model), counters in self._counters.items():
+                    lines.append(f'{prefix}_{name}_total{{operation="{operation}",model="{model}"}} {counters[name]}')
+
+            for name, histograms in [("latency_seconds", self._latency_histograms), ("tokens", self._token_histograms)]:
+                lines.append(f"# TYPE {prefix}_{name} histogram")
+                for (operation, model), histogram in histograms.items():
+                    labels = f'operation="{operation}",model="{model}"'
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + ["+Inf"], histogram.counts):
+                        cumulative += count
+                        lines.append(f'{prefix}_{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                    lines.append(f"{prefix}_{name}_sum{{{labels}}} {histogram.sum}")
+                    lines.append(f"{prefix}_{name}_count{{{labels}}} {histogram.count}")
+
+        return "\n".join(lines) + "\n"
+
+
+class Histogram:
+    """
+    A fixed-bucket histogram. Each bucket counts the observations less than or equal to its bound,
+    and the last (implicit) bucket counts the ones above all bounds.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        i = 0
+        while i < len(self.buckets) and value > self.buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def to_dict(self):
+        return {"buckets": dict(zip([str(b) for b in self.buckets] + ["+Inf"], self.counts)),
+                "sum": self.sum, "count": self.count}
+
+
+class Span:
+    """
+    A timed stage of the engine's work (e.g., prompt building, model call, parsing), possibly nested in another span.
+    """
+
+    def __init__(self, name, attributes, parent=None):
+        self.name = name
+        self.attributes = attributes
+        self.parent = parent
+        self.start = time.perf_counter()
+        self.seconds = None
+        self.error = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def path(self):
+        """
+        Returns the names of the enclosing spans and of this one, e.g. "query/llm_call".
+        """
+        return self.name if self.parent is None else f"{self.parent.path()}/{self.name}"
+
+
+class Tracer:
+    """
+    Produces timing spans around the stages of the engine's hot paths and hands the finished spans to the
+    registered exporters. Without exporters, spans are not even created, so tracing costs nearly nothing.
+    """
+
+    def __init__(self, exporters=None):
+        self.exporters = list(exporters) if exporters is not None else []
+        self._current = threading.local()
+
+    def add_exporter(self, exporter):
+        self.exporters.append(exporter)
+
+    def remove_exporter(self, exporter):
+        self.exporters.remove(exporter)
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """
+        Times the work done within the context. Yields the span (or None if tracing is disabled), 
+        so that attributes can be added to it.
+        """
+        if len(self.exporters) == 0:
+            yield None
+            return
+
+        parent = getattr(self._current, "span", None)
+        span = Span(name, attributes, parent)
+        self._current.span = span
+        try:
+            yield span
+        except Exception as e:
+            span.error = repr(e)
+            raise
+        finally:
+            span.seconds = time.perf_counter() - span.start
+            self._current.span = parent
+            for exporter in self.exporters:
+                exporter.export(span)
+
+
+class SpanExporter:
+    """
+    Interface of span exporters. Subclasses can forward spans to any tracing system (e.g., OpenTelemetry).
+    """
+
+    def export(self, span):
+        raise NotImplementedError()
+
+
+class InMemorySpanExporter(SpanExporter):
+    """
+    Keeps the finished spans in memory, mostly for tests and benchmarks.
+    """
+
+    def __init__(self):
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def export(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def summary(self):
+        """
+        Returns the number of spans and their total and mean duration, per span path.
+        """
+        summary = {}
+        with self._lock:
+            for span in self.spans:
+                entry = summary.setdefault(span.path(), {"count": 0, "total_seconds": 0.0})
+                entry["count"] += 1
+                entry["total_seconds"] += span.seconds
+        for entry in summary.values():
+            entry["mean_seconds"] = entry["total_seconds"] / entry["count"]
+        return summary
+
+    def clear(self):
+        with self._lock:
+            self.spans = []
+
+
+class LoggingSpanExporter(SpanExporter):
+    """
+    Logs each finished span at the DEBUG level.
+    """
+
+    def export(self, span):
+        logging.debug("Span %s took %.1f ms %s", span.path(), span.seconds * 1000, span.attributes)
@@ -0,0 +1,25 @@
+import pytest
+import os
+
+import sys
+sys.path.append('../../src/gpt-3.5-turbo')
+from cassettes import CassetteCompletionClient
+
+CASSETTES_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cassettes")
+
+def pytest_addoption(parser):
+    parser.addoption("--record-mode", default=os.getenv("BRAINDUMP_RECORD_MODE", "replay"), 
+                     choices=CassetteCompletionClient.MODES,
+                     help="How model calls are handled: replayed from the cassettes (default, offline), "
+                          "recorded if missing, re-recorded against the live model, or always live (off).")
+
+@pytest.fixture
+def completion_client(request):
+    """
+    A completion client that replays the model calls recorded in the test's cassette. Since cassettes are only
+    read when replaying, tests can run in parallel (e.g., `pytest -n auto` with pytest-xdist).
+    """
+    from engine import ChatCompletionClient
+    return CassetteCompletionClient(os.path.join(CASSETTES_DIRECTORY, f"{request.node.name}.json"),
+                                    mode=request.config.getoption("--record-mode"),
+                                    client_factory=lambda: ChatCompletionClient(openai_key=os.getenv("PERSONAL_OPENAI_API_KEY")))
@@ -0,0 +1,66 @@
+import pytest
+from types import SimpleNamespace
+
+import sys
+sys.path.append('../../src/gpt-3.5-turbo')
+import openai
+from engine import BraindumpEngine, OpenAIBackend
+
+class StubOpenAI:
+    """
+    Stands for the OpenAI client, recording the requests and failing the first `failures` of them with a rate limit.
+    """
+
+    def __init__(self, failures=0):
+        self.requests = []
+        self.failures = failures
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=lambda **request: self._create("chat", request)))
+        self.completions = SimpleNamespace(create=lambda **request: self._create("text", request))
+
+    def _create(self, api, request):
+        self.requests.append((api, request))
+        if self.failures > 0:
+            self.failures -= 1
+            raise openai.RateLimitError("rate limited", response=SimpleNamespace(request=None, status_code=429, headers={}), body=None)
+        usage = SimpleNamespace(prompt_tokens=10, completion_tokens=2)
+        if api == "chat":
+            return SimpleNamespace(choices=[SimpleNamespace(message={"role": "assistant", "content": "chat answer"})], usage=usage)
+        return SimpleNamespace(choices=[SimpleNamespace(text="text answer")], usage=usage)
+
+############################################################################################################
+# Tests
+############################################################################################################
+def test_requests_are_routed_by_model():
+    stub = StubOpenAI()
+    backend = OpenAIBackend(openai_client=stub)
+
+    assert backend.complete("Hi", model="gpt-3.5-turbo", temperature=0.1) == "chat answer"
+    assert backend.complete("Hi", model="text-davinci-003", temperature=0.1) == "text answer"
+    assert [api for api, _ in stub.requests] == ["chat", "text"]
+    assert stub.requests[1][1]["prompt"] == "Hi"
+    assert backend.usage_recorder.snapshot()["sessions"]["default"]["calls"] == 2
+
+    with pytest.raises(ValueError):
+        backend.complete("Hi", model="text-davinci-003", response_format={"type": "json_object"})
+
+def test_transient_failures_are_retried():
+    stub = StubOpenAI(failures=1)
+    backend = OpenAIBackend(openai_client=stub, retry_backoff_seconds=0.0)
+
+    assert backend.complete("Hi", model="gpt-3.5-turbo-instruct") == "text answer"
+    assert len(stub.requests) == 2
+    assert backend.usage_recorder.snapshot()["sessions"]["default"]["retries"] == 1
+
+def test_completion_models_get_an_output_cue(tmp_path):
+    stub = StubOpenAI()
+    engine = BraindumpEngine(database_file_path=str(tmp_path / "database.csv"), categories_file_path=str(tmp_path / "categories.csv"),
+                             gpt_engine="text-davinci-003", gpt_client=OpenAIBackend(openai_client=stub))
+    engine.extract_facts("gift = book")
+    assert stub.requests[0][1]["prompt"].endswith("\nInput: gift = book\nOutput:")
+
+    # chat models and prompts that do not end with an input are sent as they are
+    backend = OpenAIBackend(openai_client=stub)
+    backend.complete("Input: gift = book\n", model="gpt-3.5-turbo")
+    backend.complete('"gift = book" ->\n', model="text-davinci-003")
+    assert stub.requests[1][1]["messages"][-1]["content"] == "Input: gift = book\n"
+    assert stub.requests[2][1]["prompt"] == '"gift = book" ->\n'
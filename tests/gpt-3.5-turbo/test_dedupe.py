@@ -0,0 +1,57 @@
+import pytest
+import shutil
+
+import sys
+sys.path.append('../../src/gpt-3.5-turbo')
+import pandas as pd
+from dedupe import DedupeIndex, compact_database
+from engine import BraindumpEngine
+from fakes import FakeCompletionClient
+from storage import open_fact_store
+
+FACTS = [("Shopping", "Note", "", "MSFT stock", "buy at 250"),
+         ("Other", "Reminder", "", "", ""),
+         ("Shopping", "Note", "", "MSFT stock", "buy at 250 price"),
+         ("Shopping", "List", "", "coffee", "buy"),
+         ("shopping", "List", "", "Coffee ", "Buy!"),
+         ("Shopping", "List", "", "coffee", "buy")]
+
+############################################################################################################
+# Tests
+############################################################################################################
+@pytest.mark.parametrize("policy,expected_values", [("skip", ["buy at 250", "buy at 250 price", "buy"]),
+                                                    ("merge", ["buy at 250 price", "buy"]),
+                                                    ("keep", [fact[4] for fact in FACTS])])
+def test_dedupe_policies(policy, expected_values):
+    facts_to_add, replacements = DedupeIndex().plan(FACTS, 0, policy)
+    assert [fact[4] for fact in facts_to_add] == expected_values
+    assert replacements == {}
+
+def test_merge_replaces_existing_fact():
+    index = DedupeIndex.from_batches([pd.DataFrame(FACTS[:1])])
+    facts_to_add, replacements = index.plan([FACTS[2], FACTS[0]], 1, "merge")
+    assert facts_to_add == []
+    assert replacements == {0: FACTS[2]}
+
+def test_engine_skips_duplicates_on_commit(tmp_path):
+    database_file_path = str(tmp_path / "database.csv")
+    responses = {"Input: groceries: milk, eggs": '("Shopping", "List", "", "groceries", "milk")\n("Shopping", "List", "", "groceries", "eggs")',
+                 "Input: groceries: Milk": '("Shopping", "List", "", "Groceries", "Milk")',
+                 "Input: groceries: eggs": '("Shopping", "List", "", "groceries", "eggs")',
+                 "Input: groceries: bread": '("Shopping", "List", "", "groceries", "bread")'}
+    engine = BraindumpEngine(database_file_path=database_file_path, categories_file_path=str(tmp_path / "categories.csv"),
+                             gpt_client=FakeCompletionClient(responses=responses), dedupe_policy="merge")
+
+    for utterance in ["groceries: milk, eggs", "groceries: Milk", "groceries: eggs", "groceries: bread"]:
+        engine.extract_facts(utterance)
+        engine.commit()
+    assert open_fact_store(database_file_path).load()["Value"].tolist() == ["milk", "eggs", "bread"]
+
+def test_compact_database(tmp_path):
+    database_file_path = str(tmp_path / "database.csv")
+    shutil.copy("../../data/default_database.csv", database_file_path)
+
+    before, after = compact_database(database_file_path, policy="merge")
+    df = open_fact_store(database_file_path).load()
+    assert len(df) == after == before - 4
+    assert "buy at 250" not in df["Value"].tolist() and "buy at 250 price" in df["Value"].tolist()
@@ -0,0 +1,36 @@
+import pytest
+
+import sys
+sys.path.append('../../src/gpt-3.5-turbo')
+from evaluation import field_matches, score_extraction, evaluate_configuration, fastest_meeting_bar
+from fakes import FakeCompletionClient
+
+############################################################################################################
+# Tests
+############################################################################################################
+def test_field_matches_with_ambiguities():
+    assert field_matches(" Travel ", ["Travel", "Work"])
+    assert field_matches("buy milk", ["groceries", "milk"])
+    assert field_matches("anything", "")
+    assert not field_matches("Hobbies", ["Travel", "Work"])
+
+def test_missing_tuples_count_as_wrong():
+    correct, right_count = score_extraction([("Shopping", "List", "", "diapers", "buy")],
+                                            [("Shopping", "List", "", "diapers", "buy"),
+                                             ("Shopping", "List", "", "cotton", "buy")])
+    assert correct == {"Category": 1, "Type": 1, "People": 1, "Key": 1, "Value": 1}
+    assert not right_count
+
+def test_evaluate_configuration():
+    corpus = [{"utterance": "sales guy email = jp@example.com", "expected": [["Work", "Email", "sales guy", "email", "jp@example.com"]]},
+              {"utterance": "my employee number is 12345678", "expected": [["Work", ["Document", "Other"], "", "employee number", "12345678"]]}]
+    client = FakeCompletionClient(responses={"Input: sales guy email": '("Work", "Email", "sales guy", "email", "jp@example.com")',
+                                             "Input: my employee number": '("Work", "Note", "", "employee number", "12345678")'})
+
+    result = evaluate_configuration(corpus, client, "gpt-3.5-turbo", 0.1, max_workers=2)
+
+    assert result["accuracy"] == {"Category": 1.0, "Type": 0.5, "People": 1.0, "Key": 1.0, "Value": 1.0}
+    assert result["fact_count_accuracy"] == 1.0
+    assert result["tokens_per_utterance"] > 0
+    assert fastest_meeting_bar([result], 0.8) is result
+    assert fastest_meeting_bar([result], 0.95) is None
@@ -0,0 +1,68 @@
+import pytest
+
+import sys
+sys.path.append('../../src/gpt-3.5-turbo')
+import pandas as pd
+from engine import BraindumpEngine
+from expansion import ExpansionIndex, normal_form
+from fakes import FakeCompletionClient
+
+FACTS = pd.DataFrame([("Health", "Contact", "Jen", "pediatrician", "Dr. Smith"),
+                      ("Shopping", "List", "", "groceries", "diapers"),
+                      ("Shopping", "List", "", "groceries", "coffee 2"),
+                      ("Work", "Note", "Bob", "quarterly report", "due on Friday")],
+                     columns=["Category", "Type", "People", "Key", "Value"])
+
+def create_engine(tmp_path, client):
+    return BraindumpEngine(database_file_path=str(tmp_path / "database.csv"), categories_file_path=str(tmp_path / "categories.csv"),
+                           gpt_client=client, index_expansion=True)
+
+############################################################################################################
+# Tests
+############################################################################################################
+def test_normal_forms():
+    assert [normal_form(term) for term in ["Diapers", "boxes", "Batteries", "glass", "bus", "Quarterly  Reports"]] == \
+           ["diaper", "box", "battery", "glass", "bus", "quarterly report"]
+
+def test_index_expands_facts():
+    index = ExpansionIndex.from_batches([FACTS.iloc[:2]], synonyms=[("coffee", ["java", "espresso"])])
+    index.add_dataframe(FACTS.iloc[2:])
+    assert index.search("Java").tolist() == [2]
+    assert index.search("diaper").tolist() == [1]
+    assert index.search("quarterly reports").tolist() == [3]
+    assert index.search("friday report").tolist() == [3]
+    assert index.search("health").tolist() == [0]
+    assert index.search("medical").tolist() == []
+
+    # synonyms expand the facts already in the index, both ways
+    index.add_synonyms({"health": ["medical care"], "espresso": ["ristretto"]})
+    assert index.search("Medical care").tolist() == [0]
+    assert index.search("espresso").tolist() == [2]
+
+def test_missing_values_are_not_indexed():
+    facts = pd.DataFrame([("Family", "Note", None, "birthday", None), ("Family", "Note", float("nan"), "party", "")],
+                         columns=["Category", "Type", "People", "Key", "Value"])
+    index = ExpansionIndex.from_batches([facts], synonyms=[("grandma", ["nan", "granny"])])
+    assert index.search("grandma").tolist() == []
+    assert index.search("nan").tolist() == []
+
+def test_queries_find_expanded_facts(tmp_path):
+    client = FakeCompletionClient(responses={"Input: groceries": '("Shopping", "List", "", "groceries", "diapers")\n("Shopping", "List", "", "groceries", "coffee")',
+                                             "Terms:\n": "coffee: java; espresso\ngroceries: supermarket\nshopping: buying"})
+    engine = create_engine(tmp_path, client)
+    engine.extract_facts("groceries: diapers, coffee")
+    engine.commit()
+    # all the new terms of the facts are sent at once
+    assert client.calls == 2
+
+    client.calls = 0
+    assert engine.query("java")["Value"].tolist() == ["coffee"]
+    assert engine.query("a diaper")["Value"].tolist() == ["diapers"]
+    assert engine.query("supermarket")["Value"].tolist() == ["diapers", "coffee"]
+    # only the terms of the queries are asked to the model
+    assert client.calls == 3
+
+    # the facts committed afterwards are expanded too, and the index is rebuilt from the saved synonyms
+    engine._commit_facts([("Shopping", "List", "", "groceries", "espresso")])
+    assert engine.query("coffee")["Value"].tolist() == ["coffee", "espresso"]
+    assert create_engine(tmp_path, client).query_cursor("coffee").to_dataframe()["Value"].tolist() == ["coffee", "espresso"]
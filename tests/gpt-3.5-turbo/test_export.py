@@ -0,0 +1,121 @@
+import pytest
+import gzip
+import io
+import json
+import re
+import zipfile
+from xml.etree import ElementTree
+
+import sys
+sys.path.append('../../src/gpt-3.5-turbo')
+import pandas as pd
+from engine import BraindumpEngine
+from export import iter_export, EXPORT_FORMATS, ExportCache
+from fakes import FakeCompletionClient
+from storage import open_fact_store, FactCursor
+
+FACTS = pd.DataFrame([("Work", "Email", "sales guy", "email", "jp@example.com"),
+                      ("Shopping", "List", None, "groceries", "milk, eggs"),
+                      ("Work", "Phone", "hr", "phone", "555-555-5555")], columns=["Category", "Type", "People", "Key", "Value"])
+
+def chunks_of(df, size):
+    return [df.iloc[start:start + size] for start in range(0, len(df), size)]
+
+############################################################################################################
+# Tests
+############################################################################################################
+@pytest.mark.parametrize("sep,file_type", [(",", "csv"), ("\t", "tsv")])
+def test_delimited_export_matches_in_memory_export(sep, file_type):
+    exported = b"".join(iter_export(chunks_of(FACTS, 2), file_type))
+    assert exported == FACTS.to_csv(sep=sep).encode("utf-8")
+
+def test_compressed_csv_export():
+    exported = b"".join(iter_export(chunks_of(FACTS, 1), "csv.gz"))
+    assert gzip.decompress(exported) == FACTS.to_csv().encode("utf-8")
+
+def test_jsonl_export():
+    lines = b"".join(iter_export(chunks_of(FACTS, 2), "jsonl")).decode("utf-8").splitlines()
+    assert [json.loads(line)["Value"] for line in lines] == FACTS["Value"].tolist()
+
+def test_parquet_export_from_cursor(tmp_path):
+    store = open_fact_store(str(tmp_path / "database.arrow"))
+    store.save(FACTS)
+    cursor = FactCursor(store, lambda batch: batch[batch["Category"] == "Work"], batch_size=1)
+
+    exported = b"".join(iter_export(cursor.iter_chunks(chunk_size=1), "parquet"))
+    assert pd.read_parquet(io.BytesIO(exported))["Value"].tolist() == ["jp@example.com", "555-555-5555"]
+
+def read_worksheet(data):
+    # the first worksheet of a workbook, read from its XML so that no Excel reader is needed
+    namespace = {"s": "http://schemas.openxmlformats.org/spreadsheetml/2006/main"}
+    sheet = ElementTree.fromstring(zipfile.ZipFile(io.BytesIO(data)).read("xl/worksheets/sheet1.xml"))
+    rows = []
+    for row in sheet.iterfind(".//s:sheetData/s:row", namespace):
+        cells = {}
+        for cell in row.iterfind("s:c", namespace):
+            value = cell.findtext("s:is/s:t", namespaces=namespace) if cell.get("t") == "inlineStr" else cell.findtext("s:v", namespaces=namespace)
+            cells[re.match(r"[A-Z]+", cell.get("r")).group(0)] = int(value) if cell.get("t") is None else value
+        rows.append(cells)
+    columns = sorted(set(column for cells in rows for column in cells), key=lambda column: (len(column), column))
+    df = pd.DataFrame([[cells.get(column) for column in columns] for cells in rows[1:]], columns=[rows[0].get(column) for column in columns])
+    return df.set_index(df.columns[0])
+
+def test_excel_export():
+    exported = b"".join(iter_export(chunks_of(FACTS, 2), "excel"))
+    df = read_worksheet(exported)
+    assert df["Key"].tolist() == FACTS["Key"].tolist()
+    assert df.index.tolist() == [0, 1, 2]
+
+@pytest.mark.parametrize("file_type", list(EXPORT_FORMATS.keys()))
+def test_empty_export(file_type):
+    assert len(b"".join(iter_export([], file_type))) > 0 or file_type == "jsonl"
+
+def test_invalid_file_type():
+    with pytest.raises(ValueError):
+        iter_export([], "pdf")
+
+def test_export_cache_evicts_least_recently_used():
+    cache = ExportCache(max_bytes=10, max_entry_bytes=6)
+    cache.put("a", b"aaaa")
+    cache.put("b", b"bbbb")
+    assert cache.get("a") == b"aaaa"
+    cache.put("c", b"cccc")
+    assert cache.get("b") is None
+    assert cache.get("a") == b"aaaa" and cache.get("c") == b"cccc"
+    cache.put("d", b"ddddddd") # too large to be kept
+    assert cache.get("d") is None and cache.size() == 8
+
+def test_engine_exports_snapshot_once(tmp_path):
+    database_file_path = str(tmp_path / "database.arrow")
+    open_fact_store(database_file_path).save(FACTS)
+    client = FakeCompletionClient()
+    engine = BraindumpEngine(database_file_path=database_file_path, categories_file_path=str(tmp_path / "categories.csv"), gpt_client=client)
+
+    result_id = engine.query_snapshot("sales email", categories=["Work"])
+    calls = client.calls
+    assert engine.query_snapshot("sales email", categories=["Work"]) == result_id
+    assert client.calls == calls
+
+    exported = engine.export_result(result_id, "csv")
+    assert b"jp@example.com" in exported
+    assert engine.export_result(result_id, "csv") is exported
+
+    engine.extract_facts("sales email = other@example.com")
+    engine.commit()
+    assert engine.query_snapshot("sales email", categories=["Work"]) != result_id
+
+def test_snapshot_id_depends_on_search_settings(tmp_path):
+    database_file_path = str(tmp_path / "database.arrow")
+    open_fact_store(database_file_path).save(FACTS)
+    engine = BraindumpEngine(database_file_path=database_file_path, categories_file_path=str(tmp_path / "categories.csv"),
+                             gpt_client=FakeCompletionClient())
+
+    result_ids = {engine.query_snapshot("sales email")}
+    for change in [lambda: engine.gpt_parameters.update(engine="gpt-4o-mini"), lambda: engine.gpt_parameters.update(temperature=0.5),
+                   lambda: engine.model_routes.update(terms_extraction_prompt={"engine": "small"}),
+                   lambda: setattr(engine, "fuzzy_search", not engine.fuzzy_search),
+                   lambda: setattr(engine, "index_expansion", not engine.index_expansion)]:
+        change()
+        result_id = engine.query_snapshot("sales email")
+        assert result_id not in result_ids
+        result_ids.add(result_id)
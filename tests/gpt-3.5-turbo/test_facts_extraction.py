@@ -14,16 +14,19 @@ TEST_CATEGORIES = ["Family", "Work", "Friends", "Shopping", "Health", "Finance",
 # Owing to the non-deterministic nature of the model, we should support some way to deal with ambiguities.
 # An ambiguous field is a field that can have multiple valid extractions. For example, the Category field can be either 
 # 'Travel' or 'Work', it can be specified as ['Travel', 'Work']. Se examples below.
+#
+# Model calls are replayed from the cassettes in `cassettes/`. To refresh them against the live model, 
+# run `pytest -s --record-mode=rerecord` with the PERSONAL_OPENAI_API_KEY environment variable set.
 ############################################################################################################
-def test_work():
+def test_work(completion_client):
     # Each NL utterance is mapped into the expected values.
     nl_utterances = [("sales guy email = jp@example.com", [('Work', 'Email', 'sales guy', 'email', 'jp@example.com')]),
                      ("my employee number is 12345678", [('Work', ['Document', 'Other'], '', 'employee number', '12345678')])
                     ]
 
-    extract_and_check_all(nl_utterances)
+    extract_and_check_all(nl_utterances, completion_client)
 
-def test_shopping_lists():
+def test_shopping_lists(completion_client):
     # Each NL utterance is mapped into the expected values.
     nl_utterances = [("I need to buy milk, eggs, and bread", [('Shopping', 'List', '', ['groceries', 'milk', 'to buy'], ['buy', 'milk']), 
                                                               ('Shopping', 'List', '', ['groceries', 'eggs' 'to buy'], ['buy', 'eggs']), 
@@ -32,35 +35,39 @@ def test_shopping_lists():
                                                            ('Shopping', 'List', '', ['baby cream', 'buy'], ['baby cream', 'buy']), 
                                                            ('Shopping', 'List', '', ['cotton', 'buy'], ['cotton', 'buy'])])]
 
-    extract_and_check_all(nl_utterances)
+    extract_and_check_all(nl_utterances, completion_client)
 
-def test_ambiguous_travel():
+def test_ambiguous_travel(completion_client):
     # Each NL utterance is mapped into the expected values.
     nl_utterances = [("remember to buy plane tickets to meet customer", [(['Travel', 'Work'], ['Reminder', 'Pendency'], 'customer', 'plane tickets', 'buy')]),
                      ("in jen's free time she told me she likes to travel", [(['Travel', 'Hobbies', 'Friends', 'Personal'], ['List', 'Note'], 'jen', ['free time', 'travel', 'hobbies'], ['travel', 'likes', 'likes to travel'])])
                     ]
-    extract_and_check_all(nl_utterances)
+    extract_and_check_all(nl_utterances, completion_client)
         
 ############################################################################################################
 # Helper functions
 ############################################################################################################
 
-def extract_and_check_all(nl_utterances, max_attempts=10):
+def extract_and_check_all(nl_utterances, completion_client, max_attempts=10):
     """
     Helper function to extract facts from a list of natural language utterances and check if the
     extracted facts match the ground truth. Owing to the non-deterministic nature of the underlying
     NLP engine, the function will try to extract the facts up to `max_attempts` times before failing.
+    Replayed completions are deterministic, so in that case there is a single attempt.
     """
+    if completion_client.mode == "replay":
+        max_attempts = 1
+
     for nl_utterance, truth in nl_utterances:
-        extract_and_check(nl_utterance, truth, max_attempts)
+        extract_and_check(nl_utterance, truth, completion_client, max_attempts)
 
-def extract_and_check(nl_utterance, truth, max_attempts):
+def extract_and_check(nl_utterance, truth, completion_client, max_attempts):
     """
     Checks one specific NL extraction against the desired ground truth.
     """
     assert max_attempts > 0, "The maximum number of attempts must be greater than 0."
     try:
-        engine = BraindumpEngine(default_categories=TEST_CATEGORIES, api_key=API_KEY)
+        engine = BraindumpEngine(default_categories=TEST_CATEGORIES, api_key=API_KEY, gpt_client=completion_client)
         extracted_tuples = engine.extract_facts(nl_utterance)
         
         print("")
@@ -80,7 +87,7 @@ def extract_and_check(nl_utterance, truth, max_attempts):
         # if the test fails, try again up to `max_attempts` times
         if max_attempts > 1:
             print("Failed, but will retry...")
-            extract_and_check(nl_utterance, truth, max_attempts-1)
+            extract_and_check(nl_utterance, truth, completion_client, max_attempts-1)
         else:
             print("Failed too many times, giving up.")
             raise e
@@ -0,0 +1,55 @@
+import pytest
+
+import sys
+sys.path.append('../../src/gpt-3.5-turbo')
+import pandas as pd
+from engine import BraindumpEngine
+from fakes import FakeCompletionClient
+from fuzzy import TrigramIndex
+from storage import open_fact_store
+
+FACTS = pd.DataFrame([("Health", "Contact", "Jen", "pediatrician", "Dr. Smith, 555-1234"),
+                      ("Shopping", "List", "", "coffee", "buy espresso beans"),
+                      ("Work", "Note", "Bob", "quarterly report", "due on Friday"),
+                      ("Health", "Note", "", "dentist", "checkup in May")],
+                     columns=["Category", "Type", "People", "Key", "Value"])
+
+############################################################################################################
+# Tests
+############################################################################################################
+def test_similar_words():
+    index = TrigramIndex.from_batches([FACTS])
+    assert index.similar_words("pedatrician") == ["pediatrician"]
+    assert index.similar_words("Coffe") == ["coffee"]
+    assert index.similar_words("bob") == ["bob"]
+    assert index.similar_words("bo") == []
+    assert index.similar_words("giraffe") == []
+
+def test_search_positions():
+    index = TrigramIndex.from_batches([FACTS.iloc[:2], FACTS.iloc[2:]])
+    assert index.search("pedatrician").tolist() == [0]
+    assert index.search("quartely repport").tolist() == [2]
+    assert index.search("quarterly dentist").tolist() == []
+
+    index.add(4, {"Category": "Family", "Key": "pediatrician", "Value": "Dr. Jones"})
+    assert index.search("pediatrician").tolist() == [0, 4]
+
+def test_engine_query_finds_misspelled_terms(tmp_path):
+    database_file_path = str(tmp_path / "database.csv")
+    open_fact_store(database_file_path).save(FACTS)
+    responses = {"Input: who is the pedatrician": "pedatrician",
+                 "Input: pedatrician": "pedatricians",
+                 "Input: new pediatrician": '("Health", "Contact", "", "pediatrician", "Dr. Jones")'}
+    engine = BraindumpEngine(database_file_path=database_file_path, categories_file_path=str(tmp_path / "categories.csv"),
+                             gpt_client=FakeCompletionClient(responses=responses))
+
+    assert engine.query("who is the pedatrician")["Value"].tolist() == ["Dr. Smith, 555-1234"]
+    assert engine.query_cursor("who is the pedatrician").to_dataframe()["Value"].tolist() == ["Dr. Smith, 555-1234"]
+
+    # the index is kept up to date on commit
+    engine.extract_facts("new pediatrician")
+    engine.commit()
+    assert engine.query("who is the pedatrician")["Value"].tolist() == ["Dr. Smith, 555-1234", "Dr. Jones"]
+
+    engine.fuzzy_search = False
+    assert len(engine.query("who is the pedatrician")) == 0
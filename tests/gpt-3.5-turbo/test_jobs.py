@@ -0,0 +1,86 @@
+import pytest
+import threading
+
+import sys
+sys.path.append('../../src/gpt-3.5-turbo')
+from engine import BraindumpEngine
+from fakes import FakeCompletionClient
+from jobs import ExtractionQueue
+from storage import open_fact_store
+
+############################################################################################################
+# Tests
+############################################################################################################
+def test_queue_runs_jobs_in_background():
+    release = threading.Event()
+    def extract(utterance, user):
+        release.wait(5)
+        if utterance == "fail":
+            raise RuntimeError("model unavailable")
+        return [("Other", "Note", "", utterance, "")], []
+
+    queue = ExtractionQueue(extract, max_workers=2)
+    first = queue.submit("first", user="ana")
+    failing = queue.submit("fail", user="ana")
+    other = queue.submit("other", user="bob")
+    assert [job.job_id for job in queue.staged("ana")] == [first, failing]
+    assert not queue.job(first).is_finished()
+
+    release.set()
+    assert queue.job(first).wait(5) and queue.job(failing).wait(5)
+    assert queue.job(first).status == "done" and queue.job(first).facts[0][3] == "first"
+    assert queue.job(failing).status == "failed" and "unavailable" in queue.job(failing).error
+
+    queue.take(first)
+    assert [job.job_id for job in queue.staged("ana")] == [failing]
+    assert [job.job_id for job in queue.staged("bob")] == [other]
+    queue.shutdown()
+
+def test_engine_stages_extractions_per_user(tmp_path):
+    database_file_path = str(tmp_path / "database.csv")
+    engine = BraindumpEngine(database_file_path=database_file_path, categories_file_path=str(tmp_path / "categories.csv"),
+                             gpt_client=FakeCompletionClient())
+
+    shopping = engine.submit_extraction("groceries: milk, eggs", user="ana")
+    note = engine.submit_extraction("wifi password = 1234", user="ana")
+    engine.submit_extraction("gift = book", user="bob")
+    assert len(engine.staged_extractions("ana")) == 2
+    for job in engine.staged_extractions("ana") + engine.staged_extractions("bob"):
+        assert job.wait(5)
+
+    assert [fact[4] for fact in engine.commit_extraction(shopping)] == ["milk", "eggs"]
+    engine.cancel_extraction(note)
+    assert engine.staged_extractions("ana") == []
+    assert len(engine.staged_extractions("bob")) == 1
+    assert engine.usage.snapshot()["sessions"]["ana"]["calls"] == 2
+
+    assert open_fact_store(database_file_path).load()["Value"].tolist() == ["milk", "eggs"]
+    assert not engine.has_extracted_facts()
+
+def test_engine_commits_each_job_once(tmp_path):
+    database_file_path = str(tmp_path / "database.csv")
+    engine = BraindumpEngine(database_file_path=database_file_path, categories_file_path=str(tmp_path / "categories.csv"),
+                             gpt_client=FakeCompletionClient(latency_seconds=0.2))
+    # no job was submitted yet
+    for method in [engine.extraction_job, engine.commit_extraction, engine.cancel_extraction]:
+        with pytest.raises(KeyError):
+            method("unknown")
+
+    job_id = engine.submit_extraction("groceries: milk, eggs")
+    with pytest.raises(ValueError):
+        engine.commit_extraction(job_id) # still running
+    assert engine.extraction_job(job_id).wait(5)
+
+    outcomes = []
+    def commit():
+        try:
+            outcomes.append(len(engine.commit_extraction(job_id)))
+        except KeyError:
+            outcomes.append("taken")
+    threads = [threading.Thread(target=commit) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(outcomes, key=str) == [2, "taken", "taken", "taken"]
+    assert open_fact_store(database_file_path).load()["Value"].tolist() == ["milk", "eggs"]
@@ -0,0 +1,32 @@
+import pytest
+
+import sys
+sys.path.append('../../src/gpt-3.5-turbo')
+import pandas as pd
+from matcher import TermMatcher
+
+############################################################################################################
+# Tests
+############################################################################################################
+def test_find_reports_terms():
+    matcher = TermMatcher(["coffee", "Java", "coffee beans", "fee", "java "])
+    assert matcher.terms == ["coffee", "java", "coffee beans", "fee"]
+    assert matcher.terms_of(matcher.find("Buy COFFEE beans")) == ["coffee", "coffee beans", "fee"]
+    assert matcher.terms_of(matcher.find("javascript")) == ["java"]
+    assert matcher.find("tea") == 0
+
+def test_terms_are_literals():
+    matcher = TermMatcher(["c++", "(555)", "a.b"])
+    assert matcher.terms_of(matcher.find("learn C++ and c#")) == ["c++"]
+    assert matcher.terms_of(matcher.find("call (555) 123")) == ["(555)"]
+    assert matcher.find("axb") == 0
+
+@pytest.mark.parametrize("dtype", [object, pd.ArrowDtype(__import__("pyarrow").string())])
+def test_match_series(dtype):
+    matcher = TermMatcher(["coffee", "jen", "c++"])
+    series = pd.Series(["coffee for Jen", None, "tea", "Coffee", "C++ book"], dtype=dtype)
+    found = matcher.match_series(series)
+    assert [matcher.terms_of(mask) for mask in found] == [["coffee", "jen"], [], [], ["coffee"], ["c++"]]
+
+def test_no_terms_match_nothing():
+    assert TermMatcher(["", " "]).match_series(pd.Series(["coffee"])).tolist() == [0]
@@ -0,0 +1,81 @@
+import pytest
+
+import sys
+sys.path.append('../../src/gpt-3.5-turbo')
+from engine import BraindumpPostprocessor
+
+############################################################################################################
+# Tests
+#
+# These tests do not call the model: they check how raw completions are turned into fact tuples.
+############################################################################################################
+def test_well_formed_tuples():
+    postprocessor = BraindumpPostprocessor()
+    tuples, rejected_lines = postprocessor.parse_tuples("""
+("Family", "Phone", "mom", "mom's number", "555-555-5555")
+('Work', 'Email', 'building administration', 'email', 'adm@example.com')
+""")
+
+    assert tuples == [("Family", "Phone", "mom", "mom's number", "555-555-5555"),
+                      ("Work", "Email", "building administration", "email", "adm@example.com")]
+    assert rejected_lines == []
+
+def test_malformed_lines_do_not_discard_valid_ones():
+    postprocessor = BraindumpPostprocessor()
+    tuples, rejected_lines = postprocessor.parse_tuples("""
+Here are the extracted facts:
+("Health", "List", "", "to do", "lab work")
+((broken))
+("Health", "List", "", "to do", "ultrasound")
+""")
+
+    assert tuples == [("Health", "List", "", "to do", "lab work"),
+                      ("Health", "List", "", "to do", "ultrasound")]
+    assert rejected_lines == ["Here are the extracted facts:", "((broken))"]
+
+def test_common_defects_are_repaired():
+    postprocessor = BraindumpPostprocessor()
+    tuples, rejected_lines = postprocessor.parse_tuples("""
+(“Shopping”, “List”, “”, “aspirin”, “buy”,)
+("Shopping", "List", "diapers", "buy")
+("Finance", "List", "company", "2024 investment idea", "AI", "electric cars")
+('Friends', 'Note', 'jen', 'jen's hobby', 'travel'
+("Work", "Document", None, "employee number", 12345678)
+""")
+
+    assert tuples == [("Shopping", "List", "", "aspirin", "buy"),
+                      ("Shopping", "List", "", "diapers", "buy"),
+                      ("Finance", "List", "company", "2024 investment idea", "AI, electric cars"),
+                      ("Friends", "Note", "jen", "jen's hobby", "travel"),
+                      ("Work", "Document", "", "employee number", "12345678")]
+    assert rejected_lines == []
+
+def test_too_few_fields_are_rejected():
+    postprocessor = BraindumpPostprocessor()
+    tuples, rejected_lines = postprocessor.parse_tuples('("Other", "Note", "something")')
+
+    assert tuples == []
+    assert rejected_lines == ['("Other", "Note", "something")']
+
+def test_string_to_tuples_keeps_partial_results():
+    postprocessor = BraindumpPostprocessor()
+    assert postprocessor.string_to_tuples('("Pets", "Note", "", "dog", "Rex")\nnot a tuple') == [("Pets", "Note", "", "dog", "Rex")]
+
+def test_json_facts():
+    postprocessor = BraindumpPostprocessor()
+    tuples, rejected_items = postprocessor.parse_json_facts("""
+{"facts": [{"category": "Work", "type": "Email", "people": "sales guy", "key": "email", "value": "jp@example.com"},
+           {"category": "Work", "type": "Document", "people": null, "key": "employee number", "value": 12345678},
+           {"category": "Work", "type": "Note"}]}
+""")
+
+    assert tuples == [("Work", "Email", "sales guy", "email", "jp@example.com"),
+                      ("Work", "Document", "", "employee number", "12345678")]
+    assert rejected_items == ['{"category": "Work", "type": "Note"}']
+
+def test_invalid_json_is_rejected():
+    postprocessor = BraindumpPostprocessor()
+    tuples, rejected_items = postprocessor.parse_json_facts('{"facts": [{"category": "Work"')
+
+    assert tuples == []
+    assert rejected_items == ['{"facts": [{"category": "Work"']
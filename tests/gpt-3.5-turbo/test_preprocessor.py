@@ -0,0 +1,29 @@
+import pytest
+
+import sys
+sys.path.append('../../src/gpt-3.5-turbo')
+from engine import BraindumpPreprocessor
+from prompt_tokens import TokenCounter, load_corpus, token_report
+
+TEST_CATEGORIES = ["Family", "Work", "Friends", "Shopping", "Health", "Finance", "Travel", "Home", "Pets", "Hobbies", "Other"]
+
+############################################################################################################
+# Tests
+############################################################################################################
+def test_all_variants_include_the_input_and_categories():
+    preprocessor = BraindumpPreprocessor()
+    for variant in BraindumpPreprocessor.EXTRACTION_PROMPT_VARIANTS:
+        prompt = preprocessor.extraction_prompt("sales guy email = jp@example.com", TEST_CATEGORIES, variant=variant)
+        assert "sales guy email = jp@example.com" in prompt
+        assert all(category in prompt for category in TEST_CATEGORIES)
+
+def test_invalid_variant():
+    with pytest.raises(ValueError):
+        BraindumpPreprocessor().extraction_prompt("anything", TEST_CATEGORIES, variant="nonexistent")
+
+def test_cheaper_variants_use_fewer_tokens():
+    report = token_report(load_corpus("data/labeled_utterances.jsonl"), TokenCounter(), categories=TEST_CATEGORIES)
+    
+    assert report["compact"]["prompt_tokens"] < report["full"]["prompt_tokens"]
+    assert report["zero-shot"]["prompt_tokens"] < report["compact"]["prompt_tokens"]
+    assert report["full"]["completion_tokens"] > 0
@@ -0,0 +1,86 @@
+import pytest
+
+import sys
+sys.path.append('../../src/gpt-3.5-turbo')
+from engine import BraindumpEngine
+from fakes import FakeCompletionClient
+from routing import route_parameters, select_model
+from telemetry import UsageRecorder
+
+class RecordingClient(FakeCompletionClient):
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.requests = []
+
+    def complete(self, user_prompt, model='gpt-3.5-turbo', response_format=None, **kwargs):
+        self.requests.append(dict(kwargs, model=model))
+        return super().complete(user_prompt, model=model, response_format=response_format, **kwargs)
+
+def usage_with_latencies(latencies):
+    usage = UsageRecorder()
+    for model, seconds in latencies.items():
+        usage.record_call(model, seconds=seconds)
+    return usage
+
+############################################################################################################
+# Tests
+############################################################################################################
+def test_select_model():
+    usage = usage_with_latencies({"cheap": 2.0, "fast": 0.5})
+    assert select_model(["cheap", "fast", "new"], usage) == "new"
+    assert select_model(["cheap", "fast"], usage) == "fast"
+    assert select_model(["cheap", "fast"], usage, max_p95_seconds=3.0) == "cheap"
+    assert select_model(["cheap", "fast"], usage, max_p95_seconds=0.1) == "fast"
+
+def test_route_parameters():
+    gpt_parameters = {"engine": "gpt-3.5-turbo", "temperature": 0.1, "max_tokens": 200}
+    assert route_parameters(gpt_parameters, {}) == gpt_parameters
+    assert route_parameters(gpt_parameters, {"engine": "small", "temperature": 0.0}) == {"engine": "small", "temperature": 0.0, "max_tokens": 200}
+    with pytest.raises(ValueError):
+        route_parameters(gpt_parameters, {"model": "small"})
+
+def test_engine_routes_prompts(tmp_path):
+    client = RecordingClient(responses={"Input: gift = book": '("Friends", "Wish", "", "gift", "book")'})
+    engine = BraindumpEngine(database_file_path=str(tmp_path / "database.csv"), categories_file_path=str(tmp_path / "categories.csv"),
+                             gpt_client=client, model_routes={"terms_extraction_prompt": {"engine": "small", "temperature": 0.0},
+                                                              "terms_augmentation_prompt": {"candidates": ["cheap", "fast"]}})
+    engine.usage.record_call("cheap", seconds=2.0)
+    engine.usage.record_call("fast", seconds=0.5)
+
+    engine.extract_facts("gift = book")
+    engine.query("coffee")
+    assert [(request["model"], request["temperature"]) for request in client.requests] == [("gpt-3.5-turbo", 0.1), ("small", 0.0), ("fast", 0.1)]
+
+def test_select_model_skips_failing_models():
+    usage = usage_with_latencies({"fast": 0.5})
+    usage.record_call("broken", error=True)
+    assert select_model(["broken", "fast"], usage) == "fast"
+    # failing models are tried again after a while, and are used again once they succeed
+    assert select_model(["broken", "fast"], usage, error_backoff_seconds=0.0) == "broken"
+    usage.record_call("broken", seconds=0.1)
+    assert select_model(["broken", "fast"], usage) == "broken"
+    # when all the candidates are failing, the one that failed the longest ago is tried
+    usage.record_call("broken", error=True)
+    usage.record_call("fast", error=True)
+    assert select_model(["fast", "broken"], usage) == "broken"
+
+class FailingModelClient(RecordingClient):
+
+    def complete(self, user_prompt, model='gpt-3.5-turbo', response_format=None, **kwargs):
+        if model == "broken":
+            self.requests.append(dict(kwargs, model=model))
+            with self.usage_recorder.timed_call(model):
+                raise RuntimeError(f"The model {model} does not exist.")
+        return super().complete(user_prompt, model=model, response_format=response_format, **kwargs)
+
+def test_engine_skips_failing_models(tmp_path):
+    client = FailingModelClient(responses={"Terms:": "coffee: java"})
+    engine = BraindumpEngine(database_file_path=str(tmp_path / "database.csv"), categories_file_path=str(tmp_path / "categories.csv"),
+                             gpt_client=client, model_routes={"terms_augmentation_prompt": {"candidates": ["broken", "working"]}})
+    engine.usage.record_call("working", seconds=2.0)
+
+    # the failing model, not measured yet, is tried first, and the other candidate right after it
+    engine.query("coffee")
+    engine.query("tea")
+    assert [request["model"] for request in client.requests if request["model"] != "gpt-3.5-turbo"] == ["broken", "working", "working"]
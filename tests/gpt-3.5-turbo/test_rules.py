@@ -0,0 +1,63 @@
+import pytest
+
+import sys
+sys.path.append('../../src/gpt-3.5-turbo')
+from engine import BraindumpEngine
+from evaluation import score_extraction
+from fakes import FakeCompletionClient
+from prompt_tokens import DEFAULT_CATEGORIES, load_corpus
+from rules import RuleExtractor
+
+############################################################################################################
+# Tests
+############################################################################################################
+@pytest.mark.parametrize("utterance,expected", [
+    ("sales guy email = jp@example.com", ("Work", "Email", "sales guy", "email", "jp@example.com")),
+    ("email of the building administration = adm@example.com", ("Work", "Email", "building administration", "email", "adm@example.com")),
+    ("dentist's phone: (555) 123-4567", ("Health", "Phone", "dentist", "dentist's phone", "(555) 123-4567")),
+    ("MSFT stock price = $250", ("Finance", "Price", "", "MSFT stock price", "$250")),
+    ("wifi password = 1234", ("Home", "Note", "", "wifi password", "1234"))])
+def test_typed_values_and_notes(utterance, expected):
+    extraction = RuleExtractor().extract(utterance, DEFAULT_CATEGORIES)
+    assert extraction.facts == [expected]
+    assert extraction.confidence >= BraindumpEngine.RULE_EXTRACTION_MIN_CONFIDENCE
+
+def test_lists():
+    extraction = RuleExtractor().extract("Buy: diapers, baby cream and cotton", DEFAULT_CATEGORIES)
+    assert extraction.rule == "list"
+    assert [fact[4] for fact in extraction.facts] == ["diapers", "baby cream", "cotton"]
+    assert all(fact[:4] == ("Shopping", "List", "", "Buy") for fact in extraction.facts)
+
+def test_unsure_or_unknown_shapes():
+    extractor = RuleExtractor()
+    # the category cannot be told, so the model should be asked
+    assert extractor.extract("to do: call mom, pay rent", DEFAULT_CATEGORIES).confidence < BraindumpEngine.RULE_EXTRACTION_MIN_CONFIDENCE
+    assert extractor.extract("docs link = https://example.com", DEFAULT_CATEGORIES).facts[0][:2] == ("Other", "Document")
+    assert extractor.extract("sales guy email = jp@example.com", ["Family", "Other"]).facts[0][0] == "Other"
+    for utterance in ["my employee number is 12345678", "what is the wifi password?", "Domingos kids are Vitorio and Valentino",
+                      # a single item after a colon is not a list
+                      "Reminder: pick up kids at 5", "dentist appointment: 3 pm", "Meeting with boss: 10am tomorrow"]:
+        assert extractor.extract(utterance, DEFAULT_CATEGORIES) is None
+
+def test_confident_extractions_are_right():
+    # whatever the rules are confident about in the labeled corpus must be as good as the model
+    extractor = RuleExtractor()
+    for item in load_corpus("data/labeled_utterances.jsonl"):
+        extraction = extractor.extract(item["utterance"], DEFAULT_CATEGORIES)
+        if extraction is not None and extraction.confidence >= BraindumpEngine.RULE_EXTRACTION_MIN_CONFIDENCE:
+            correct, right_count = score_extraction(extraction.facts, item["expected"])
+            assert right_count and all(count == len(item["expected"]) for count in correct.values()), item["utterance"]
+
+def test_engine_falls_back_to_model(tmp_path):
+    client = FakeCompletionClient(responses={"Input: gift = book": '("Friends", "Wish", "", "gift", "book")'})
+    engine = BraindumpEngine(database_file_path=str(tmp_path / "database.csv"), categories_file_path=str(tmp_path / "categories.csv"),
+                             gpt_client=client, rule_extraction=True)
+
+    assert engine.extract_facts("hr email = hr@example.com") == [("Work", "Email", "hr", "email", "hr@example.com")]
+    assert client.calls == 0
+    assert engine.extract_facts("gift = book") == [("Friends", "Wish", "", "gift", "book")]
+    assert client.calls == 1
+
+    statistics = engine.rule_extraction_statistics()
+    assert statistics["attempts"] == 2 and statistics["hits"] == 1 and statistics["hit_rate"] == 0.5
+    assert statistics["hits_by_rule"] == {"email": 1}
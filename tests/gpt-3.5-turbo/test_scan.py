@@ -0,0 +1,54 @@
+import pytest
+
+import sys
+sys.path.append('../../src/gpt-3.5-turbo')
+import pandas as pd
+from engine import BraindumpEngine
+from fakes import FakeCompletionClient
+from matcher import TermMatcher
+from scan import ParallelScanner
+from storage import open_fact_store
+
+FACTS = pd.DataFrame([("Health", "Contact", "Jen", "pediatrician", "Dr. Smith"),
+                      ("Shopping", "List", "", "coffee", "buy espresso beans"),
+                      ("Work", "Note", "Bob", "quarterly report", "due on Friday"),
+                      ("Shopping", "List", "Jen", "gift", "coffee mug"),
+                      ("Health", "Note", "", "dentist", "checkup in May"),
+                      ("Work", "List", "", "coffee", "buy filters")],
+                     columns=["Category", "Type", "People", "Key", "Value"])
+
+@pytest.fixture(scope="module")
+def scanner():
+    scanner = ParallelScanner(workers=2, min_shard_size=2)
+    yield scanner
+    scanner.close()
+
+############################################################################################################
+# Tests
+############################################################################################################
+def test_scan_merges_shards(scanner):
+    assert scanner.scan(FACTS, 0, categories=["shopping", "Work"]).tolist() == [1, 2, 3, 5]
+    assert scanner.scan(FACTS, 0, matcher=TermMatcher(["coffee"])).tolist() == [1, 3, 5]
+    assert scanner.scan(FACTS, 0, categories=["Work"], matcher=TermMatcher(["coffee"]), fuzzy_positions=[2]).tolist() == [2, 5]
+
+def test_scan_republishes_new_versions(scanner):
+    assert scanner.scan(FACTS.iloc[:3], 1, matcher=TermMatcher(["coffee"])).tolist() == [1]
+    assert scanner.scan(FACTS, 2, matcher=TermMatcher(["coffee"])).tolist() == [1, 3, 5]
+
+def test_engine_query_in_parallel(tmp_path):
+    database_file_path = str(tmp_path / "database.csv")
+    open_fact_store(database_file_path).save(FACTS)
+    responses = {"Input: coffee for jen": "coffee\njen", "Input: coffee": "java", "Input: jen": "jennifer"}
+    engine = BraindumpEngine(database_file_path=database_file_path, categories_file_path=str(tmp_path / "categories.csv"),
+                             gpt_client=FakeCompletionClient(responses=responses))
+    sequential = engine.query("coffee for jen", categories=["Shopping", "Health"])
+
+    engine.PARALLEL_SCAN_MIN_FACTS = 1
+    engine.SCAN_WORKERS = 2
+    try:
+        assert engine._scans_in_parallel()
+        parallel = engine.query("coffee for jen", categories=["Shopping", "Health"])
+        pd.testing.assert_frame_equal(parallel, sequential)
+        assert engine.query("", categories=["work"])["Key"].tolist() == ["quarterly report", "coffee"]
+    finally:
+        engine._parallel_scanner.close()
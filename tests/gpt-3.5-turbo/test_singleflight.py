@@ -0,0 +1,68 @@
+import pytest
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import sys
+sys.path.append('../../src/gpt-3.5-turbo')
+from engine import BraindumpEngine
+from fakes import FakeCompletionClient
+from singleflight import SingleFlight
+
+############################################################################################################
+# Tests
+############################################################################################################
+def test_concurrent_calls_are_coalesced():
+    group = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+    def slow_call():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "result"
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        leader = executor.submit(group.do, "key", slow_call)
+        started.wait(5)
+        followers = [executor.submit(group.do, "key", slow_call) for _ in range(3)]
+        while group.coalesced < 3:
+            pass
+        release.set()
+        assert leader.result() == ("result", False)
+        assert [follower.result() for follower in followers] == [("result", True)] * 3
+
+    assert len(calls) == 1
+    assert group.in_flight() == 0
+    assert group.do("key", lambda: "again") == ("again", False) # completed calls are not cached
+
+def test_errors_are_shared_with_waiting_callers():
+    group = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    def failing_call():
+        started.set()
+        release.wait(5)
+        raise RuntimeError("rate limited")
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        leader = executor.submit(group.do, "key", failing_call)
+        started.wait(5)
+        follower = executor.submit(group.do, "key", failing_call)
+        while group.coalesced < 1:
+            pass
+        release.set()
+        for future in [leader, follower]:
+            with pytest.raises(RuntimeError):
+                future.result()
+
+def test_engine_coalesces_identical_queries(tmp_path):
+    client = FakeCompletionClient(latency_seconds=0.2)
+    engine = BraindumpEngine(database_file_path=str(tmp_path / "database.csv"), categories_file_path=str(tmp_path / "categories.csv"),
+                             gpt_client=client)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(lambda i: engine.query_cursor("buy coffee").total_count(), range(4)))
+
+    assert results == [0] * 4
+    assert client.calls == 2 # one terms extraction and one synonyms request, instead of 8
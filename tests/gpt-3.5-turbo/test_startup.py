@@ -0,0 +1,23 @@
+import pytest
+import json
+import subprocess
+import sys
+
+############################################################################################################
+# Tests
+############################################################################################################
+def test_heavy_dependencies_are_imported_lazily(tmp_path):
+    # in a fresh process, so that nothing is already imported
+    script = f"""
+import json, sys
+sys.path.append('../../src/gpt-3.5-turbo')
+from engine import BraindumpEngine
+engine = BraindumpEngine(api_key="not-used", database_file_path={str(tmp_path / "database.csv")!r},
+                         categories_file_path={str(tmp_path / "categories.csv")!r})
+created = {{"openai": "openai" in sys.modules, "pandas": "pandas" in sys.modules}}
+engine.allowed_categories()
+print(json.dumps(dict(created, files_created=engine._fact_store is not None)))
+"""
+    imported = json.loads(subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True).stdout)
+    assert imported == {"openai": False, "pandas": False, "files_created": False}
+    assert (tmp_path / "categories.csv").read_text().splitlines()[0] == "Category"
@@ -0,0 +1,182 @@
+import pytest
+import os
+
+import sys
+sys.path.append('../../src/gpt-3.5-turbo')
+from engine import BraindumpEngine
+from fakes import FakeCompletionClient
+from storage import open_fact_store, migrate_database, FactCursor, PartitionIndex
+import pandas as pd
+
+FACTS = pd.DataFrame([("Work", "Email", "sales guy", "email", "jp@example.com"),
+                      ("Shopping", "List", "", "groceries", "milk"),
+                      ("Work", "Phone", "hr", "phone", "555-555-5555"),
+                      ("Health", "Doubt", "pediatrician", "brushing teeth", "when to start"),
+                      ("Work", "Pendency", "", "to do", "clean up"),
+                      ("Work", "Note", "", "idea", "electric cars"),
+                      ("Home", "Address", "", "address", "Main St")], columns=["Category", "Type", "People", "Key", "Value"])
+
+############################################################################################################
+# Tests
+############################################################################################################
+@pytest.mark.parametrize("extension", ["arrow", "parquet", "parts"])
+def test_migration_keeps_all_facts(tmp_path, extension):
+    target_path = str(tmp_path / f"database.{extension}")
+    assert migrate_database("data/default_database.csv", target_path) == len(open_fact_store("data/default_database.csv").load())
+    
+    df = open_fact_store(target_path).load()
+    assert df.columns.tolist() == ["Category", "Type", "People", "Key", "Value"]
+
+def test_engine_on_columnar_store(tmp_path):
+    database_file_path = str(tmp_path / "database.arrow")
+    categories_file_path = str(tmp_path / "categories.csv")
+    client = FakeCompletionClient(responses={"Input: sales guy": '("Work", "Email", "sales guy", "email", "jp@example.com")'})
+
+    engine = BraindumpEngine(database_file_path=database_file_path, categories_file_path=categories_file_path, gpt_client=client)
+    engine.extract_facts("sales guy email = jp@example.com")
+    engine.commit()
+
+    engine = BraindumpEngine(database_file_path=database_file_path, categories_file_path=categories_file_path, gpt_client=client)
+    assert len(engine.database) == 1
+    assert engine.query("", categories=["work"])["Value"].tolist() == ["jp@example.com"]
+
+@pytest.mark.parametrize("extension", ["csv", "arrow", "parquet", "parts"])
+def test_cursor_pagination(tmp_path, extension):
+    store = open_fact_store(str(tmp_path / f"database.{extension}"))
+    store.save(FACTS)
+    df = store.load()
+
+    cursor = FactCursor(store, lambda batch: batch[batch["Category"] == "Work"], batch_size=3)
+    expected = df[df["Category"] == "Work"]
+    assert cursor.total_count() == len(expected)
+    assert cursor.page_count(page_size=2) == (len(expected) + 1) // 2
+    assert cursor.page(0, page_size=2).index.tolist() == expected.index[:2].tolist()
+    assert cursor.to_dataframe()["Key"].tolist() == expected["Key"].tolist()
+
+    assert FactCursor(store).total_count() == len(df)
+
+@pytest.mark.parametrize("extension", ["csv", "arrow", "parquet", "parts"])
+def test_take_chunks(tmp_path, extension):
+    store = open_fact_store(str(tmp_path / f"database.{extension}"))
+    store.save(FACTS)
+    chunks = list(store.take_chunks([1, 2, 3, 6], chunk_size=2))
+    assert all(len(chunk) <= 2 for chunk in chunks)
+    assert pd.concat(chunks).index.tolist() == [1, 2, 3, 6]
+    assert pd.concat(chunks)["Key"].tolist() == ["groceries", "phone", "brushing teeth", "address"]
+    assert list(store.take_chunks([], chunk_size=2)) == []
+
+@pytest.mark.parametrize("extension", ["csv", "arrow", "parts"])
+def test_engine_opens_database_lazily(tmp_path, extension):
+    database_file_path = str(tmp_path / f"database.{extension}")
+    open_fact_store(database_file_path).save(FACTS)
+    client = FakeCompletionClient(responses={"Input: hr email": '("Work", "Email", "hr", "email", "hr@example.com")'})
+
+    engine = BraindumpEngine(database_file_path=database_file_path, categories_file_path=str(tmp_path / "categories.csv"), gpt_client=client)
+    assert "Work" in engine.unique_categories_in_database()
+    engine.extract_facts("hr email = hr@example.com")
+    engine.commit()
+    results = engine.query_cursor("", categories=["work"])
+    assert "hr@example.com" in results.to_dataframe()["Value"].tolist()
+    assert engine._database is None
+
+    assert len(engine.database) == len(FACTS) + 1
+
+@pytest.mark.parametrize("extension", ["arrow", "parquet"])
+def test_appends_do_not_rewrite_the_database(tmp_path, extension):
+    store = open_fact_store(str(tmp_path / f"database.{extension}"), max_segments=2)
+    store.save(FACTS.iloc[:3])
+    database_file_time = os.stat(store.path).st_mtime_ns
+    store.append(FACTS.iloc[3:5])
+    store.append(FACTS.iloc[5:6])
+    assert sorted(os.listdir(tmp_path)) == [f"database.{extension}", f"database.{extension}.append-000001", f"database.{extension}.append-000002"]
+    assert os.stat(store.path).st_mtime_ns == database_file_time
+    assert store.load()["Key"].tolist() == FACTS["Key"].iloc[:6].tolist()
+    assert store.count() == 6 and store.take([2, 4, 5])["Key"].tolist() == ["phone", "to do", "idea"]
+    assert pd.concat(store.iter_batches(batch_size=2)).index.tolist() == list(range(6))
+
+    # the segments are merged into the database file every `max_segments` appends, and deleted on the next merge
+    store.append(FACTS.iloc[6:])
+    assert store.load()["Key"].tolist() == FACTS["Key"].tolist()
+    store.append(FACTS.iloc[:1])
+    store.append(FACTS.iloc[:1])
+    store.append(FACTS.iloc[:1])
+    assert sorted(os.listdir(tmp_path)) == [f"database.{extension}", f"database.{extension}.append-000003", f"database.{extension}.append-000004"]
+    assert store.count() == len(FACTS) + 3
+
+def test_parquet_appends_add_row_groups(tmp_path):
+    from pyarrow import parquet
+    store = open_fact_store(str(tmp_path / "database.parquet"), row_group_size=2)
+    store.save(FACTS.iloc[:3])
+    store.append(FACTS.iloc[3:])
+    assert [parquet.ParquetFile(path).metadata.num_row_groups for path in [store.path, f"{store.path}.append-000001"]] == [2, 2]
+    assert store.count() == len(FACTS)
+    assert store.take([1, 4, 6])["Key"].tolist() == ["groceries", "to do", "address"]
+    assert pd.concat(store.iter_batches(batch_size=3))["Key"].tolist() == FACTS["Key"].tolist()
+
+@pytest.mark.parametrize("partition_by", [["Category"], ["Category", "Type"]])
+def test_partitioned_store(tmp_path, partition_by):
+    store = open_fact_store(str(tmp_path / "database.parts"), partition_by=partition_by)
+    store.save(FACTS.iloc[:5])
+    store.append(FACTS.iloc[5:])
+    assert store.load()["Key"].tolist() == FACTS["Key"].tolist()
+    assert store.count() == len(FACTS)
+    assert store.unique("Category") == ["Work", "Shopping", "Health", "Home"]
+    assert store.take([1, 5]).index.tolist() == [1, 5] and store.take([1, 5])["Key"].tolist() == ["groceries", "idea"]
+
+    # only the partitions of the categories (and types) asked for are scanned
+    scanned = pd.concat(store.scan_batches(categories=["work"], entry_types=["Note", "Email"]))
+    assert sorted(scanned.index.tolist()) == ([0, 2, 4, 5] if partition_by == ["Category"] else [0, 5])
+    files = os.listdir(tmp_path / "database.parts")
+    assert len([file for file in files if file.startswith("part-")]) == (4 if partition_by == ["Category"] else 7)
+    # the facts appended to an existing partition are in a segment of it
+    assert len([file for file in files if file.startswith("segment-")]) == (1 if partition_by == ["Category"] else 0)
+    assert "manifest.json" in files
+
+    # an existing database keeps its partitioning
+    assert open_fact_store(str(tmp_path / "database.parts")).partition_by == partition_by
+
+def test_partitioned_appends_do_not_rewrite_partitions(tmp_path):
+    store = open_fact_store(str(tmp_path / "database.parts"), max_segments=2)
+    store.save(FACTS.iloc[:3])
+    work_partition_time = os.stat(tmp_path / "database.parts" / "part-00000.arrow").st_mtime_ns
+    for i in range(3, 6):
+        store.append(FACTS.iloc[i:i + 1]) # Health, then Work twice
+    assert os.stat(tmp_path / "database.parts" / "part-00000.arrow").st_mtime_ns == work_partition_time
+    assert store.load()["Key"].tolist() == FACTS["Key"].iloc[:6].tolist()
+    assert sorted(store.take([4, 5])["Key"].tolist()) == ["idea", "to do"]
+
+    # the segments of a partition are merged into a new file every `max_segments` appends, and the files merged are
+    # deleted on the next merge
+    store.append(FACTS.iloc[:1])
+    assert sorted(os.listdir(tmp_path / "database.parts")) == ["manifest.json", "part-00000.arrow", "part-00001.arrow", "part-00002.arrow",
+                                                             "segment-000001.arrow", "segment-000002.arrow", "segment-000003.arrow"]
+    for i in range(3):
+        store.append(FACTS.iloc[:1])
+    assert sorted(os.listdir(tmp_path / "database.parts")) == ["manifest.json", "part-00001.arrow", "part-00002.arrow",
+                                                             "segment-000003.arrow", "segment-000004.arrow", "segment-000005.arrow",
+                                                             "segment-000006.arrow"]
+    reopened = open_fact_store(str(tmp_path / "database.parts"))
+    assert reopened.count() == 10 and reopened.load()["Key"].tolist() == FACTS["Key"].iloc[:6].tolist() + ["email"] * 4
+
+def test_partition_index():
+    index = PartitionIndex.from_dataframe(FACTS.iloc[:5])
+    index.add(FACTS.iloc[5:])
+    assert index.positions(["WORK"]).tolist() == [0, 2, 4, 5]
+    assert index.positions(["work", "home"], ["note", "address"]).tolist() == [5, 6]
+    assert index.positions().tolist() == list(range(len(FACTS)))
+
+def test_engine_filters_by_partition(tmp_path):
+    database_file_path = str(tmp_path / "database.csv")
+    open_fact_store(database_file_path).save(FACTS)
+    client = FakeCompletionClient(responses={"Input: new idea": '("work", "Note", "", "idea", "robots")'})
+    engine = BraindumpEngine(database_file_path=database_file_path, categories_file_path=str(tmp_path / "categories.csv"), gpt_client=client)
+
+    assert engine._database_filtered_by(["Work"], ["note", "Email"])["Value"].tolist() == ["jp@example.com", "electric cars"]
+    engine.extract_facts("new idea")
+    engine.commit()
+    assert engine._database_filtered_by(["Work"], ["note"])["Value"].tolist() == ["electric cars", "robots"]
+    assert engine._database_filtered_by(["Work"], people=["hr"])["Value"].tolist() == ["555-555-5555"]
+
+def test_unsupported_format():
+    with pytest.raises(ValueError):
+        open_fact_store("database.xlsx")
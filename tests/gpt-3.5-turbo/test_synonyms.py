@@ -0,0 +1,97 @@
+import pytest
+import os
+import time
+
+import sys
+sys.path.append('../../src/gpt-3.5-turbo')
+import pandas as pd
+from engine import BraindumpEngine, BraindumpPostprocessor
+from fakes import FakeCompletionClient
+from storage import open_fact_store
+from synonyms import RateLimiter, SynonymTable, vocabulary_of
+
+FACTS = pd.DataFrame([("Health", "Contact", "Jen", "pediatrician", "Dr. Smith"),
+                      ("Shopping", "List", "", "coffee", "buy espresso beans for the office"),
+                      ("Work", "Note", "Bob", "quarterly report", "due on Friday")],
+                     columns=["Category", "Type", "People", "Key", "Value"])
+
+def create_engine(tmp_path, client, **options):
+    return BraindumpEngine(database_file_path=str(tmp_path / "database.csv"), categories_file_path=str(tmp_path / "categories.csv"),
+                           gpt_client=client, **options)
+
+############################################################################################################
+# Tests
+############################################################################################################
+def test_vocabulary():
+    assert vocabulary_of(FACTS) == {"jen", "pediatrician", "dr. smith", "smith", "coffee", "buy", "espresso",
+                                    "beans", "office", "bob", "quarterly report", "quarterly", "report", "due on friday",
+                                    "due", "friday"}
+
+def test_synonyms_from_result():
+    result = '- Coffee: java; espresso\nunknown: thing\n"jen": jennifer, jenny.\nquarterly report'
+    assert BraindumpPostprocessor().extract_synonyms_from_result(result, ["coffee", "jen", "quarterly report"]) == \
+           {"coffee": ["java", "espresso"], "jen": ["jennifer", "jenny"]}
+
+def test_rate_limiter():
+    rate_limiter = RateLimiter(calls_per_minute=600)
+    start = time.monotonic()
+    for i in range(3):
+        rate_limiter.wait()
+    assert time.monotonic() - start >= 0.19
+
+def test_queries_use_precomputed_synonyms(tmp_path):
+    open_fact_store(str(tmp_path / "database.csv")).save(FACTS)
+    client = FakeCompletionClient()
+    engine = create_engine(tmp_path, client)
+
+    assert engine.precompute_synonyms(batch_size=5, calls_per_minute=0) == len(vocabulary_of(FACTS))
+    assert client.calls == 4
+    assert os.path.exists(tmp_path / "database.synonyms.json")
+
+    # only the terms of the query are asked to the model, as their synonyms are known
+    client.calls = 0
+    results = engine.query("coffee for pediatrician")
+    assert client.calls == 1
+    assert results["Key"].tolist() == ["pediatrician", "coffee"]
+    assert engine.synonym_statistics()["hit_rate"] == 1.0
+
+    # unknown terms are still augmented by the model
+    engine.query("robots")
+    assert client.calls == 3
+
+    # the table is saved, and a later run only asks for the new vocabulary
+    engine = create_engine(tmp_path, client, dedupe_policy="keep")
+    assert engine.synonym_statistics()["covered_facts"] == len(FACTS)
+    engine._commit_facts([("Work", "Note", "", "idea", "robots"), ("Work", "Note", "", "coffee", "espresso")])
+    client.calls = 0
+    assert engine.precompute_synonyms() == 2
+    assert client.calls == 1
+    assert engine._synonyms.get("robots") == ["robotss", "robots item"]
+    assert engine.precompute_synonyms() == 0
+    assert client.calls == 1
+
+def test_new_facts_of_partitioned_databases(tmp_path):
+    database_file_path = str(tmp_path / "database.parts")
+    open_fact_store(database_file_path).save(FACTS)
+    client = FakeCompletionClient()
+    engine = BraindumpEngine(database_file_path=database_file_path, categories_file_path=str(tmp_path / "categories.csv"), gpt_client=client)
+    engine.precompute_synonyms(calls_per_minute=0)
+
+    # the new fact is scanned with its partition, before facts at lower positions
+    engine = BraindumpEngine(database_file_path=database_file_path, categories_file_path=str(tmp_path / "categories.csv"), gpt_client=client)
+    engine._commit_facts([("Health", "Note", "aunt", "zoo", "elephant")])
+    assert engine._database is None
+    assert engine.precompute_synonyms(calls_per_minute=0) == 3
+    assert engine._synonyms.get("elephant") is not None and engine._synonyms.get("aunt") is not None
+
+def test_synonyms_are_precomputed_after_commits(tmp_path):
+    client = FakeCompletionClient(responses={"Input: new idea": '("Work", "Note", "", "idea", "robots")',
+                                             "- idea\n- robots": "idea: thought\nrobots: machines"})
+    engine = create_engine(tmp_path, client, synonym_precomputation=True)
+    engine.extract_facts("new idea")
+    engine.commit()
+    engine._synonym_executor.shutdown(wait=True)
+
+    table = SynonymTable.load(str(tmp_path / "database.synonyms.json"))
+    assert table.covered_facts == 1
+    assert table.get("Robots") == ["machines"] and table.get("idea") == ["thought"]
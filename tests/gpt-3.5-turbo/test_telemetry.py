@@ -0,0 +1,82 @@
+import pytest
+
+import sys
+sys.path.append('../../src/gpt-3.5-turbo')
+from telemetry import UsageRecorder, Tracer, InMemorySpanExporter
+
+############################################################################################################
+# Tests
+############################################################################################################
+def test_calls_are_rolled_up_per_operation_and_session():
+    usage = UsageRecorder()
+    with usage.labels(session="alice"):
+        with usage.labels(operation="extract_facts"):
+            usage.record_call("gpt-3.5-turbo", prompt_tokens=700, completion_tokens=30, seconds=0.8)
+        with usage.labels(operation="query"):
+            usage.record_call("gpt-3.5-turbo", prompt_tokens=20, completion_tokens=5, seconds=0.3, retries=1)
+            usage.record_call("gpt-3.5-turbo", prompt_tokens=20, completion_tokens=5, seconds=0.0, cache_hit=True)
+
+    snapshot = usage.snapshot()
+    operations = {o["operation"]: o for o in snapshot["operations"]}
+    assert operations["extract_facts"]["counters"]["prompt_tokens"] == 700
+    assert operations["query"]["counters"]["calls"] == 2
+    assert operations["query"]["counters"]["cache_hits"] == 1
+    assert operations["query"]["counters"]["retries"] == 1
+    assert operations["query"]["latency_seconds"]["count"] == 2
+    assert snapshot["sessions"]["alice"]["completion_tokens"] == 40
+
+def test_errors_are_recorded():
+    usage = UsageRecorder()
+    with pytest.raises(RuntimeError):
+        with usage.timed_call("gpt-3.5-turbo"):
+            raise RuntimeError("API down")
+
+    assert usage.snapshot()["sessions"]["default"]["errors"] == 1
+
+def test_latency_percentile_ignores_cache_hits():
+    usage = UsageRecorder()
+    for seconds in [0.1, 0.2, 0.3, 0.4, 2.0]:
+        usage.record_call("gpt-3.5-turbo", seconds=seconds)
+    usage.record_call("gpt-3.5-turbo", seconds=0.0, cache_hit=True)
+
+    assert usage.latency_percentile("gpt-3.5-turbo", 50) == 0.3
+    assert usage.latency_percentile("gpt-3.5-turbo", 95) == 2.0
+    assert usage.latency_percentile("gpt-4", 95) is None
+
+def test_prometheus_export():
+    usage = UsageRecorder()
+    with usage.labels(operation="query"):
+        usage.record_call("gpt-3.5-turbo", prompt_tokens=20, completion_tokens=5, seconds=0.3)
+
+    text = usage.to_prometheus()
+    assert 'braindump_llm_calls_total{operation="query",model="gpt-3.5-turbo"} 1' in text
+    assert 'braindump_llm_latency_seconds_bucket{operation="query",model="gpt-3.5-turbo",le="0.5"} 1' in text
+    assert 'braindump_llm_latency_seconds_bucket{operation="query",model="gpt-3.5-turbo",le="0.25"} 0' in text
+
+def test_spans_are_nested_and_exported():
+    tracer = Tracer()
+    exporter = InMemorySpanExporter()
+    tracer.add_exporter(exporter)
+
+    with tracer.span("query") as span:
+        span.set_attribute("terms", 3)
+        with tracer.span("llm_call"):
+            pass
+        with tracer.span("search"):
+            pass
+
+    assert [s.path() for s in exporter.spans] == ["query/llm_call", "query/search", "query"]
+    assert exporter.spans[-1].attributes == {"terms": 3}
+    assert exporter.summary()["query"]["count"] == 1
+
+def test_failed_spans_record_the_error():
+    tracer = Tracer([InMemorySpanExporter()])
+    with pytest.raises(ValueError):
+        with tracer.span("parse"):
+            raise ValueError("bad output")
+
+    assert "bad output" in tracer.exporters[0].spans[0].error
+
+def test_spans_are_not_created_without_exporters():
+    with Tracer().span("query") as span:
+        assert span is None